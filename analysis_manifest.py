@@ -0,0 +1,213 @@
+import os
+import json
+import hashlib
+
+
+MANIFEST_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def fast_hash(filename):
+    """
+    Compute a fast content hash of a file from its size and its first and last megabyte.
+
+    Parameters:
+        filename (str): The path to the file.
+
+    Returns:
+        str: Hexadecimal BLAKE2b digest.
+    """
+    size = os.path.getsize(filename)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+
+    with open(filename, 'rb') as f:
+        digest.update(f.read(HASH_BLOCK_SIZE))
+        if size > 2 * HASH_BLOCK_SIZE:
+            f.seek(-HASH_BLOCK_SIZE, os.SEEK_END)
+            digest.update(f.read(HASH_BLOCK_SIZE))
+        elif size > HASH_BLOCK_SIZE:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def hash_models(model_paths):
+    """
+    Compute a full content hash of every model file.
+
+    Parameters:
+        model_paths (iterable): The paths to the model graph files.
+
+    Returns:
+        dict: A dictionary mapping each model path to its hexadecimal BLAKE2b digest, or None if the file is missing.
+    """
+    model_hashes = {}
+    for model_path in sorted(set(model_paths)):
+        if not os.path.isfile(model_path):
+            model_hashes[model_path] = None
+            continue
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(model_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        model_hashes[model_path] = digest.hexdigest()
+
+    return model_hashes
+
+
+def feature_fingerprints(feature_models, model_hashes):
+    """
+    Combine the hashes of the models each feature depends on into one fingerprint per feature.
+
+    Parameters:
+        feature_models (dict): A dictionary mapping feature names to the model paths they depend on.
+        model_hashes (dict): A dictionary mapping model paths to their hashes.
+
+    Returns:
+        dict: A dictionary mapping feature names to fingerprints ('' for features that use no model).
+    """
+    return {feature: ':'.join(str(model_hashes.get(model_path)) for model_path in model_paths)
+            for feature, model_paths in feature_models.items()}
+
+
+def new_manifest():
+    """
+    Create an empty analysis manifest.
+
+    Returns:
+        dict: A manifest with no models and no tracks.
+    """
+    return {'version': MANIFEST_VERSION, 'models': {}, 'tracks': {}}
+
+
+def load_manifest(filename):
+    """
+    Load the analysis manifest, or return an empty one if it does not exist or is from another version.
+
+    Parameters:
+        filename (str): The path to the manifest JSON file.
+
+    Returns:
+        dict: The manifest, with 'models' and 'tracks' entries.
+    """
+    if not os.path.isfile(filename):
+        return new_manifest()
+
+    with open(filename, 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return new_manifest()
+
+    return manifest
+
+
+def save_manifest(manifest, filename):
+    """
+    Atomically write the analysis manifest to disk.
+
+    Parameters:
+        manifest (dict): The manifest to write.
+        filename (str): The path to the manifest JSON file.
+
+    Returns:
+        None
+    """
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_filename, filename)
+
+
+def plan_analysis(audio_files, manifest, fingerprints):
+    """
+    Work out which features of which tracks have to be (re)computed, and which tracks were deleted.
+
+    A track whose size and modification time match the manifest is trusted without reading it; otherwise its
+    fast hash decides whether the content actually changed. Unchanged tracks only recompute the features whose
+    model fingerprint changed.
+
+    Parameters:
+        audio_files (list): The paths of the audio files currently in the collection.
+        manifest (dict): The manifest from the previous run (updated in place with fresh file stats).
+        fingerprints (dict): A dictionary mapping feature names to their current fingerprints.
+
+    Returns:
+        tuple: A dictionary mapping each file that needs work to the set of features to compute,
+            and a list of the tracks in the manifest that no longer exist.
+    """
+    tracks = manifest['tracks']
+    todo = {}
+
+    for filename in audio_files:
+        stat = os.stat(filename)
+        entry = tracks.get(filename)
+
+        if entry is None:
+            todo[filename] = set(fingerprints)
+            continue
+
+        if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            content_hash = fast_hash(filename)
+            if content_hash != entry['hash']:
+                todo[filename] = set(fingerprints)
+                continue
+
+            # touched but not modified, so remember the new stats to skip hashing next time
+            entry['size'] = stat.st_size
+            entry['mtime'] = stat.st_mtime
+
+        stale_features = {feature for feature, fingerprint in fingerprints.items()
+                          if entry['features'].get(feature) != fingerprint}
+        if stale_features:
+            todo[filename] = stale_features
+
+    current_files = set(audio_files)
+    removed = [filename for filename in tracks if filename not in current_files]
+
+    return todo, removed
+
+
+def record_track(manifest, filename, fingerprints, computed_features, content_hash=None):
+    """
+    Record in the manifest that a track was analyzed with the given features.
+
+    Parameters:
+        manifest (dict): The manifest to update in place.
+        filename (str): The path to the audio file.
+        fingerprints (dict): A dictionary mapping feature names to their current fingerprints.
+        computed_features (iterable): Names of the features that were successfully computed for the track.
+        content_hash (str): The fast hash of the file, or None to compute it.
+
+    Returns:
+        None
+    """
+    stat = os.stat(filename)
+    entry = manifest['tracks'].get(filename)
+
+    if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+        entry = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': content_hash or fast_hash(filename),
+            'features': {},
+        }
+        manifest['tracks'][filename] = entry
+
+    for feature in computed_features:
+        entry['features'][feature] = fingerprints[feature]
+
+
+def forget_track(manifest, filename):
+    """
+    Remove a deleted track from the manifest.
+
+    Parameters:
+        manifest (dict): The manifest to update in place.
+        filename (str): The path to the audio file.
+
+    Returns:
+        None
+    """
+    manifest['tracks'].pop(filename, None)
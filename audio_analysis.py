@@ -1,6 +1,161 @@
+import essentia
 import essentia.standard as es
+import essentia.streaming as ess
 import numpy as np
+import threading
+from functools import partial
+import tempfile
+import wave
 import os
+import json
+import fcntl
+import hashlib
+import analysis_manifest as am
+import audio_cache as ac
+import instrumentation as im
+
+
+DISCOGS_EFFNET_GRAPH = 'models/discogs-effnet-bs64-1.pb'
+MUSICNN_GRAPH = 'models/msd-musicnn-1.pb'
+GENRE_DISCOGS400_GRAPH = 'models/genre_discogs400-discogs-effnet-1.pb'
+VOICE_INSTRUMENTAL_GRAPH = 'models/voice_instrumental-discogs-effnet-1.pb'
+DANCEABILITY_GRAPH = 'models/danceability-discogs-effnet-1.pb'
+EMOMUSIC_GRAPH = 'models/emomusic-msd-musicnn-2.pb'
+
+# embedding models applied to 16 kHz mono audio: name -> (algorithm, graph, input node, output node)
+EMBEDDING_MODELS = {
+    'discogs_embeddings': ('TensorflowPredictEffnetDiscogs', DISCOGS_EFFNET_GRAPH, None, 'PartitionedCall:1'),
+    'musiCNN_embeddings': ('TensorflowPredictMusiCNN', MUSICNN_GRAPH, None, 'model/dense/BiasAdd'),
+}
+
+# classifier heads applied to embeddings: name -> (embeddings, graph, input node, output node)
+CLASSIFIER_HEADS = {
+    'music_styles': ('discogs_embeddings', GENRE_DISCOGS400_GRAPH, 'serving_default_model_Placeholder', 'PartitionedCall:0'),
+    'voice_or_instrument': ('discogs_embeddings', VOICE_INSTRUMENTAL_GRAPH, None, 'model/Softmax'),
+    'danceability': ('discogs_embeddings', DANCEABILITY_GRAPH, None, 'model/Softmax'),
+    'arousal_and_valence': ('musiCNN_embeddings', EMOMUSIC_GRAPH, None, 'model/Identity'),
+}
+
+# TensorflowPredict2D runs its graph on blocks of this many rows; inputs are zero-padded to whole blocks so that
+# every frame goes through the same computation whether a track is predicted alone or batched with others
+HEAD_BATCH_ROWS = 64
+
+SIGNAL_FEATURES = ('tempo', 'key', 'loudness')
+
+# the decoded versions of a track (see TrackAudio), which are the sources of the feature graph
+AUDIO_REPRESENTATIONS = ('stereo', 'mono', 'mono_16k')
+
+# the feature graph: every feature with the audio representations or features it is computed from, listed in
+# the order they are run (loudness first, so that mono can be mixed down from its stereo signal)
+FEATURE_INPUTS = {
+    'loudness': ('stereo',),
+    'tempo': ('mono',),
+    'key': ('mono',),
+    **{name: ('mono_16k',) for name in EMBEDDING_MODELS},
+    **{head: (source,) for head, (source, _, _, _) in CLASSIFIER_HEADS.items()},
+}
+
+# the model graphs every stored feature depends on (signal processing features need none)
+FEATURE_MODELS = {
+    **{feature: [] for feature in SIGNAL_FEATURES},
+    **{name: [graph] for name, (_, graph, _, _) in EMBEDDING_MODELS.items()},
+    **{head: [EMBEDDING_MODELS[source][1], graph] for head, (source, graph, _, _) in CLASSIFIER_HEADS.items()},
+}
+
+KEY_PROFILES = ('temperley', 'krumhansl', 'edma')
+
+# the settings KeyExtractor uses internally, so that sharing one HPCP chain reproduces its results
+KEY_FRAME_SIZE = 4096
+KEY_HOP_SIZE = 4096
+KEY_SPECTRAL_PEAKS_PARAMS = dict(orderBy='magnitude', magnitudeThreshold=1e-4, maxPeaks=60,
+                                 minFrequency=25., maxFrequency=3500., sampleRate=44100.)
+KEY_SPECTRAL_WHITENING_PARAMS = dict(maxFrequency=3500., sampleRate=44100.)
+KEY_HPCP_PARAMS = dict(size=12, harmonics=4, bandPreset=False, nonLinear=False, normalized='none', windowSize=1.,
+                       weightType='cosine', minFrequency=25., maxFrequency=3500., referenceFrequency=440.,
+                       sampleRate=44100.)
+
+# chunked analysis of long recordings: tracks at least this long (in seconds) are decoded in a single streaming
+# pass and their tempo is tracked window by window, so that memory use does not grow with their length
+CHUNKED_MIN_DURATION = 1800
+CHUNK_SECONDS = 120
+TEMPO_CHUNK_OVERLAP_SECONDS = 10
+# RhythmExtractor2013 averages the beat-interval tempo estimates within this many BPM of the most common one
+BPM_ESTIMATE_TOLERANCE = 5
+# EBU R128 gating of the 400 ms momentary loudness blocks, to integrate the loudness of a track analyzed in segments
+LOUDNESS_ABSOLUTE_GATE = -70.
+LOUDNESS_RELATIVE_GATE = -10.
+
+# loaded TensorFlow predictors, shared by every call in this process
+_model_registry = {}
+_model_registry_lock = threading.Lock()
+
+# on-disk cache of decoded audio shared by every TrackAudio in this process (None to always decode)
+_audio_cache = None
+
+
+def get_model(algorithm, graph_filename, input=None, output=None):
+    """
+    Get a TensorFlow predictor from the process-wide model registry, loading its graph on first use.
+
+    Parameters:
+        algorithm (str): Name of the essentia.standard algorithm (e.g. 'TensorflowPredict2D').
+        graph_filename (str): The path to the frozen TensorFlow graph.
+        input (str): Name of the input node, or None to use the algorithm default.
+        output (str): Name of the output node, or None to use the algorithm default.
+
+    Returns:
+        essentia.standard.Algorithm: The configured predictor for the given graph and nodes.
+    """
+    key = (algorithm, graph_filename, input, output)
+    model = _model_registry.get(key)
+    if model is not None:
+        return model
+
+    with _model_registry_lock:
+        # another thread may have loaded the graph while we waited for the lock
+        model = _model_registry.get(key)
+        if model is None:
+            nodes = {name: node for name, node in (('input', input), ('output', output)) if node is not None}
+            model = getattr(es, algorithm)(graphFilename=graph_filename, **nodes)
+            _model_registry[key] = model
+
+    return model
+
+
+def model_paths():
+    """
+    List the model graph files the analysis depends on.
+
+    Returns:
+        list: The paths of every model graph referenced by FEATURE_MODELS.
+    """
+    return sorted({model_path for paths in FEATURE_MODELS.values() for model_path in paths})
+
+
+def clear_models():
+    """
+    Drop every predictor held by the model registry so that the graphs are reloaded on next use.
+
+    Returns:
+        None
+    """
+    with _model_registry_lock:
+        _model_registry.clear()
+
+
+def configure_audio_cache(cache_dir, max_bytes=ac.DEFAULT_MAX_BYTES):
+    """
+    Make every TrackAudio in this process read and store its 16 kHz mono signal in an on-disk cache.
+
+    Parameters:
+        cache_dir (str): The cache directory, or None to disable the cache.
+        max_bytes (int): The size cap of the cache, beyond which the least recently used entries are evicted.
+
+    Returns:
+        None
+    """
+    global _audio_cache
+    _audio_cache = ac.AudioCache(cache_dir, max_bytes) if cache_dir else None
 
 
 def get_tempo(mono_audio):
@@ -22,31 +177,54 @@ def get_tempo(mono_audio):
         return None
 
 
-def get_key(mono_audio):
+def get_key(mono_audio, profiles=KEY_PROFILES):
     """
     Determine the key and scale of the input mono audio using different key extraction profiles.
 
+    The HPCP chromagram is extracted once and then matched against every profile, so additional profiles
+    cost almost nothing.
+
     Parameters:
         mono_audio (numpy.ndarray): Mono audio data.
+        profiles (iterable): Names of the key profiles to evaluate.
 
     Returns:
         dict: A dictionary containing key and scale information for different key extraction profiles.
     """
-    keys_and_scales = {'temperley': None,
-                       'krumhansl': None,
-                       'edma': None}
     try:
-        for profile in keys_and_scales:
-            key, scale, _ = es.KeyExtractor(profileType=profile)(mono_audio)
-            keys_and_scales[profile] = [key, scale]
-
-        return keys_and_scales
+        return get_key_from_hpcp(get_hpcp(mono_audio), profiles)
     
     except Exception as e:
         print(f"Error in get_key: {e}")
         return None
 
 
+def get_hpcp(mono_audio):
+    """
+    Extract the HPCP chromagram of the input mono audio with the settings KeyExtractor uses.
+
+    Parameters:
+        mono_audio (numpy.ndarray): Mono audio data.
+
+    Returns:
+        numpy.ndarray: HPCP chromagram, one 12-bin frame per row.
+    """
+    windowing = es.Windowing(type='hann', size=KEY_FRAME_SIZE)
+    spectrum = es.Spectrum(size=KEY_FRAME_SIZE)
+    spectral_peaks = es.SpectralPeaks(**KEY_SPECTRAL_PEAKS_PARAMS)
+    spectral_whitening = es.SpectralWhitening(**KEY_SPECTRAL_WHITENING_PARAMS)
+    hpcp = es.HPCP(**KEY_HPCP_PARAMS)
+
+    hpcp_frames = []
+    for frame in es.FrameGenerator(mono_audio, frameSize=KEY_FRAME_SIZE, hopSize=KEY_HOP_SIZE):
+        frame_spectrum = spectrum(windowing(frame))
+        frequencies, magnitudes = spectral_peaks(frame_spectrum)
+        whitened_magnitudes = spectral_whitening(frame_spectrum, frequencies, magnitudes)
+        hpcp_frames.append(hpcp(frequencies, whitened_magnitudes))
+
+    return np.array(hpcp_frames, dtype=np.float32).reshape(len(hpcp_frames), KEY_HPCP_PARAMS['size'])
+
+
 def get_loudness(stereo_audio):
     """
     Calculate the integrated loudness of stereo audio.
@@ -67,34 +245,245 @@ def get_loudness(stereo_audio):
         return None
 
 
-def get_embeddings(mono_audio):
+def connect_hpcp_chain(mono_output, pool):
     """
-    Generate embeddings for audio samples using two different models.
+    Connect a streaming mono signal to the HPCP chain KeyExtractor uses, storing one HPCP frame per hop in the pool.
 
     Parameters:
-        mono_audio (numpy.ndarray): Mono audio data.
+        mono_output (essentia.streaming output): The streaming mono audio source.
+        pool (essentia.Pool): The pool that receives the frames under 'hpcp'.
 
     Returns:
-        tuple: A tuple containing Discogs embeddings and MusiCNN embeddings.
+        None
+    """
+    frame_cutter = ess.FrameCutter(frameSize=KEY_FRAME_SIZE, hopSize=KEY_HOP_SIZE)
+    windowing = ess.Windowing(type='hann', size=KEY_FRAME_SIZE)
+    spectrum = ess.Spectrum(size=KEY_FRAME_SIZE)
+    spectral_peaks = ess.SpectralPeaks(**KEY_SPECTRAL_PEAKS_PARAMS)
+    spectral_whitening = ess.SpectralWhitening(**KEY_SPECTRAL_WHITENING_PARAMS)
+    hpcp = ess.HPCP(**KEY_HPCP_PARAMS)
+
+    mono_output >> frame_cutter.signal
+    frame_cutter.frame >> windowing.frame
+    windowing.frame >> spectrum.frame
+    spectrum.spectrum >> spectral_peaks.spectrum
+    spectrum.spectrum >> spectral_whitening.spectrum
+    spectral_peaks.magnitudes >> spectral_whitening.magnitudes
+    spectral_peaks.frequencies >> spectral_whitening.frequencies
+    spectral_whitening.magnitudes >> hpcp.magnitudes
+    spectral_peaks.frequencies >> hpcp.frequencies
+    hpcp.hpcp >> (pool, 'hpcp')
+
+
+def get_key_from_hpcp(hpcp_frames, profiles=KEY_PROFILES):
+    """
+    Determine the key and scale for several key profiles from the same HPCP frames.
+
+    Parameters:
+        hpcp_frames (numpy.ndarray): HPCP chromagram, one 12-bin frame per row.
+        profiles (iterable): Names of the key profiles to evaluate.
+
+    Returns:
+        dict: A dictionary containing key and scale information for each key profile.
+    """
+    keys_and_scales = {}
+    for profile in profiles:
+        pool = essentia.Pool()
+        hpcp_input = ess.VectorInput(hpcp_frames)
+        key = ess.Key(profileType=profile, pcpSize=12, usePolyphony=False, useThreeChords=False)
+
+        hpcp_input.data >> key.pcp
+        key.key >> (pool, 'key')
+        key.scale >> (pool, 'scale')
+        key.strength >> None
+        essentia.run(hpcp_input)
+
+        keys_and_scales[profile] = [pool['key'], pool['scale']]
+
+    return keys_and_scales
+
+
+def get_signal_features(filename):
     """
-    discogs_embeddings = None
-    musiCNN_embeddings = None
+    Compute tempo, key and loudness in a single streaming pass over an audio file.
 
+    The file is decoded once and mixed down to mono once; the stereo stream feeds the EBU R128 loudness meter
+    while the mono stream feeds the HPCP chain that every key profile shares and is spooled to a 16-bit WAV
+    file. RhythmExtractor2013 only computes once it has buffered the whole signal, so the tempo is instead
+    estimated window by window from the spool (see get_tempo_chunked). Only the loudness blocks, the HPCP
+    frames and one tempo window are held in memory, whatever the length of the file.
+
+    Parameters:
+        filename (str): The path to the audio file.
+
+    Returns:
+        tuple: A tuple containing the tempo (BPM), the key and scale dictionary and the integrated loudness.
+    """
     try:
-        discogs_model = es.TensorflowPredictEffnetDiscogs(graphFilename="models/discogs-effnet-bs64-1.pb", output="PartitionedCall:1")
-        discogs_embeddings = discogs_model(mono_audio)
+        with tempfile.TemporaryDirectory(prefix='audio-spool-') as spool_dir:
+            pool = essentia.Pool()
+            sr = get_sample_rate(filename)
+            mono_path = os.path.join(spool_dir, 'mono.wav')
+            loader = ess.AudioLoader(filename=filename)
+            mono_mixer = ess.MonoMixer()
+            loudness_meter = ess.LoudnessEBUR128()
+
+            loader.audio >> loudness_meter.signal
+            loader.audio >> mono_mixer.audio
+            loader.numberChannels >> mono_mixer.numberChannels
+            for output in (loader.sampleRate, loader.md5, loader.bit_rate, loader.codec):
+                output >> None
+
+            mono_mixer.audio >> ess.MonoWriter(filename=mono_path, format='wav', sampleRate=sr).audio
+
+            loudness_meter.integratedLoudness >> (pool, 'loudness')
+            for output in (loudness_meter.momentaryLoudness, loudness_meter.shortTermLoudness,
+                           loudness_meter.loudnessRange):
+                output >> None
+
+            connect_hpcp_chain(mono_mixer.audio, pool)
+            essentia.run(loader)
+
+            tempo = get_tempo_chunked(mono_path, sr)
+
+        return tempo, get_key_from_hpcp(pool['hpcp']), float(pool['loudness'])
+
     except Exception as e:
-        print(f"Error in get_discogs_embeddings: {e}")
+        print(f"Error in get_signal_features: {e}")
+        return None, None, None
+
 
+def extract_embeddings(name, mono_audio):
+    """
+    Generate frame embeddings for audio samples with one of the EMBEDDING_MODELS.
+
+    Parameters:
+        name (str): The embedding model name (e.g. 'discogs_embeddings').
+        mono_audio (numpy.ndarray): Mono audio data sampled at 16 kHz.
+
+    Returns:
+        numpy.ndarray: Embeddings, one row per frame.
+    """
     try:
-        musiCNN_model = es.TensorflowPredictMusiCNN(graphFilename="models/msd-musicnn-1.pb", output="model/dense/BiasAdd")
-        musiCNN_embeddings = musiCNN_model(mono_audio)
+        algorithm, graph_filename, input, output = EMBEDDING_MODELS[name]
+        return get_model(algorithm, graph_filename, input=input, output=output)(mono_audio)
+
     except Exception as e:
-        print(f"Error in get_musiCNN_embeddings: {e}")
+        print(f"Error in extract_embeddings ({name}): {e}")
+        return None
+
+
+def get_discogs_embeddings(mono_audio):
+    """
+    Generate Discogs-EffNet embeddings for audio samples.
+
+    Parameters:
+        mono_audio (numpy.ndarray): Mono audio data sampled at 16 kHz.
+
+    Returns:
+        numpy.ndarray: Discogs embeddings, one row per frame.
+    """
+    return extract_embeddings('discogs_embeddings', mono_audio)
+
+
+def get_musiCNN_embeddings(mono_audio):
+    """
+    Generate MusiCNN embeddings for audio samples.
+
+    Parameters:
+        mono_audio (numpy.ndarray): Mono audio data sampled at 16 kHz.
+
+    Returns:
+        numpy.ndarray: MusiCNN embeddings, one row per frame.
+    """
+    return extract_embeddings('musiCNN_embeddings', mono_audio)
+
+
+def get_embeddings(mono_audio):
+    """
+    Generate embeddings for audio samples using two different models.
+
+    Parameters:
+        mono_audio (numpy.ndarray): Mono audio data.
+
+    Returns:
+        tuple: A tuple containing Discogs embeddings and MusiCNN embeddings.
+    """
+    discogs_embeddings = get_discogs_embeddings(mono_audio)
+    musiCNN_embeddings = get_musiCNN_embeddings(mono_audio)
 
     return discogs_embeddings, musiCNN_embeddings
 
 
+def pad_to_head_batches(embeddings):
+    """
+    Copy embeddings into a contiguous float32 buffer zero-padded to a whole number of HEAD_BATCH_ROWS blocks.
+
+    Parameters:
+        embeddings (numpy.ndarray): Embeddings for audio samples, one row per frame.
+
+    Returns:
+        numpy.ndarray: The padded buffer.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    padded_rows = -(-len(embeddings) // HEAD_BATCH_ROWS) * HEAD_BATCH_ROWS
+    batch = np.zeros((padded_rows, embeddings.shape[1]), dtype=np.float32)
+    batch[:len(embeddings)] = embeddings
+
+    return batch
+
+
+def predict_head(head, batch):
+    """
+    Run one classifier head over a padded embedding buffer.
+
+    Parameters:
+        head (str): The name of the head in CLASSIFIER_HEADS.
+        batch (numpy.ndarray): Embeddings padded with pad_to_head_batches.
+
+    Returns:
+        numpy.ndarray: Activations, one row per row of the buffer.
+    """
+    _, graph_filename, input, output = CLASSIFIER_HEADS[head]
+
+    return get_model("TensorflowPredict2D", graph_filename, input=input, output=output)(batch)
+
+
+def run_heads(embeddings, heads):
+    """
+    Run several classifier heads back-to-back over the same embedding matrix.
+
+    The embeddings are copied once into a padded float32 buffer that every head reads, and each head's
+    graph comes from the model registry, so adding a head costs one more forward pass and nothing else.
+
+    Parameters:
+        embeddings (numpy.ndarray): Embeddings for audio samples, one row per frame.
+        heads (iterable): Names of the CLASSIFIER_HEADS to run; they must all read these embeddings.
+
+    Returns:
+        dict: A dictionary mapping each head to a tuple of its per-frame activations and their mean
+            (both None if the head failed).
+    """
+    results = {}
+    if embeddings is None:
+        print(f"Error in run_heads: no embeddings for {', '.join(heads)}")
+        return {head: (None, None) for head in heads}
+
+    batch = pad_to_head_batches(embeddings)
+
+    for head in heads:
+        try:
+            with im.stage(head):
+                activations = predict_head(head, batch)[:len(embeddings)]
+            results[head] = (activations, np.mean(activations, axis=0))
+
+        except Exception as e:
+            print(f"Error in run_heads ({head}): {e}")
+            results[head] = (None, None)
+
+    return results
+
+
 def get_music_styles(discogs_embeddings):
     """
     Predict the music styles based on Discogs embeddings.
@@ -105,16 +494,9 @@ def get_music_styles(discogs_embeddings):
     Returns:
         numpy.ndarray: Mean predictions for music styles.
     """
-    try:
-        discogs_model = es.TensorflowPredict2D(graphFilename="models/genre_discogs400-discogs-effnet-1.pb", input="serving_default_model_Placeholder", output="PartitionedCall:0")
-        discogs_predictions = discogs_model(discogs_embeddings)
-        discogs_mean_predictions = np.mean(discogs_predictions, axis=0)
+    _, discogs_mean_predictions = run_heads(discogs_embeddings, ['music_styles'])['music_styles']
 
-        return discogs_mean_predictions
-    
-    except Exception as e:
-        print(f"Error in get_music_styles: {e}")
-        return None
+    return discogs_mean_predictions
 
 
 def classify_voice_or_instrument(discogs_embeddings):
@@ -127,16 +509,9 @@ def classify_voice_or_instrument(discogs_embeddings):
     Returns:
         numpy.ndarray: Mean predictions for voice or instrumental classification.
     """
-    try:
-        discogs_model = es.TensorflowPredict2D(graphFilename="models/voice_instrumental-discogs-effnet-1.pb", output="model/Softmax")
-        discogs_predictions = discogs_model(discogs_embeddings)
-        discogs_mean_predictions = np.mean(discogs_predictions, axis=0)
+    _, discogs_mean_predictions = run_heads(discogs_embeddings, ['voice_or_instrument'])['voice_or_instrument']
 
-        return discogs_mean_predictions
-    
-    except Exception as e:
-        print(f"Error in classify_voice_or_instrument: {e}")
-        return None
+    return discogs_mean_predictions
 
  
 def get_danceability(discogs_embeddings):
@@ -149,16 +524,9 @@ def get_danceability(discogs_embeddings):
     Returns:
         numpy.ndarray: Mean danceability predictions.
     """
-    try:
-        discogs_model = es.TensorflowPredict2D(graphFilename="models/danceability-discogs-effnet-1.pb", output="model/Softmax")
-        discogs_predictions = np.array(discogs_model(discogs_embeddings))
-        discogs_mean_predictions = np.mean(discogs_predictions, axis=0)
+    _, discogs_mean_predictions = run_heads(discogs_embeddings, ['danceability'])['danceability']
 
-        return discogs_mean_predictions
-    
-    except Exception as e:
-        print(f"Error in get_danceability: {e}")
-        return None
+    return discogs_mean_predictions
 
 
 def get_arousal_and_valence(musiCNN_embeddings):
@@ -171,16 +539,9 @@ def get_arousal_and_valence(musiCNN_embeddings):
     Returns:
         numpy.ndarray: Mean arousal and valence predictions.
     """
-    try:
-        musiCNN_model = es.TensorflowPredict2D(graphFilename="models/emomusic-msd-musicnn-2.pb", output="model/Identity")
-        musiCNN_predictions = musiCNN_model(musiCNN_embeddings)
-        musiCNN_mean_predictions = np.mean(musiCNN_predictions, axis=0)
+    _, musiCNN_mean_predictions = run_heads(musiCNN_embeddings, ['arousal_and_valence'])['arousal_and_valence']
 
-        return musiCNN_mean_predictions
-    
-    except Exception as e:
-        print(f"Error in get_arousal_and_valence: {e}")
-        return None
+    return musiCNN_mean_predictions
 
 
 def load_audio(filename):
@@ -217,6 +578,815 @@ def load_audio(filename):
     return stereo_audio, mono_audio, resampled_mono_audio, sr
 
 
+class TrackAudio:
+    """
+    Decoded representations of a single audio file, each computed the first time an extractor asks for it.
+
+    The native-rate stereo signal is only decoded for loudness. Native-rate mono is mixed down from the stereo
+    signal when that is already in memory and decoded straight to mono otherwise, and the 16 kHz mono signal
+    for the models is resampled by the decoder, so no full-rate intermediate is kept for it, or read from the
+    audio cache if one is configured (see configure_audio_cache). Call release() once the last extractor of a
+    representation is done so that it does not stay resident.
+    """
+
+    def __init__(self, filename, mono_16k=None):
+        self.filename = filename
+        self.sr = None
+        self._content_hash = None
+        self._stereo = None
+        self._num_channels = None
+        self._mono = None
+        # already decoded by another process (see pipelined_analysis)
+        self._mono_16k = mono_16k
+
+    @property
+    def stereo(self):
+        """
+        numpy.ndarray: Stereo audio data at the native sample rate (None if decoding failed).
+        """
+        if self._stereo is None:
+            try:
+                with im.stage('decode_stereo'):
+                    self._stereo, self.sr, self._num_channels, _, _, _ = es.AudioLoader(filename=self.filename)()
+            except Exception as e:
+                print(f"Error in loading stereo audio: {e}")
+
+        return self._stereo
+
+    @property
+    def mono(self):
+        """
+        numpy.ndarray: Mono audio data at the native sample rate (None if decoding failed).
+        """
+        if self._mono is None:
+            try:
+                with im.stage('decode_mono'):
+                    if self._stereo is not None:
+                        self._mono = es.MonoMixer()(self._stereo, self._num_channels)
+                    else:
+                        self.sr = es.MetadataReader(filename=self.filename)()[10]
+                        if self.sr > 0:
+                            self._mono = es.MonoLoader(filename=self.filename, sampleRate=self.sr)()
+                        else:
+                            # TagLib cannot read the rate of some files (e.g. ADTS AAC); the decoder reports it
+                            stereo, self.sr, num_channels, _, _, _ = es.AudioLoader(filename=self.filename)()
+                            self._mono = es.MonoMixer()(stereo, num_channels)
+            except Exception as e:
+                print(f"Error in loading mono audio: {e}")
+
+        return self._mono
+
+    @property
+    def mono_16k(self):
+        """
+        numpy.ndarray: Mono audio data resampled to 16 kHz (None if decoding failed).
+        """
+        if self._mono_16k is None and _audio_cache is not None:
+            with im.stage('audio_cache_read'):
+                self._mono_16k = _audio_cache.get(self.content_hash, 'mono_16k')
+
+        if self._mono_16k is None:
+            try:
+                with im.stage('decode_mono_16k'):
+                    self._mono_16k = es.MonoLoader(filename=self.filename, sampleRate=16000, resampleQuality=1)()
+                if _audio_cache is not None:
+                    with im.stage('audio_cache_write'):
+                        _audio_cache.put(self.content_hash, self.filename, 'mono_16k', self._mono_16k)
+            except Exception as e:
+                print(f"Error in loading resampled mono audio: {e}")
+
+        return self._mono_16k
+
+    @property
+    def content_hash(self):
+        """
+        str: The fast hash of the file, the key of its entries in the audio cache.
+        """
+        if self._content_hash is None:
+            self._content_hash = am.fast_hash(self.filename)
+
+        return self._content_hash
+
+    def prefetch(self, *representations):
+        """
+        Decode representations ahead of the extractors that need them, e.g. in another process.
+
+        Parameters:
+            representations (str): Names of the representations to decode ('stereo', 'mono' or 'mono_16k').
+
+        Returns:
+            None
+        """
+        for representation in representations:
+            getattr(self, representation)
+
+    def release(self, *representations):
+        """
+        Drop decoded representations that no remaining extractor needs.
+
+        Parameters:
+            representations (str): Names of the representations to drop ('stereo', 'mono' or 'mono_16k').
+
+        Returns:
+            None
+        """
+        for representation in representations:
+            setattr(self, '_' + representation, None)
+
+
+def load_models():
+    """
+    Load every TensorFlow graph used by the analysis into the model registry up front.
+
+    Returns:
+        None
+    """
+    models = list(EMBEDDING_MODELS.values())
+    models += [("TensorflowPredict2D", graph_filename, input, output)
+               for _, graph_filename, input, output in CLASSIFIER_HEADS.values()]
+
+    for algorithm, graph_filename, input, output in models:
+        try:
+            get_model(algorithm, graph_filename, input=input, output=output)
+        except Exception as e:
+            print(f"Error in load_models ({graph_filename}): {e}")
+
+
+# the function computing each feature of the graph from its inputs; the classifier heads are not in here since
+# they are run over many frames at once (see run_heads and head_batching.HeadBatcher)
+FEATURE_EXTRACTORS = {
+    'loudness': get_loudness,
+    'tempo': get_tempo,
+    'key': get_key,
+    **{name: partial(extract_embeddings, name) for name in EMBEDDING_MODELS},
+}
+
+
+def resolve_features(features):
+    """
+    Resolve the feature graph for a set of requested features.
+
+    Parameters:
+        features (iterable): Names of the requested features (keys of FEATURE_INPUTS).
+
+    Returns:
+        list: Every feature that has to be computed, requested or needed as an input, in running order.
+
+    Raises:
+        ValueError: If a requested feature is not in the graph.
+    """
+    unknown = set(features).difference(FEATURE_INPUTS)
+    if unknown:
+        raise ValueError(f"Unknown features: {', '.join(sorted(unknown))}")
+
+    needed = set()
+    pending = list(features)
+    while pending:
+        feature = pending.pop()
+        if feature not in needed:
+            needed.add(feature)
+            pending.extend(input for input in FEATURE_INPUTS[feature] if input in FEATURE_INPUTS)
+
+    return [feature for feature in FEATURE_INPUTS if feature in needed]
+
+
+def extract_track_features(filename, features=None, streaming_dsp=False, chunked_min_duration=None, audio=None):
+    """
+    Run every part of the analysis of a single audio file except the classifier heads.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        features (iterable): Names of the features to compute (keys of FEATURE_MODELS), or None for all of them;
+            only these and the features they are computed from (see resolve_features) are extracted.
+        streaming_dsp (bool): Whether to compute tempo, key and loudness in one streaming pass over the file
+            (see get_signal_features) instead of on fully loaded signals.
+        chunked_min_duration (float): Duration in seconds from which tracks are analyzed in chunks
+            (see extract_track_features_chunked), or None to always load them fully.
+        audio (TrackAudio): The decoded audio of the file, if some of it was prefetched, or None to decode it here.
+
+    Returns:
+        tuple: A tuple containing the embeddings dictionary and the predictions dictionary for the track,
+            holding only the requested features, and a dictionary mapping each embedding model to a tuple of
+            its embeddings and the requested heads that still have to be run on them.
+    """
+    features = set(FEATURE_MODELS) if features is None else set(features)
+    if chunked_min_duration is not None and get_duration(filename) >= chunked_min_duration:
+        return extract_track_features_chunked(filename, features)
+
+    plan = resolve_features(features)
+    values = {}
+
+    if streaming_dsp and features.intersection(SIGNAL_FEATURES):
+        with im.stage('signal_features'):
+            tempo, key, loudness = get_signal_features(filename)
+        values.update({'tempo': tempo, 'key': key, 'loudness': loudness})
+
+    # decode each version of the audio only when an extractor needs it, and drop it after its last use
+    if audio is None:
+        audio = TrackAudio(filename)
+    extractors = [feature for feature in plan if feature in FEATURE_EXTRACTORS and feature not in values]
+    last_use = {input: i for i, feature in enumerate(extractors)
+                for input in FEATURE_INPUTS[feature] if input in AUDIO_REPRESENTATIONS}
+
+    for i, feature in enumerate(extractors):
+        inputs = [getattr(audio, input) if input in AUDIO_REPRESENTATIONS else values[input]
+                  for input in FEATURE_INPUTS[feature]]
+        with im.stage(feature):
+            values[feature] = FEATURE_EXTRACTORS[feature](*inputs)
+        del inputs
+
+        for representation, last in last_use.items():
+            if last == i:
+                # mono is mixed down from the stereo signal for free while that is still in memory
+                if representation == 'stereo' and last_use.get('mono', -1) > i:
+                    audio.mono
+                audio.release(representation)
+
+    embeddings = {feature: values[feature] for feature in plan if feature in features and feature in EMBEDDING_MODELS}
+    predictions = {feature: values[feature] for feature in plan if feature in features and feature in SIGNAL_FEATURES}
+
+    # the heads of each embedding model are left to the caller, to run together over the same embeddings
+    head_inputs = {}
+    for head in plan:
+        if head in CLASSIFIER_HEADS:
+            source = FEATURE_INPUTS[head][0]
+            head_inputs.setdefault(source, (values[source], []))[1].append(head)
+
+    return embeddings, predictions, head_inputs
+
+
+def analyze_track(filename, features=None, streaming_dsp=False, chunked_min_duration=None):
+    """
+    Run the analysis (signal processing and machine learning features) on a single audio file.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        features (iterable): Names of the features to compute (keys of FEATURE_MODELS), or None for all of them.
+        streaming_dsp (bool): Whether to compute tempo, key and loudness in one streaming pass over the file
+            (see get_signal_features) instead of on fully loaded signals.
+        chunked_min_duration (float): Duration in seconds from which tracks are analyzed in chunks
+            (see extract_track_features_chunked), or None to always load them fully.
+
+    Returns:
+        tuple: A tuple containing the embeddings dictionary and the predictions dictionary for the track,
+            holding only the requested features.
+    """
+    embeddings, predictions, head_inputs = extract_track_features(filename, features, streaming_dsp,
+                                                                  chunked_min_duration)
+    predictions.update(predict_heads(head_inputs))
+
+    return embeddings, predictions
+
+
+def predict_heads(head_inputs):
+    """
+    Run the classifier heads left over by extract_track_features on the embeddings of one track.
+
+    Parameters:
+        head_inputs (dict): A dictionary mapping each embedding model to a tuple of its embeddings and the heads
+            to run on them.
+
+    Returns:
+        dict: A dictionary mapping each head to its mean activations (None if the head failed).
+    """
+    predictions = {}
+
+    # run all requested heads of an embedding model together over the same embeddings
+    for source_embeddings, heads in head_inputs.values():
+        for head, (_, mean_activations) in run_heads(source_embeddings, heads).items():
+            predictions[head] = mean_activations
+
+    return predictions
+
+
+def get_duration(filename):
+    """
+    Read the duration of an audio file from its metadata, without decoding it.
+
+    Parameters:
+        filename (str): The path to the audio file.
+
+    Returns:
+        float: The duration in seconds (0 if it cannot be read).
+    """
+    try:
+        return float(es.MetadataReader(filename=filename)()[8])
+
+    except Exception as e:
+        print(f"Error in get_duration: {e}")
+        return 0.
+
+
+def get_sample_rate(filename):
+    """
+    Get the native sample rate of an audio file.
+
+    The rate is read from the metadata when TagLib can parse them. Otherwise (e.g. ADTS AAC files, for which
+    MetadataReader reports 0) it is taken from the decoder, in a streaming pass that discards the audio.
+
+    Parameters:
+        filename (str): The path to the audio file.
+
+    Returns:
+        float: The sample rate in Hz.
+    """
+    sr = float(es.MetadataReader(filename=filename)()[10])
+    if sr > 0:
+        return sr
+
+    pool = essentia.Pool()
+    loader = ess.AudioLoader(filename=filename)
+    loader.sampleRate >> (pool, 'sample_rate')
+    for output in (loader.audio, loader.numberChannels, loader.md5, loader.bit_rate, loader.codec):
+        output >> None
+    essentia.run(loader)
+
+    return float(pool['sample_rate'])
+
+
+def stream_long_track(filename, spool_dir, features):
+    """
+    Decode a long audio file once, computing every feature that can be accumulated while decoding.
+
+    The stereo stream feeds the EBU R128 loudness meter, the mono stream feeds the HPCP chain and is spooled to
+    a 16-bit WAV file for the windowed tempo estimation, and the 16 kHz stream feeds the streaming versions of
+    the embedding models, which predict one batch of patches at a time. Only the per-frame outputs are kept.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        spool_dir (str): The directory to spool the mono signal to.
+        features (set): Names of the features to compute (keys of FEATURE_MODELS).
+
+    Returns:
+        dict: A dictionary with, when requested, the 'loudness', the 'hpcp' frames, the path and sample rate of
+            the spooled 'mono' signal, and the 'embeddings' of every embedding model (None if its graph failed).
+    """
+    pool = essentia.Pool()
+    sr = get_sample_rate(filename)
+    loader = ess.AudioLoader(filename=filename)
+    mono_mixer = ess.MonoMixer()
+    results = {}
+
+    loader.audio >> mono_mixer.audio
+    loader.numberChannels >> mono_mixer.numberChannels
+    for output in (loader.sampleRate, loader.md5, loader.bit_rate, loader.codec):
+        output >> None
+
+    if 'loudness' in features:
+        loudness_meter = ess.LoudnessEBUR128()
+        loader.audio >> loudness_meter.signal
+        loudness_meter.integratedLoudness >> (pool, 'loudness')
+        for output in (loudness_meter.momentaryLoudness, loudness_meter.shortTermLoudness,
+                       loudness_meter.loudnessRange):
+            output >> None
+
+    if 'key' in features:
+        connect_hpcp_chain(mono_mixer.audio, pool)
+
+    if 'tempo' in features:
+        results['mono'] = os.path.join(spool_dir, 'mono.wav')
+        results['sr'] = sr
+        mono_mixer.audio >> ess.MonoWriter(filename=results['mono'], format='wav', sampleRate=sr).audio
+
+    # the same resampler MonoLoader uses, so the models see exactly what TrackAudio.mono_16k holds
+    sources = [source for source in EMBEDDING_MODELS if source in features]
+    resample = ess.Resample(inputSampleRate=sr, outputSampleRate=16000., quality=1)
+    if sources:
+        mono_mixer.audio >> resample.signal
+    elif not features.intersection(('key', 'tempo')):
+        mono_mixer.audio >> None
+
+    results['embeddings'] = {}
+    for source in sources:
+        algorithm, graph_filename, input, output = EMBEDDING_MODELS[source]
+        nodes = {name: node for name, node in (('input', input), ('output', output)) if node is not None}
+        try:
+            model = getattr(ess, algorithm)(graphFilename=graph_filename, **nodes)
+        except Exception as e:
+            print(f"Error in stream_long_track ({source}): {e}")
+            results['embeddings'][source] = None
+            continue
+
+        resample.signal >> model.signal
+        model.predictions >> (pool, source)
+        results['embeddings'][source] = source
+
+    if sources and all(name is None for name in results['embeddings'].values()):
+        resample.signal >> None
+
+    essentia.run(loader)
+
+    if 'loudness' in features:
+        results['loudness'] = float(pool['loudness'])
+    if 'key' in features:
+        results['hpcp'] = pool['hpcp']
+    for source, name in results['embeddings'].items():
+        if name is not None:
+            results['embeddings'][source] = pool[name] if pool.containsKey(name) else None
+
+    return results
+
+
+def read_wav_window(wav_path, start, count=None):
+    """
+    Read a window of a 16-bit WAV file without loading the rest of it.
+
+    Parameters:
+        wav_path (str): The path to the WAV file.
+        start (int): The first sample of the window.
+        count (int): The number of samples in the window, or None for every sample up to the end of the file.
+
+    Returns:
+        numpy.ndarray: The float32 samples of the window (fewer than `count` at the end of the file), one
+            column per channel if the file has several.
+    """
+    with wave.open(wav_path, 'rb') as wav_file:
+        frames = wav_file.getnframes()
+        channels = wav_file.getnchannels()
+        wav_file.setpos(min(start, frames))
+        samples = np.frombuffer(wav_file.readframes(frames - start if count is None else count), dtype=np.int16)
+
+    samples = samples.astype(np.float32) / 32768
+
+    return samples if channels == 1 else samples.reshape(-1, channels)
+
+
+def bpm_from_intervals(bpm_intervals):
+    """
+    Estimate the tempo from beat intervals the way RhythmExtractor2013 does, so that the intervals of
+    several windows can be pooled into one estimate.
+
+    Parameters:
+        bpm_intervals (numpy.ndarray): Time between consecutive beats, in seconds.
+
+    Returns:
+        float: The mean of the per-interval tempo estimates close to the most common one, in BPM.
+    """
+    estimates = 60. / np.asarray(bpm_intervals, dtype=np.float32)
+    counts, edges = np.histogram(estimates, bins=np.arange(0., estimates.max() + 2.))
+    peak = edges[np.argmax(counts)] + 0.5
+
+    return float(np.mean(estimates[np.abs(estimates - peak) <= BPM_ESTIMATE_TOLERANCE]))
+
+
+def get_tempo_chunked(wav_path, sr):
+    """
+    Estimate the tempo of a spooled mono signal by tracking beats window by window.
+
+    Windows of CHUNK_SECONDS overlap by TEMPO_CHUNK_OVERLAP_SECONDS, and each window only keeps the beats away
+    from its edges, so that the pooled beats cover the track once. A signal that fits in one window gets the
+    tempo RhythmExtractor2013 estimates for it, as get_tempo does.
+
+    Parameters:
+        wav_path (str): The path to the spooled mono signal.
+        sr (float): The sample rate of the signal.
+
+    Returns:
+        float: Estimated tempo in beats per minute (BPM).
+    """
+    try:
+        hop = int(CHUNK_SECONDS * sr)
+        overlap = int(TEMPO_CHUNK_OVERLAP_SECONDS * sr)
+        with wave.open(wav_path, 'rb') as wav_file:
+            length = wav_file.getnframes()
+
+        rhythm_extractor = es.RhythmExtractor2013()
+        if length <= hop + overlap:
+            bpm, _, _, _, _ = rhythm_extractor(read_wav_window(wav_path, 0, length))
+            return float(bpm)
+
+        ticks = []
+        for start in range(0, max(length - overlap, 1), hop):
+            last = start + hop + overlap >= length
+            _, window_ticks, _, _, _ = rhythm_extractor(read_wav_window(wav_path, start, hop + overlap))
+            lower = 0 if start == 0 else overlap / 2 / sr
+            upper = np.inf if last else (hop + overlap / 2) / sr
+            ticks.extend(start / sr + tick for tick in window_ticks if lower <= tick < upper)
+
+        return bpm_from_intervals(np.diff(ticks))
+
+    except Exception as e:
+        print(f"Error in get_tempo_chunked: {e}")
+        return None
+
+
+def integrated_loudness(momentary_loudness):
+    """
+    Integrate the loudness of a signal from its momentary loudness the way LoudnessEBUR128 does, so that the
+    blocks of several segments can be pooled into one measurement.
+
+    Parameters:
+        momentary_loudness (numpy.ndarray): The loudness of every 400 ms block, in LUFS.
+
+    Returns:
+        float: The gated integrated loudness in LUFS (LOUDNESS_ABSOLUTE_GATE if every block is below it).
+    """
+    momentary_loudness = np.asarray(momentary_loudness, dtype=np.float64)
+    energies = 10 ** ((momentary_loudness + 0.691) / 10)
+
+    gated = momentary_loudness > LOUDNESS_ABSOLUTE_GATE
+    if not gated.any():
+        return LOUDNESS_ABSOLUTE_GATE
+    relative_gate = -0.691 + 10 * np.log10(np.mean(energies[gated])) + LOUDNESS_RELATIVE_GATE
+    gated &= momentary_loudness > relative_gate
+
+    return float(-0.691 + 10 * np.log10(np.mean(energies[gated])))
+
+
+def extract_track_features_chunked(filename, features=None):
+    """
+    Run every part of the analysis of a long audio file except the classifier heads, with bounded memory.
+
+    The file is decoded once in a streaming pass (see stream_long_track) that never holds the whole signal,
+    and the tempo is then estimated one window at a time from the spooled mono signal.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        features (iterable): Names of the features to compute (keys of FEATURE_MODELS), or None for all of them.
+
+    Returns:
+        tuple: The same embeddings dictionary, predictions dictionary and head inputs as extract_track_features.
+    """
+    features = set(FEATURE_MODELS) if features is None else set(features)
+    head_sources = {CLASSIFIER_HEADS[head][0] for head in features.intersection(CLASSIFIER_HEADS)}
+    embeddings = {}
+    predictions = {}
+    head_inputs = {}
+
+    with tempfile.TemporaryDirectory(prefix='audio-spool-') as spool_dir:
+        try:
+            with im.stage('stream_long_track'):
+                streamed = stream_long_track(filename, spool_dir, features | head_sources)
+        except Exception as e:
+            print(f"Error in stream_long_track: {e}")
+            streamed = None
+
+        if 'loudness' in features:
+            predictions['loudness'] = streamed['loudness'] if streamed else None
+        if 'key' in features:
+            try:
+                predictions['key'] = get_key_from_hpcp(streamed['hpcp']) if streamed else None
+            except Exception as e:
+                print(f"Error in get_key_from_hpcp: {e}")
+                predictions['key'] = None
+        if 'tempo' in features:
+            with im.stage('tempo'):
+                predictions['tempo'] = get_tempo_chunked(streamed['mono'], streamed['sr']) if streamed else None
+
+    for source in EMBEDDING_MODELS:
+        heads = [head for head in CLASSIFIER_HEADS if head in features and CLASSIFIER_HEADS[head][0] == source]
+        if source not in features and not heads:
+            continue
+
+        source_embeddings = streamed['embeddings'][source] if streamed else None
+        if source in features:
+            embeddings[source] = source_embeddings
+        if heads:
+            head_inputs[source] = (source_embeddings, heads)
+
+    return embeddings, predictions, head_inputs
+
+
+def segment_spool_path(filename, spool_dir):
+    """
+    Get the path, without extension, of the spooled audio of a split track.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        spool_dir (str): The directory the segments of the run share their spools in.
+
+    Returns:
+        str: The path the '.wav', '.json' and '.lock' files of the spool are named after.
+    """
+    name = hashlib.blake2b(os.path.abspath(filename).encode(), digest_size=16).hexdigest()
+
+    return os.path.join(spool_dir, name)
+
+
+def spool_track_audio(filename, spool_dir):
+    """
+    Decode an audio file to a 16-bit stereo WAV spool shared by all of its segments, unless it already is.
+
+    The first segment of the file to start decodes it while holding a lock on the spool, so the others wait
+    for it instead of decoding the file themselves, and then only read their window (see load_segment). The
+    spool is complete once its '.json' file, written last, exists.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        spool_dir (str): The directory the segments of the run share their spools in.
+
+    Returns:
+        dict: The 'path' of the spooled WAV file, its sample rate 'sr' and the number of 'channels' of the file.
+    """
+    base = segment_spool_path(filename, spool_dir)
+    with open(base + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(base + '.json', 'r') as f:
+                return json.load(f)
+        except OSError:
+            pass
+
+        pool = essentia.Pool()
+        sr = get_sample_rate(filename)
+        loader = ess.AudioLoader(filename=filename)
+        loader.audio >> ess.AudioWriter(filename=base + '.wav', format='wav', sampleRate=sr).audio
+        loader.numberChannels >> (pool, 'channels')
+        for output in (loader.sampleRate, loader.md5, loader.bit_rate, loader.codec):
+            output >> None
+        essentia.run(loader)
+
+        spool = {'path': base + '.wav', 'sr': sr, 'channels': int(pool['channels'])}
+        tmp_path = f'{base}.json.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(spool, f)
+        os.replace(tmp_path, base + '.json')
+
+    return spool
+
+
+def remove_segment_spool(filename, spool_dir):
+    """
+    Remove the spooled audio of a split track once none of its segments needs it any more.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        spool_dir (str): The directory the segments of the run share their spools in.
+
+    Returns:
+        None
+    """
+    base = segment_spool_path(filename, spool_dir)
+    for suffix in ('.json', '.wav', '.lock'):
+        try:
+            os.remove(base + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def load_segment(filename, segment, spool_dir=None):
+    """
+    Read one segment of an audio file from its spool, decoding the file into the spool first if no other
+    segment did (see spool_track_audio), so that the file is decoded once however many segments it is split in.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        segment (tuple): The start and end of the segment in seconds (None for the end of the file).
+        spool_dir (str): The directory the segments of the run share their spools in, or None to spool the file
+            for this segment alone.
+
+    Returns:
+        tuple: A tuple containing the stereo audio of the segment, its number of channels and its sample rate.
+    """
+    if spool_dir is None:
+        with tempfile.TemporaryDirectory(prefix='segment-spool-') as spool_dir:
+            return load_segment(filename, segment, spool_dir)
+
+    start, end = segment
+    spool = spool_track_audio(filename, spool_dir)
+    sr = spool['sr']
+    first = int(round(start * sr))
+    count = None if end is None else int(round(end * sr)) - first
+
+    return read_wav_window(spool['path'], first, count), spool['channels'], sr
+
+
+def extract_segment_features(filename, segment, features=None, spool_dir=None):
+    """
+    Analyze one segment of a long audio file, leaving what has to be pooled over the whole file to
+    merge_segment_features, so that the segments of a file can be analyzed in parallel.
+
+    Parameters:
+        filename (str): The path to the audio file.
+        segment (tuple): The start and end of the segment in seconds (None for the end of the file).
+        features (iterable): Names of the features to compute (keys of FEATURE_MODELS), or None for all of them.
+        spool_dir (str): The directory the segments of the run share their decoded audio in (see load_segment),
+            or None.
+
+    Returns:
+        dict: A dictionary with, when requested, the 'momentary_loudness', the 'hpcp' frames and the
+            'beat_intervals' of the segment and the 'embeddings' of every embedding model, or None if the
+            segment could not be decoded.
+    """
+    features = set(FEATURE_MODELS) if features is None else set(features)
+    head_sources = {CLASSIFIER_HEADS[head][0] for head in features.intersection(CLASSIFIER_HEADS)}
+    sources = [source for source in EMBEDDING_MODELS if source in features or source in head_sources]
+
+    try:
+        with im.stage('decode_segment'):
+            stereo_audio, num_channels, sr = load_segment(filename, segment, spool_dir)
+            mono_audio = es.MonoMixer()(stereo_audio, num_channels)
+    except Exception as e:
+        print(f"Error in load_segment: {e}")
+        return None
+
+    partial = {'embeddings': {}}
+    if 'loudness' in features:
+        try:
+            with im.stage('loudness'):
+                partial['momentary_loudness'], _, _, _ = es.LoudnessEBUR128()(stereo_audio)
+        except Exception as e:
+            print(f"Error in get_loudness: {e}")
+            partial['momentary_loudness'] = None
+    del stereo_audio
+
+    if 'key' in features:
+        try:
+            with im.stage('key'):
+                partial['hpcp'] = get_hpcp(mono_audio)
+        except Exception as e:
+            print(f"Error in get_hpcp: {e}")
+            partial['hpcp'] = None
+    if 'tempo' in features:
+        try:
+            with im.stage('tempo'):
+                _, ticks, _, _, _ = es.RhythmExtractor2013()(mono_audio)
+            partial['beat_intervals'] = np.diff(ticks)
+        except Exception as e:
+            print(f"Error in get_tempo: {e}")
+            partial['beat_intervals'] = None
+
+    if sources:
+        with im.stage('resample_segment'):
+            mono_16k = es.Resample(inputSampleRate=sr, outputSampleRate=16000., quality=1)(mono_audio)
+        del mono_audio
+        for source in sources:
+            with im.stage(source):
+                partial['embeddings'][source] = extract_embeddings(source, mono_16k)
+
+    return partial
+
+
+def pool_segment_values(partials, name, source=None):
+    """
+    Concatenate the frames of one value over the consecutive segments of an audio file.
+
+    Parameters:
+        partials (list): The results of extract_segment_features for every segment, in order.
+        name (str): The key of the value in the results.
+        source (str): The embedding model, if the value is one of the 'embeddings'.
+
+    Returns:
+        numpy.ndarray: The frames of every segment, or None if a segment does not have them.
+    """
+    values = [None if partial is None else partial[name] if source is None else partial[name][source]
+              for partial in partials]
+
+    return None if any(value is None for value in values) else np.concatenate(values)
+
+
+def merge_segment_features(partials, features=None):
+    """
+    Merge the analyses of the consecutive segments of an audio file into the analysis of the whole file.
+
+    The loudness blocks, HPCP frames, beat intervals and embedding frames of every segment are pooled before
+    the features are computed from them, so only the few frames at the boundaries between segments differ
+    from an analysis of the whole file.
+
+    Parameters:
+        partials (list): The results of extract_segment_features for every segment, in order.
+        features (iterable): Names of the features to compute (keys of FEATURE_MODELS), or None for all of them.
+
+    Returns:
+        tuple: The same embeddings dictionary, predictions dictionary and head inputs as extract_track_features.
+    """
+    features = set(FEATURE_MODELS) if features is None else set(features)
+    embeddings = {}
+    predictions = {}
+    head_inputs = {}
+
+    if 'loudness' in features:
+        momentary_loudness = pool_segment_values(partials, 'momentary_loudness')
+        predictions['loudness'] = None if momentary_loudness is None else integrated_loudness(momentary_loudness)
+    if 'key' in features:
+        try:
+            hpcp_frames = pool_segment_values(partials, 'hpcp')
+            predictions['key'] = None if hpcp_frames is None else get_key_from_hpcp(hpcp_frames)
+        except Exception as e:
+            print(f"Error in get_key_from_hpcp: {e}")
+            predictions['key'] = None
+    if 'tempo' in features:
+        try:
+            beat_intervals = pool_segment_values(partials, 'beat_intervals')
+            predictions['tempo'] = None if beat_intervals is None else bpm_from_intervals(beat_intervals)
+        except Exception as e:
+            print(f"Error in bpm_from_intervals: {e}")
+            predictions['tempo'] = None
+
+    for source in EMBEDDING_MODELS:
+        heads = [head for head in CLASSIFIER_HEADS if head in features and CLASSIFIER_HEADS[head][0] == source]
+        if source not in features and not heads:
+            continue
+
+        source_embeddings = pool_segment_values(partials, 'embeddings', source)
+        if source in features:
+            embeddings[source] = source_embeddings
+        if heads:
+            head_inputs[source] = (source_embeddings, heads)
+
+    return embeddings, predictions, head_inputs
+
+
 def compile_audio_files(data_home):
     """
     Search through a specified directory and its subdirectories to compile a list of audio files. 
@@ -1,7 +1,17 @@
 import os
-import json
+import time
+import argparse
+import multiprocessing as mp
 from tqdm import tqdm
 import audio_analysis as aa
+import parallel_analysis as pa
+import pipelined_analysis as pl
+import analysis_manifest as am
+import result_shards as rs
+import embedding_store as ems
+import head_batching as hb
+import instrumentation as im
+import work_queue as wq
 import essentia
 
 
@@ -9,68 +19,373 @@ DATA_PATH = 'data'
 EMBEDDINGS_DIR = 'embeddings'
 PREDICTIONS_DIR = 'predictions'
 DISCOGS_EFFNET_METADATA_PATH = 'metadata/discogs-effnet-bs64-1.json'
+MANIFEST_PATH = os.path.join(PREDICTIONS_DIR, 'analysis_manifest.json')
+FAILURES_PATH = os.path.join(PREDICTIONS_DIR, 'analysis_failures.jsonl')
+SHARDS_DIR = os.path.join(PREDICTIONS_DIR, 'shards')
+EMBEDDINGS_STORE_DIR = os.path.join(EMBEDDINGS_DIR, 'audio_embeddings')
+LEGACY_EMBEDDINGS_JSON_PATH = os.path.join(EMBEDDINGS_DIR, 'audio_embeddings.json')
+PREDICTIONS_STORE_DIR = os.path.join(PREDICTIONS_DIR, 'audio_predictions')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Analyze every audio file in the data directory.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes to analyze tracks with (default: 1)')
+    parser.add_argument('--features', type=lambda value: value.split(','), default=list(aa.FEATURE_MODELS),
+                        help='comma-separated features to compute, e.g. tempo,danceability; the decodes and models '
+                             'they do not need are skipped (default: all of them)')
+    parser.add_argument('--full', action='store_true',
+                        help='ignore the manifest and re-analyze every track from scratch')
+    parser.add_argument('--streaming-dsp', action='store_true',
+                        help='compute tempo, key and loudness in a single streaming pass over each file')
+    parser.add_argument('--fsync-every', type=int, default=16,
+                        help='number of analyzed tracks between forced writes of the result shard (default: 16)')
+    parser.add_argument('--head-batch-size', type=int, default=4096,
+                        help='number of embedding frames to batch across tracks for each classifier head, '
+                             'or 0 to run the heads track by track (default: 4096)')
+    parser.add_argument('--audio-cache', metavar='DIR',
+                        help='cache decoded 16 kHz audio in this directory so that later runs do not decode again')
+    parser.add_argument('--audio-cache-size', type=float, default=10,
+                        help='size cap of the audio cache in GB, beyond which the least recently used audio is '
+                             'evicted (default: 10)')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='time every analysis stage, write a per-track JSONL trace to this file and print a '
+                             'summary at the end of the run')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='analyze in a pipeline of decode, DSP and inference processes instead of whole tracks '
+                             'per worker, so that decoding and DSP overlap with the models')
+    parser.add_argument('--decode-workers', type=int, default=pl.DECODE_WORKERS,
+                        help=f'number of decode processes of the pipeline (default: {pl.DECODE_WORKERS})')
+    parser.add_argument('--dsp-workers', type=int, default=pl.DSP_WORKERS,
+                        help=f'number of DSP processes of the pipeline (default: {pl.DSP_WORKERS})')
+    parser.add_argument('--prefetch', type=int, default=pl.PREFETCH_TRACKS,
+                        help='number of decoded tracks that may wait for the models in the pipeline, which bounds '
+                             f'its memory use (default: {pl.PREFETCH_TRACKS})')
+    parser.add_argument('--queue', metavar='DB',
+                        help='SQLite work queue on a mount shared by several hosts, for the coordinator and '
+                             'worker roles')
+    parser.add_argument('--role', choices=('coordinator', 'worker', 'merge'),
+                        help='coordinator: queue the tracks to analyze, wait for the workers and merge their '
+                             'results; worker: analyze tracks claimed from the queue (--workers processes on this '
+                             'host); merge: merge the result shards of the workers into the final outputs')
+    parser.add_argument('--lease-seconds', type=float, default=wq.LEASE_SECONDS,
+                        help='seconds after which the track of a worker that stopped sending heartbeats is handed '
+                             f'to another worker (default: {wq.LEASE_SECONDS})')
+    parser.add_argument('--chunked-min-duration', type=float, default=aa.CHUNKED_MIN_DURATION,
+                        help='analyze tracks at least this many seconds long window by window with bounded memory, '
+                             f'or a negative value to always load tracks fully (default: {aa.CHUNKED_MIN_DURATION})')
+    parser.add_argument('--track-timeout', type=float, default=pa.TRACK_TIMEOUT,
+                        help='with --workers, kill the worker of a track that takes longer than this many seconds '
+                             f'plus {pa.TIMEOUT_PER_AUDIO_SECOND:g} s per second of audio, or 0 for no limit '
+                             f'(default: {pa.TRACK_TIMEOUT})')
+    parser.add_argument('--max-worker-rss', type=float, default=pa.MAX_WORKER_RSS_MB, metavar='MB',
+                        help='with --workers, kill a worker whose resident memory grows beyond this many MB, '
+                             f'or 0 for no limit (default: {pa.MAX_WORKER_RSS_MB})')
+    parser.add_argument('--max-tasks-per-worker', type=int, default=pa.MAX_TASKS_PER_WORKER,
+                        help='with --workers, replace every worker after this many tracks to give back the memory '
+                             f'the models leak, or 0 to keep them (default: {pa.MAX_TASKS_PER_WORKER})')
+    parser.add_argument('--split-long', type=float, metavar='SECONDS',
+                        help='with --workers, split tracks longer than this many seconds into segments analyzed '
+                             'in parallel and merged afterwards (default: analyze every track whole)')
+
+    args = parser.parse_args()
+    try:
+        aa.resolve_features(args.features)
+    except ValueError as e:
+        parser.error(f'{e} (choose from {", ".join(aa.FEATURE_MODELS)})')
+    if args.role in ('coordinator', 'worker') and not args.queue:
+        parser.error(f'--role {args.role} needs a --queue')
+    if args.split_long is not None and (args.workers < 2 or args.pipeline or args.role):
+        parser.error('--split-long needs --workers above 1, without --pipeline or --role')
+
+    return args
+
+
+def analysis_options(args):
+    """
+    Get the options of analyze_file from the command line arguments.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        dict: The keyword arguments of parallel_analysis.analyze_file.
+    """
+    return {
+        'streaming_dsp': args.streaming_dsp,
+        'defer_heads': args.head_batch_size > 0,
+        'chunked_min_duration': args.chunked_min_duration if args.chunked_min_duration >= 0 else None,
+    }
+
+
+def write_results(results, writer, fingerprints, on_sync=None, total=None, desc='Analyzing audio files'):
+    """
+    Append the results of every analyzed track to a shard as soon as they arrive.
+
+    Parameters:
+        results (iterable): Tuples of a track, its embeddings and its predictions.
+        writer (result_shards.ShardWriter): The shard to append to.
+        fingerprints (dict): A dictionary mapping feature names to their current fingerprints.
+        on_sync (callable): Called with the list of tracks written since the previous call every time the shard
+            has been synced to disk, or None.
+        total (int): The number of tracks expected, for the progress bar.
+        desc (str): The label of the progress bar.
+
+    Returns:
+        None
+    """
+    unsynced = []
+    for filename, embeddings, predictions in tqdm(results, total=total, desc=desc):
+
+        # features that failed are left out of the manifest so that the next run retries them
+        computed_fingerprints = {feature: fingerprints[feature]
+                                 for feature, value in {**embeddings, **predictions}.items() if value is not None}
+        with im.stage('write_results'):
+            writer.append(filename, embeddings, predictions, computed_fingerprints)
+        im.end_track(filename)
+
+        unsynced.append(filename)
+        if writer.pending == 0 and on_sync is not None:
+            on_sync(unsynced)
+            unsynced = []
+
+    writer.sync()
+    if on_sync is not None:
+        on_sync(unsynced)
+
+
+def run_queue_worker(args):
+    """
+    Analyze tracks claimed from the shared work queue until it is empty, appending them to this worker's shard.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        None
+    """
+    pa.init_worker(args.audio_cache, int(args.audio_cache_size * (1 << 30)), args.trace)
+    # every host fingerprints its own copy of the models
+    fingerprints = am.feature_fingerprints(aa.FEATURE_MODELS, am.hash_models(aa.model_paths()))
+    options = analysis_options(args)
+
+    worker = wq.worker_id()
+    queue = wq.WorkQueue(args.queue, args.lease_seconds)
+    shard_path = os.path.join(SHARDS_DIR, f'shard-{time.strftime("%Y%m%d%H%M%S")}-{worker}.jsonl')
+    heartbeat_interval = min(wq.HEARTBEAT_SECONDS, args.lease_seconds / 3)
+
+    with wq.Heartbeat(args.queue, worker, args.lease_seconds, heartbeat_interval), \
+            rs.ShardWriter(shard_path, fsync_every=args.fsync_every) as writer:
+        while True:
+            results = (pa.analyze_file(task, **options) for task in wq.claimed_tasks(queue, worker))
+            if options['defer_heads']:
+                results = hb.batch_heads(results, hb.HeadBatcher(args.head_batch_size))
+
+            # a track is only done once its results are on the shared mount; until then its lease can expire
+            write_results(results, writer, fingerprints, on_sync=queue.complete,
+                          desc=f'Analyzing audio files ({worker})')
+
+            # with nothing left to claim, stay around to take over the tracks of workers that stop heartbeating,
+            # including those the coordinator put back in the queue since the last claim
+            if not queue.leased_by_others(worker) and not queue.counts()[wq.PENDING]:
+                break
+            time.sleep(wq.POLL_SECONDS)
+
+    queue.close()
+
+
+def wait_for_queue(queue, total):
+    """
+    Show the progress of the workers until every queued track is done or given up, or every worker stopped.
+
+    The expired leases are put back in the queue on every poll, so that the surviving workers take them over.
+
+    Parameters:
+        queue (work_queue.WorkQueue): The shared queue.
+        total (int): The number of queued tracks.
+
+    Returns:
+        list: The tracks left pending because every worker stopped (see work_queue.WorkQueue.stranded).
+    """
+    stranded = []
+    with tqdm(total=total, desc='Analyzing audio files on the workers') as progress:
+        while True:
+            queue.expire()
+            counts = queue.counts()
+            progress.update(counts[wq.DONE] + counts[wq.FAILED] - progress.n)
+            if counts[wq.PENDING] + counts[wq.LEASED] == 0:
+                break
+            stranded = queue.stranded()
+            if stranded:
+                break
+            time.sleep(wq.POLL_SECONDS)
+
+    for filename in queue.failed():
+        print(f'Gave up on {filename} after {wq.MAX_ATTEMPTS} expired leases')
+    if stranded:
+        print(f'No worker has claimed or heartbeated for {queue.lease_seconds:.0f} s, stopping with '
+              f'{len(stranded)} tracks not analyzed; the next run queues them again:')
+        for filename in stranded:
+            print(f'  {filename}')
+
+    return stranded
+
+
+def merge_results(manifest, model_hashes, audio_predictions_json_path, merge_previous=True):
+    """
+    Record the tracks of every result shard in the manifest, save it and compact the shards into the final outputs.
+
+    Parameters:
+        manifest (dict): The manifest to update and save.
+        model_hashes (dict): The hashes of the current models.
+        audio_predictions_json_path (str): The path to the predictions JSON file.
+        merge_previous (bool): Whether to keep the results of earlier runs for the tracks and features not in the
+            shards.
+
+    Returns:
+        None
+    """
+    shard_paths = rs.list_shards(SHARDS_DIR)
+    for record in rs.read_shards(shard_paths):
+        if os.path.isfile(record['track']):
+            am.record_track(manifest, record['track'], record['fingerprints'], record['fingerprints'])
+
+    manifest['models'] = model_hashes
+    with im.stage('save_manifest'):
+        am.save_manifest(manifest, MANIFEST_PATH)
+
+    # compact the shards into the final features and embeddings files
+    print('Compacting results...')
+    with im.stage('compact_shards'):
+        rs.compact_shards(shard_paths, EMBEDDINGS_STORE_DIR, audio_predictions_json_path,
+                          tracks=set(manifest['tracks']), merge_previous=merge_previous,
+                          predictions_store_dir=PREDICTIONS_STORE_DIR)
 
 
 def main():
-    
+
+    args = parse_args()
     essentia.log.warningActive = False
+    run_start = time.perf_counter()
+    if args.trace:
+        open(args.trace, 'w').close()
+    im.configure(args.trace)
 
     # ensure that necessary directories exist
     os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
     os.makedirs(PREDICTIONS_DIR, exist_ok=True)
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+
+    audio_predictions_json_path = os.path.join(PREDICTIONS_DIR, "audio_predictions.json")
+
+    # workers only need the queue; every worker process writes its own shard
+    if args.role == 'worker':
+        if args.workers > 1:
+            context = mp.get_context('spawn')
+            processes = [context.Process(target=run_queue_worker, args=(args,)) for _ in range(args.workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        else:
+            run_queue_worker(args)
+
+        if args.trace:
+            im.print_summary(args.trace, time.perf_counter() - run_start)
+        return
+
+    if args.role == 'merge':
+        model_hashes = am.hash_models(aa.model_paths())
+        merge_results(am.load_manifest(MANIFEST_PATH), model_hashes, audio_predictions_json_path)
+        return
+
+    # embeddings used to be stored as JSON, so migrate them to the binary store once
+    if not args.full and not os.path.isdir(EMBEDDINGS_STORE_DIR) and os.path.isfile(LEGACY_EMBEDDINGS_JSON_PATH):
+        print('Converting embeddings JSON to the binary embedding store...')
+        ems.convert_json_embeddings(LEGACY_EMBEDDINGS_JSON_PATH, EMBEDDINGS_STORE_DIR)
 
     # get all audio file paths
     audio_files = aa.compile_audio_files(DATA_PATH)
-    print(f'Found {len(audio_files)} audio files to analyze. Analyzing now...')
-
-    # initialize directories that we will store the audio embeddings and predictions in
-    audio_embeddings = {}
-    audio_predictions = {}
-    for filename in tqdm(audio_files, desc='Loading audio files'):
-
-        # load audio in all necessary versions
-        stereo_audio, mono_audio, resampled_mono_audio, _ = aa.load_audio(filename=filename)
-
-        # get signal processing features
-        tempo = aa.get_tempo(mono_audio)
-        key = aa.get_key(mono_audio)
-        loudness = aa.get_loudness(stereo_audio)
-
-        # get features based on machine learning models
-        discogs_embeddings, musiCNN_embeddings = aa.get_embeddings(resampled_mono_audio)
-        music_styles = aa.get_music_styles(discogs_embeddings)
-        voice_or_instrument = aa.classify_voice_or_instrument(discogs_embeddings)
-        danceability = aa.get_danceability(discogs_embeddings)
-        arousal_and_valence = aa.get_arousal_and_valence(musiCNN_embeddings)
-
-        # store embeddings in one dictionary and features (predictions) in another
-        audio_embeddings[filename] = {
-            'discogs_embeddings': discogs_embeddings,
-            'musiCNN_embeddings': musiCNN_embeddings,
-        }
-
-        audio_predictions[filename] = {
-            'tempo': tempo,
-            'key': key,
-            'loudness': loudness,
-            'music_styles': music_styles,
-            'voice_or_instrument': voice_or_instrument,
-            'danceability': danceability,
-            'arousal_and_valence': arousal_and_valence
-        }
-
-    # donwload features and embeddings
-    audio_embeddings_json_path = os.path.join(EMBEDDINGS_DIR, "audio_embeddings.json")
-    audio_predictions_json_path = os.path.join(PREDICTIONS_DIR, "audio_predictions.json")
 
-    audio_embeddings_json = aa.convert_numpy_to_list(audio_embeddings)
-    audio_predictions_json = aa.convert_numpy_to_list(audio_predictions)
+    # compare the collection and the models against the manifest of the previous run
+    with im.stage('hash_models'):
+        model_hashes = am.hash_models(aa.model_paths())
+    fingerprints = am.feature_fingerprints(aa.FEATURE_MODELS, model_hashes)
+    have_previous_results = os.path.isdir(EMBEDDINGS_STORE_DIR) and os.path.isfile(audio_predictions_json_path)
+    if args.full:
+        manifest = am.new_manifest()
+        for shard_path in rs.list_shards(SHARDS_DIR):
+            rs.remove_shard(shard_path)
+    elif not have_previous_results:
+        manifest = am.new_manifest()
+    else:
+        manifest = am.load_manifest(MANIFEST_PATH)
+
+    # resume: tracks committed to the shards of an interrupted run are not analyzed again
+    shard_paths = rs.list_shards(SHARDS_DIR)
+    for record in rs.read_shards(shard_paths):
+        if os.path.isfile(record['track']):
+            am.record_track(manifest, record['track'], record['fingerprints'], record['fingerprints'])
+
+    # only the requested features are planned; the others keep their previous results
+    requested_fingerprints = {feature: fingerprints[feature] for feature in args.features}
+    with im.stage('plan_analysis'):
+        todo, removed = am.plan_analysis(audio_files, manifest, requested_fingerprints)
+    for filename in removed:
+        am.forget_track(manifest, filename)
+
+    # hand the longest tracks out first, so that the run does not end waiting on a long track started last
+    tasks = todo.items()
+    if args.role == 'coordinator' or args.pipeline or args.workers > 1:
+        with im.stage('schedule_longest_first'):
+            tasks = pa.schedule_longest_first(tasks, args.split_long)
+    # keep the run's setup stages apart from the first track analyzed in this process
+    im.end_track(None)
+
+    print(f'Found {len(audio_files)} audio files, {len(todo)} of them new or out of date '
+          f'and {len(removed)} removed. Analyzing now...')
+
+    if args.role == 'coordinator':
+        # the workers on every host claim the queued tracks and write their own shards, merged once all are done
+        am.save_manifest(manifest, MANIFEST_PATH)
+        queue = wq.WorkQueue(args.queue, args.lease_seconds)
+        queue.reset(tasks)
+        wait_for_queue(queue, len(todo))
+        queue.close()
+
+    else:
+        # analyze in this process, or stream results back from the worker pool in completion order
+        options = analysis_options(args)
+        audio_cache_max_bytes = int(args.audio_cache_size * (1 << 30))
+        if args.pipeline:
+            results = pl.analyze_pipelined(tasks, args.decode_workers, args.dsp_workers, args.prefetch,
+                                           **options, audio_cache_dir=args.audio_cache,
+                                           audio_cache_max_bytes=audio_cache_max_bytes, trace_path=args.trace)
+        elif args.workers > 1:
+            results = pa.analyze_in_parallel(tasks, args.workers, **options, audio_cache_dir=args.audio_cache,
+                                             audio_cache_max_bytes=audio_cache_max_bytes, trace_path=args.trace,
+                                             max_tasks_per_worker=args.max_tasks_per_worker or None,
+                                             track_timeout=args.track_timeout or None,
+                                             max_worker_rss_mb=args.max_worker_rss or None,
+                                             failures_path=FAILURES_PATH)
+        else:
+            aa.configure_audio_cache(args.audio_cache, audio_cache_max_bytes)
+            results = (pa.analyze_file(task, **options) for task in tasks)
+
+        # run the classifier heads over large batches of frames gathered from many tracks
+        if options['defer_heads']:
+            results = hb.batch_heads(results, hb.HeadBatcher(args.head_batch_size))
+
+        # append every track's results to this run's shard as soon as it is analyzed
+        shard_path = os.path.join(SHARDS_DIR, f'shard-{time.strftime("%Y%m%d%H%M%S")}-{os.getpid()}.jsonl')
+        with rs.ShardWriter(shard_path, fsync_every=args.fsync_every) as writer:
+            write_results(results, writer, fingerprints, total=len(todo))
 
-    with open(audio_embeddings_json_path, "w") as json_file:
-        json.dump(audio_embeddings_json, json_file)
+    merge_results(manifest, model_hashes, audio_predictions_json_path, merge_previous=not args.full)
 
-    with open(audio_predictions_json_path, "w") as json_file:
-        json.dump(audio_predictions_json, json_file)
+    if args.trace:
+        im.end_track(None)
+        im.print_summary(args.trace, time.perf_counter() - run_start)
 
 
 if __name__ == '__main__':
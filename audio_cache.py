@@ -0,0 +1,182 @@
+import os
+import sys
+import glob
+import numpy as np
+import analysis_manifest as am
+
+
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 10 << 30
+SOURCE_SUFFIX = '.source'
+
+
+class AudioCache:
+    """
+    On-disk cache of decoded audio, keyed by the content hash of the source file.
+
+    Every cached representation of a file is an uncompressed `<hash>.<representation>.v<version>.npy` array
+    that is memory-mapped on read, next to a `<hash>.source` file naming the file it was decoded from. Reads
+    refresh the modification time of an entry, and writes evict the least recently used entries until the
+    cache fits in `max_bytes`. Entries are written to a temporary file and renamed, so several processes can
+    share a cache directory.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, content_hash, representation):
+        """
+        Get the path of a cache entry.
+
+        Parameters:
+            content_hash (str): The fast hash of the source file (see analysis_manifest.fast_hash).
+            representation (str): The name of the representation (e.g. 'mono_16k').
+
+        Returns:
+            str: The path of the entry's array file.
+        """
+        return os.path.join(self.cache_dir, f'{content_hash}.{representation}.v{CACHE_VERSION}.npy')
+
+    def get(self, content_hash, representation):
+        """
+        Read a cached representation and mark it as recently used.
+
+        Parameters:
+            content_hash (str): The fast hash of the source file.
+            representation (str): The name of the representation.
+
+        Returns:
+            numpy.ndarray: A read-only memory map of the cached array, or None if it is not cached.
+        """
+        path = self.path(content_hash, representation)
+        try:
+            audio = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return audio
+
+    def put(self, content_hash, filename, representation, audio):
+        """
+        Store a decoded representation, then evict old entries if the cache is over its size cap.
+
+        Parameters:
+            content_hash (str): The fast hash of the source file.
+            filename (str): The path to the source file.
+            representation (str): The name of the representation.
+            audio (numpy.ndarray): The decoded audio.
+
+        Returns:
+            None
+        """
+        path = self.path(content_hash, representation)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(audio, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+        source_path = os.path.join(self.cache_dir, content_hash + SOURCE_SUFFIX)
+        with open(source_path + f'.{os.getpid()}.tmp', 'w') as f:
+            f.write(os.path.abspath(filename))
+        os.replace(source_path + f'.{os.getpid()}.tmp', source_path)
+
+        self.evict()
+
+    def entries(self):
+        """
+        List the cached arrays.
+
+        Returns:
+            list: Tuples of the path, size in bytes and modification time of every entry, least recently used first.
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.npy')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits in its size cap, along with the source file of
+        every hash whose last representation goes.
+
+        Returns:
+            int: The number of bytes freed.
+        """
+        entries = self.entries()
+        excess = sum(size for _, size, _ in entries) - self.max_bytes
+        freed = 0
+
+        for path, size, _ in entries:
+            if freed >= excess:
+                break
+            remove_entry(path)
+            freed += size
+
+            # the source file of a hash is only needed while one of its representations is cached
+            content_hash = os.path.basename(path).split('.', 1)[0]
+            if not glob.glob(os.path.join(self.cache_dir, content_hash + '.*.npy')):
+                remove_entry(os.path.join(self.cache_dir, content_hash + SOURCE_SUFFIX))
+
+        return freed
+
+    def prune(self):
+        """
+        Delete every entry whose source file no longer exists or no longer has the content it was decoded from.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        removed = 0
+        for source_path in glob.glob(os.path.join(self.cache_dir, '*' + SOURCE_SUFFIX)):
+            content_hash = os.path.basename(source_path)[:-len(SOURCE_SUFFIX)]
+            with open(source_path, 'r') as f:
+                filename = f.read()
+
+            if os.path.isfile(filename) and am.fast_hash(filename) == content_hash:
+                continue
+
+            for path in glob.glob(os.path.join(self.cache_dir, content_hash + '.*.npy')):
+                remove_entry(path)
+                removed += 1
+            os.remove(source_path)
+
+        # arrays from older cache versions are never read again
+        for path, _, _ in self.entries():
+            if not path.endswith(f'.v{CACHE_VERSION}.npy'):
+                remove_entry(path)
+                removed += 1
+
+        return removed
+
+
+def remove_entry(path):
+    """
+    Delete a cache entry, ignoring entries that another process already deleted.
+
+    Parameters:
+        path (str): The path of the entry's array file.
+
+    Returns:
+        None
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'prune':
+        print('Usage: python audio_cache.py prune <cache directory>')
+        sys.exit(1)
+
+    print(f'Removed {AudioCache(sys.argv[2]).prune()} cache entries.')
@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+from functools import partial
+import numpy as np
+import essentia
+import audio_analysis as aa
+import synthetic_audio as sa
+
+
+BENCHMARK_DURATIONS = (10, 30, 120)
+BENCHMARK_REPEAT = 3
+# a benchmark regresses when its median time grows by more than this fraction of the baseline's
+DEFAULT_THRESHOLD = 0.2
+
+CLICKS_BPM = 120
+CHORDS_KEY = ('A', 'minor')
+# how far the tempo detected on the click track may be from CLICKS_BPM
+BPM_TOLERANCE = 1.
+
+# the synthetic signals: name -> function of the duration
+SIGNALS = {
+    'clicks': partial(sa.clicks, CLICKS_BPM),
+    'chords': partial(sa.chords, *CHORDS_KEY),
+    'noise': sa.noise,
+    'silence': sa.silence,
+}
+
+
+def signal_inputs(signal, duration, tmp_dir):
+    """
+    Generate a synthetic signal in every form the benchmarked functions take.
+
+    Parameters:
+        signal (str): The name of the signal in SIGNALS.
+        duration (float): The duration in seconds.
+        tmp_dir (str): The directory to write the signal's WAV file to.
+
+    Returns:
+        dict: The stereo and mono signals at SAMPLE_RATE, the 16 kHz mono signal and the path of the WAV file.
+    """
+    mono_audio = SIGNALS[signal](duration)
+
+    return {
+        'stereo': sa.to_stereo(mono_audio),
+        'mono': mono_audio,
+        'mono_16k': sa.resample(mono_audio),
+        'filename': sa.write_wav(os.path.join(tmp_dir, f'{signal}_{duration}s.wav'), mono_audio),
+    }
+
+
+def benchmark_cases(inputs):
+    """
+    List the benchmarked calls on one synthetic signal.
+
+    Parameters:
+        inputs (dict): The signal as returned by signal_inputs.
+
+    Returns:
+        dict: A dictionary mapping each benchmark name to a function running it without arguments.
+    """
+    cases = {
+        'load_audio': partial(aa.load_audio, inputs['filename']),
+        'get_loudness': partial(aa.get_loudness, inputs['stereo']),
+        'get_tempo': partial(aa.get_tempo, inputs['mono']),
+        'get_key': partial(aa.get_key, inputs['mono']),
+        'get_signal_features': partial(aa.get_signal_features, inputs['filename']),
+    }
+
+    for name in aa.EMBEDDING_MODELS:
+        # models whose graph cannot be loaded are skipped, and the heads are timed on embeddings computed up front
+        embeddings = aa.extract_embeddings(name, inputs['mono_16k'])
+        if embeddings is None:
+            continue
+
+        cases[f'extract_embeddings_{name}'] = partial(aa.extract_embeddings, name, inputs['mono_16k'])
+        heads = [head for head, (source, _, _, _) in aa.CLASSIFIER_HEADS.items() if source == name]
+        if heads:
+            cases[f'run_heads_{name}'] = partial(aa.run_heads, embeddings, heads)
+
+    cases['analyze_track'] = partial(aa.analyze_track, inputs['filename'])
+
+    return cases
+
+
+def time_call(function, repeat):
+    """
+    Time a call several times.
+
+    Parameters:
+        function (callable): The function to call without arguments.
+        repeat (int): The number of timed calls.
+
+    Returns:
+        tuple: The median and minimum wall times in seconds, and the value returned by the last call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        times.append(time.perf_counter() - start)
+
+    return float(np.median(times)), float(np.min(times)), value
+
+
+def check_value(case, signal, value):
+    """
+    Check the value of a benchmarked call against the known content of a synthetic signal.
+
+    Parameters:
+        case (str): The benchmark name.
+        signal (str): The name of the signal in SIGNALS.
+        value: The value returned by the call.
+
+    Returns:
+        dict: The expected and detected values and whether they match, or None if there is nothing to check.
+    """
+    if signal == 'clicks' and case == 'get_tempo':
+        return {'expected': CLICKS_BPM, 'value': value,
+                'ok': value is not None and abs(value - CLICKS_BPM) <= BPM_TOLERANCE}
+
+    if signal == 'chords' and case == 'get_key':
+        detected = None if value is None else {profile: list(key) for profile, key in value.items()}
+        return {'expected': list(CHORDS_KEY), 'value': detected,
+                'ok': detected is not None and all(key == list(CHORDS_KEY) for key in detected.values())}
+
+    return None
+
+
+def run_benchmarks(durations=BENCHMARK_DURATIONS, repeat=BENCHMARK_REPEAT, signals=None, cases=None):
+    """
+    Time every benchmarked call on every synthetic signal at every duration.
+
+    Parameters:
+        durations (iterable): The signal durations in seconds.
+        repeat (int): The number of timed calls of each benchmark.
+        signals (iterable): Names of the signals in SIGNALS to run, or None for all of them.
+        cases (iterable): Names of the benchmarks to run (see benchmark_cases), or None for all of them.
+
+    Returns:
+        dict: The results, with the environment, the settings, a 'results' dictionary mapping every
+            '<benchmark>/<signal>/<duration>s' name to its timings and a 'checks' dictionary of the detected
+            tempo and key of the signals that have known ones.
+    """
+    essentia.log.warningActive = False
+    aa.load_models()
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'essentia': essentia.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'results': {},
+        'checks': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for signal in signals or SIGNALS:
+            for duration in durations:
+                inputs = signal_inputs(signal, duration, tmp_dir)
+                for case, function in benchmark_cases(inputs).items():
+                    if cases is not None and case not in cases:
+                        continue
+
+                    name = f'{case}/{signal}/{duration}s'
+                    # one untimed call, so that lazy initializations are not counted
+                    function()
+                    median, minimum, value = time_call(function, repeat)
+                    report['results'][name] = {'median': median, 'min': minimum, 'audio_seconds': duration}
+                    print(f'{name:<55}{median:>10.4f} s')
+
+                    check = check_value(case, signal, value)
+                    if check is not None:
+                        report['checks'][name] = check
+
+    return report
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare benchmark results against a baseline.
+
+    Parameters:
+        results (dict): The current results, as returned by run_benchmarks.
+        baseline (dict): The baseline results, in the same format.
+        threshold (float): The fraction by which a median time may grow before it counts as a regression.
+
+    Returns:
+        tuple: A list of (name, baseline median, current median, ratio) rows for every benchmark present in both,
+            and the names of the regressed benchmarks.
+    """
+    rows = []
+    regressions = []
+    for name, timing in results['results'].items():
+        if name not in baseline['results']:
+            continue
+
+        baseline_median = baseline['results'][name]['median']
+        ratio = timing['median'] / baseline_median if baseline_median > 0 else 1.
+        rows.append((name, baseline_median, timing['median'], ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+
+    return rows, regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the audio analysis on synthetic signals.')
+    parser.add_argument('--durations', type=lambda value: [float(d) for d in value.split(',')],
+                        default=list(BENCHMARK_DURATIONS),
+                        help='comma-separated signal durations in seconds (default: 10,30,120)')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT,
+                        help=f'number of timed calls of every benchmark (default: {BENCHMARK_REPEAT})')
+    parser.add_argument('--signals', type=lambda value: value.split(','),
+                        help=f'comma-separated signals to run, from {", ".join(SIGNALS)} (default: all of them)')
+    parser.add_argument('--cases', type=lambda value: value.split(','),
+                        help='comma-separated benchmarks to run, e.g. get_tempo,analyze_track (default: all of them)')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='JSON file to write the results to (default: benchmark_results.json)')
+    parser.add_argument('--baseline',
+                        help='JSON file of earlier results to compare against, e.g. the --output of a previous run')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='fraction by which a median time may grow before it is reported as a regression '
+                             f'(default: {DEFAULT_THRESHOLD})')
+
+    args = parser.parse_args()
+    unknown = set(args.signals or []).difference(SIGNALS)
+    if unknown:
+        parser.error(f"Unknown signals: {', '.join(sorted(unknown))}")
+
+    return args
+
+
+def main():
+    args = parse_args()
+    durations = [int(duration) if duration.is_integer() else duration for duration in args.durations]
+    report = run_benchmarks(durations, args.repeat, args.signals, args.cases)
+
+    with open(args.output, 'w') as json_file:
+        json.dump(report, json_file, indent=2)
+    print(f'Results written to {args.output}')
+
+    failed_checks = [name for name, check in report['checks'].items() if not check['ok']]
+    for name in failed_checks:
+        check = report['checks'][name]
+        print(f"Check failed: {name} detected {check['value']}, expected {check['expected']}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as json_file:
+            baseline = json.load(json_file)
+        rows, regressions = compare_results(report, baseline, args.threshold)
+
+        print(f"{'benchmark':<55}{'baseline s':>12}{'current s':>12}{'change':>9}")
+        for name, baseline_median, median, ratio in rows:
+            flag = '  REGRESSION' if name in regressions else ''
+            print(f'{name:<55}{baseline_median:>12.4f}{median:>12.4f}{ratio - 1:>+9.1%}{flag}')
+        print(f'{len(regressions)} of {len(rows)} benchmarks regressed by more than {args.threshold:.0%}')
+
+    if failed_checks or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import sys
+import argparse
+import subprocess
+import numpy as np
+
+
+BENCHMARK_REPEAT = 5
+# modules the apps and command-line tools import at startup
+STARTUP_MODULES = ('collection_io', 'predictions_store', 'descriptor_queries_utils', 'similarities_utils',
+                   'collection_cache', 'music_collection_overview')
+# modules that only make plots, and must not be imported at startup
+PLOTTING_MODULES = ('matplotlib', 'seaborn')
+
+
+def parse_importtime(output):
+    """
+    Parse the report that `python -X importtime` writes to stderr.
+
+    Parameters:
+        output (str): The stderr of the interpreter.
+
+    Returns:
+        dict: A dictionary mapping every imported module to its cumulative import time in microseconds.
+    """
+    cumulative = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        cumulative[fields[2].strip()] = int(fields[1])
+
+    return cumulative
+
+
+def time_import(module):
+    """
+    Import a module in a fresh interpreter with `-X importtime`.
+
+    Parameters:
+        module (str): The name of the module.
+
+    Returns:
+        dict: A dictionary mapping every module imported along with it to its cumulative import time in microseconds.
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             capture_output=True, text=True, check=True)
+
+    return parse_importtime(process.stderr)
+
+
+def run_benchmark(modules=STARTUP_MODULES, repeat=BENCHMARK_REPEAT):
+    """
+    Time the import of every module and list the plotting modules it pulls in.
+
+    Parameters:
+        modules (tuple): The names of the modules.
+        repeat (int): The number of fresh interpreters every module is imported in.
+
+    Returns:
+        dict: A dictionary mapping every module to its median import time in ms and the plotting modules it imports.
+    """
+    results = {}
+    for module in modules:
+        times = []
+        for _ in range(repeat):
+            imported = time_import(module)
+            times.append(imported[module] / 1000)
+
+        results[module] = {
+            'import_ms': float(np.median(times)),
+            'plotting_modules': [name for name in PLOTTING_MODULES if name in imported],
+        }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup import time of the collection modules.')
+    parser.add_argument('--modules', type=lambda value: value.split(','), default=STARTUP_MODULES,
+                        help='comma-separated modules to import (default: the modules the apps and tools import)')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT,
+                        help=f'number of fresh interpreters per module (default: {BENCHMARK_REPEAT})')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.modules, args.repeat)
+    for module, result in results.items():
+        plotting = ', '.join(result['plotting_modules']) or '-'
+        print(f"{module:<30}{result['import_ms']:>10.1f} ms    plotting: {plotting}")
+
+    # only the report loads the plotting libraries, when it draws its first plot
+    if any(result['plotting_modules'] for result in results.values()):
+        print('Plotting libraries are imported at startup')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
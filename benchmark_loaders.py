@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+from functools import partial
+import numpy as np
+import pandas as pd
+import collection_io as cio
+import descriptor_queries_utils as dqu
+import predictions_store as ps
+
+
+BENCHMARK_TRACKS = 10000
+BENCHMARK_REPEAT = 3
+KEYS = ('C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B')
+SCALES = ('major', 'minor')
+KEY_PROFILES = ('temperley', 'krumhansl', 'edma')
+
+
+def synthetic_predictions(tracks, styles, seed=0):
+    """
+    Generate random predictions shaped like those of audio_analysis_main.
+
+    Parameters:
+        tracks (int): The number of tracks.
+        styles (int): The number of style activations per track.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        dict: A dictionary mapping every track to its predictions dictionary.
+    """
+    rng = np.random.default_rng(seed)
+    audio_predictions = {}
+    for i in range(tracks):
+        audio_predictions[f'audio/track_{i}.mp3'] = {
+            'tempo': float(rng.uniform(60, 200)),
+            'loudness': float(rng.uniform(-30, -5)),
+            'key': {profile: [KEYS[rng.integers(len(KEYS))], SCALES[rng.integers(len(SCALES))]]
+                    for profile in KEY_PROFILES},
+            'music_styles': rng.random(styles).tolist(),
+            'voice_or_instrument': rng.dirichlet((1, 1)).tolist(),
+            'danceability': rng.dirichlet((1, 1)).tolist(),
+            'arousal_and_valence': rng.uniform(1, 9, 2).tolist(),
+        }
+
+    return audio_predictions
+
+
+def legacy_load_genres(json_path, genres):
+    """
+    Load the style activations the way descriptor_queries_utils.load_genres used to, one dictionary per track.
+
+    Parameters:
+        json_path (str): The path to the predictions JSON file.
+        genres (list): The names of the styles.
+
+    Returns:
+        pandas.DataFrame: The style activations, one row per track.
+    """
+    audio_predictions = cio.load_audio_predictions(json_path)
+    audio_genres = {}
+
+    for audio in audio_predictions:
+        genre_activations = audio_predictions[audio]['music_styles']
+        audio_genres[audio] = dict(zip(genres, genre_activations))
+
+    return pd.DataFrame(audio_genres).T
+
+
+def legacy_load_activations(json_path):
+    """
+    Load the other predictions the way descriptor_queries_utils.load_activations used to, with the scalars the
+    app then extracted from the list columns at query time.
+
+    Parameters:
+        json_path (str): The path to the predictions JSON file.
+
+    Returns:
+        pandas.DataFrame: The predictions, one row per track, with object columns for the lists.
+    """
+    audio_predictions = cio.load_audio_predictions(json_path)
+    df = pd.DataFrame(audio_predictions).T
+
+    edma = df['key'].apply(lambda x: x.get('edma'))
+    df['key'] = edma
+    df.drop(columns=['music_styles'], inplace=True)
+
+    df['vocal'] = df['voice_or_instrument'].apply(lambda x: x[1])
+    df['danceability'] = df['danceability'].apply(lambda x: x[0])
+    df['valence'] = df['arousal_and_valence'].apply(lambda x: x[0])
+    df['arousal'] = df['arousal_and_valence'].apply(lambda x: x[1])
+
+    return df
+
+
+def load_legacy(json_path, genres):
+    """
+    Load the descriptor queries collection with the legacy loaders.
+
+    Parameters:
+        json_path (str): The path to the predictions JSON file.
+        genres (list): The names of the styles.
+
+    Returns:
+        tuple: The DataFrames of legacy_load_genres and legacy_load_activations.
+    """
+    return legacy_load_genres(json_path, genres), legacy_load_activations(json_path)
+
+
+def load_vectorized(json_path=None, store_dir=None):
+    """
+    Load the descriptor queries collection with the vectorized loaders, from the columnar store if given.
+
+    Parameters:
+        json_path (str): The path to the predictions JSON file, read when no store is given.
+        store_dir (str): The directory of the columnar predictions store, or None.
+
+    Returns:
+        tuple: The DataFrames of descriptor_queries_utils.load_genres and load_activations.
+    """
+    if store_dir is not None:
+        predictions = ps.PredictionsStore(store_dir)
+    else:
+        predictions = ps.build_predictions_store(cio.load_audio_predictions(json_path))
+
+    return dqu.load_genres(predictions), dqu.load_activations(predictions)
+
+
+def check_equivalent(genres_df, activations_df, legacy_genres_df, legacy_activations_df):
+    """
+    Check that the loaders return the same data as the legacy ones, up to float32 precision.
+
+    Parameters:
+        genres_df (pandas.DataFrame): The result of descriptor_queries_utils.load_genres.
+        activations_df (pandas.DataFrame): The result of descriptor_queries_utils.load_activations.
+        legacy_genres_df (pandas.DataFrame): The result of legacy_load_genres.
+        legacy_activations_df (pandas.DataFrame): The result of legacy_load_activations.
+
+    Returns:
+        bool: True if every track, style activation, scalar and key matches.
+    """
+    if list(genres_df.index) != list(legacy_genres_df.index):
+        return False
+    if list(genres_df.columns) != list(legacy_genres_df.columns):
+        return False
+    if not np.allclose(genres_df.to_numpy(), legacy_genres_df.to_numpy(dtype=np.float64), rtol=1e-6):
+        return False
+
+    for column in ('tempo', 'loudness', 'vocal', 'danceability', 'valence', 'arousal'):
+        if not np.allclose(activations_df[column], legacy_activations_df[column].astype(np.float64), rtol=1e-6):
+            return False
+
+    keys = [[key, scale] for key, scale in zip(activations_df['key'], activations_df['scale'])]
+    return keys == list(legacy_activations_df['key'])
+
+
+def time_call(function, repeat):
+    """
+    Time a call several times.
+
+    Parameters:
+        function (callable): The function to call without arguments.
+        repeat (int): The number of timed calls.
+
+    Returns:
+        tuple: The median wall time in seconds and the value returned by the last call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        times.append(time.perf_counter() - start)
+
+    return float(np.median(times)), value
+
+
+def run_benchmark(tracks=BENCHMARK_TRACKS, repeat=BENCHMARK_REPEAT):
+    """
+    Time the legacy and the vectorized loaders of the descriptor queries app on synthetic predictions.
+
+    Parameters:
+        tracks (int): The number of tracks.
+        repeat (int): The number of timed calls of every loader.
+
+    Returns:
+        tuple: A dictionary mapping every loader to its median time in seconds, and whether the loaders agree.
+    """
+    genres = cio.load_discogs_music_genres(dqu.DISCOGS_METADATA_PATH)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, 'audio_predictions.json')
+        store_dir = os.path.join(tmp_dir, 'audio_predictions')
+        audio_predictions = synthetic_predictions(tracks, len(genres))
+        with open(json_path, 'w') as json_file:
+            json.dump(audio_predictions, json_file)
+        ps.write_predictions_store(audio_predictions, store_dir)
+        del audio_predictions
+
+        timings = {}
+        timings['legacy (JSON)'], legacy_dfs = time_call(partial(load_legacy, json_path, genres), repeat)
+        timings['vectorized (JSON)'], json_dfs = time_call(partial(load_vectorized, json_path=json_path), repeat)
+        timings['vectorized (store)'], store_dfs = time_call(partial(load_vectorized, store_dir=store_dir), repeat)
+
+    equivalent = check_equivalent(*json_dfs, *legacy_dfs) and check_equivalent(*store_dfs, *legacy_dfs)
+
+    return timings, equivalent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the predictions loaders of the descriptor queries app.')
+    parser.add_argument('--tracks', type=int, default=BENCHMARK_TRACKS,
+                        help=f'number of synthetic tracks (default: {BENCHMARK_TRACKS})')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT,
+                        help=f'number of timed calls of every loader (default: {BENCHMARK_REPEAT})')
+    args = parser.parse_args()
+
+    timings, equivalent = run_benchmark(args.tracks, args.repeat)
+    baseline = timings['legacy (JSON)']
+    for name, seconds in timings.items():
+        print(f'{name:<25}{seconds:>10.3f} s{baseline / seconds:>10.1f}x')
+    print('Loaders agree' if equivalent else 'Loaders DISAGREE with the legacy ones')
+
+
+if __name__ == '__main__':
+    main()
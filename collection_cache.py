@@ -0,0 +1,128 @@
+import os
+import threading
+import descriptor_queries_utils as dqu
+import similarities_utils as su
+
+
+# loaded collections shared by every session of the app server: name -> (file signature, collection)
+_COLLECTIONS = {}
+_LOCK = threading.Lock()
+
+
+def file_signature(paths):
+    """
+    Get the modification time and size of every file a collection is loaded from.
+
+    Parameters:
+        paths (list): The files and store directories (whose files are listed) to watch.
+
+    Returns:
+        tuple: One (path, modification time in ns, size, inode) tuple per existing file, sorted by path. A
+            store directory that is swapped in or a file that is rewritten changes the signature.
+    """
+    signature = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames = [os.path.join(path, filename) for filename in os.listdir(path)]
+        else:
+            filenames = [path]
+
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            signature.append((filename, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+
+    return tuple(sorted(signature))
+
+
+def get_collection(name, paths, load_function):
+    """
+    Get a loaded collection, loading it again only if one of its files changed since it was last loaded.
+
+    Streamlit reruns an app script on every widget interaction but keeps imported modules, so the collection
+    is loaded once per server process and shared by all sessions. The signature is taken before loading, so a
+    file changed during a load makes the next call load again.
+
+    Parameters:
+        name (str): The name of the collection.
+        paths (list): The files and store directories the collection is loaded from.
+        load_function (callable): The function loading the collection, called without arguments.
+
+    Returns:
+        object: The collection returned by load_function. It is shared, so callers must not modify it.
+    """
+    signature = file_signature(paths)
+
+    # one lock for every collection, so that concurrent sessions wait for a single load
+    with _LOCK:
+        entry = _COLLECTIONS.get(name)
+        if entry is None or entry[0] != signature:
+            # free the stale collection before loading the new one
+            _COLLECTIONS.pop(name, None)
+            _COLLECTIONS[name] = (signature, load_function())
+
+        return _COLLECTIONS[name][1]
+
+
+def clear_collections():
+    """
+    Drop every loaded collection.
+
+    Returns:
+        None
+    """
+    with _LOCK:
+        _COLLECTIONS.clear()
+
+
+def load_descriptor_collection():
+    """
+    Load the style activations and the other predictions of the descriptor queries app from disk.
+
+    Returns:
+        tuple: The DataFrames of descriptor_queries_utils.load_genres and load_activations.
+    """
+    predictions = dqu.load_predictions()
+
+    return dqu.load_genres(predictions), dqu.load_activations(predictions)
+
+
+def load_similarity_collection():
+    """
+    Load the mean embeddings of the similarities app from disk and compute the dot products of every model.
+
+    Returns:
+        tuple: The DataFrame of similarities_utils.load_embeddings and a dictionary mapping every embedding
+            model to its DataFrame of dot products.
+    """
+    audio_embeddings = su.load_embeddings()
+    dot_products = {model: su.compute_dot_products(audio_embeddings, model) for model in audio_embeddings.columns}
+
+    return audio_embeddings, dot_products
+
+
+def get_descriptor_collection():
+    """
+    Get the style activations and the other predictions of the descriptor queries app.
+
+    Returns:
+        tuple: The DataFrames of descriptor_queries_utils.load_genres and load_activations.
+    """
+    paths = [dqu.ESSENTIA_ANALYSIS_STORE_DIR, dqu.ESSENTIA_ANALYSIS_PATH, dqu.DISCOGS_METADATA_PATH]
+
+    return get_collection('descriptors', paths, load_descriptor_collection)
+
+
+def get_similarity_collection():
+    """
+    Get the mean embeddings and the track x track dot products of every model for the similarities app.
+
+    Returns:
+        tuple: The DataFrame of similarities_utils.load_embeddings and a dictionary mapping every embedding
+            model to its DataFrame of dot products (see similarities_utils.compute_dot_products).
+    """
+    paths = [su.ESSENTIA_EMBEDDINGS_STORE_DIR, su.ESSENTIA_EMBEDDINGS_PATH]
+
+    return get_collection('similarities', paths, load_similarity_collection)
@@ -0,0 +1,185 @@
+import re
+import json
+import numpy as np
+
+
+# characters read at a time by the streaming reader
+READ_CHUNK_SIZE = 1 << 20
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_CHARS = re.compile(r'[0-9eE.+\-]*')
+
+
+def load_audio_predictions(filename):
+    """
+    Load audio predictions from a JSON file.
+
+    Parameters:
+        filename (str): The path to the JSON file containing audio predictions.
+
+    Returns:
+        dict: A dictionary containing audio predictions.
+    """
+    with open(filename, "r") as f:
+        audio_predictions = json.load(f)
+
+    return audio_predictions
+
+
+def load_discogs_music_genres(filename):
+    """
+    Load music genres from a JSON file.
+
+    Parameters:
+        filename (str): The path to the JSON file containing music genres.
+
+    Returns:
+        list: A list of music genres.
+    """
+    with open(filename, "r") as f:
+        discogs_metadata = json.load(f)
+
+    return discogs_metadata['classes']
+
+
+class JsonObjectReader:
+    """
+    Incremental reader of the members of a top-level JSON object, e.g. the tracks of a predictions file.
+
+    Only the text of the member being decoded is kept in memory. A member that does not fit in the buffer is
+    retried after reading as much text again as is pending, so that decoding a large member stays linear in
+    its size, and the buffer is then filled to the size of the largest value so far before decoding, so that
+    the members of a file of similar tracks are decoded in one go.
+    """
+
+    def __init__(self, f, chunk_size=READ_CHUNK_SIZE):
+        self.file = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.largest = 0
+
+    def fill(self):
+        """
+        Drop the decoded text and read more of the file.
+
+        Returns:
+            bool: False if the file was already read to the end.
+        """
+        if self.eof:
+            return False
+
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.position))
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        self.eof = not chunk
+
+        return not self.eof
+
+    def peek(self):
+        """
+        Skip whitespace and get the next character without consuming it.
+
+        Returns:
+            str: The character, or '' at the end of the file.
+        """
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """
+        Consume the next character, which must be one of `chars`.
+
+        Parameters:
+            chars (str): The allowed characters.
+
+        Returns:
+            str: The character.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f'Expecting one of {chars!r}', self.buffer, self.position)
+        self.position += 1
+
+        return char
+
+    def decode(self):
+        """
+        Skip whitespace and decode the next JSON value, reading more of the file until it is complete.
+
+        Returns:
+            object: The decoded value.
+        """
+        if not self.peek():
+            raise json.JSONDecodeError('Expecting value', self.buffer, self.position)
+        while len(self.buffer) - self.position < self.largest and self.fill():
+            pass
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number cut by the end of the buffer decodes as a shorter number (e.g. '1e' as 1)
+                if (self.eof or not isinstance(value, (int, float))
+                        or NUMBER_CHARS.match(self.buffer, end).end() < len(self.buffer)):
+                    self.largest = max(self.largest, end - self.position)
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def members(self):
+        """
+        Decode the members of the object one at a time.
+
+        Yields:
+            tuple: The key and the value of every member, in file order.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            return
+
+        while True:
+            key = self.decode()
+            self.expect(':')
+            yield key, self.decode()
+            if self.expect(',}') == '}':
+                return
+
+
+def iter_audio_predictions(filename, chunk_size=READ_CHUNK_SIZE):
+    """
+    Read audio predictions from a JSON file one track at a time.
+
+    Parameters:
+        filename (str): The path to the JSON file containing audio predictions.
+        chunk_size (int): The number of characters read at a time.
+
+    Yields:
+        tuple: Every track and its predictions dictionary, in file order.
+    """
+    with open(filename, "r") as f:
+        yield from JsonObjectReader(f, chunk_size).members()
+
+
+def iter_audio_embeddings(filename, chunk_size=READ_CHUNK_SIZE):
+    """
+    Read audio embeddings from a JSON file one track at a time, with memory proportional to one track.
+
+    Parameters:
+        filename (str): The path to the JSON file containing audio embeddings.
+        chunk_size (int): The number of characters read at a time.
+
+    Yields:
+        tuple: Every track and a dictionary mapping every model to its (frames x dim) float32 embeddings
+            (None where missing), in file order.
+    """
+    for track, embeddings in iter_audio_predictions(filename, chunk_size):
+        yield track, {model: None if frames is None else np.asarray(frames, dtype=np.float32)
+                      for model, frames in embeddings.items()}
@@ -3,7 +3,7 @@ import uuid
 import random
 import streamlit as st
 import pandas as pd
-import descriptor_queries_utils as dqu
+import collection_cache as cc
 
 
 m3u_filepaths_dir = 'playlists/descriptor_playlists/'
@@ -25,8 +25,8 @@ show_key_scale = st.sidebar.checkbox("Key/Scale")
 st.write('# 📀 Playlist Generator 📀')
 st.write('## ⬅️ Use the sidebar to select the features you want to generate your playlists with!')
 st.write(f'Using analysis data from `{ESSENTIA_ANALYSIS_PATH}`.')
-audio_genres = dqu.load_genres()
-audio_activations = dqu.load_activations()
+# loaded once per server process and again only when the predictions change
+audio_genres, audio_activations = cc.get_descriptor_collection()
 audio_analysis_styles = audio_genres.columns
 st.write('Loaded audio analysis for', len(audio_genres), 'tracks.')
 
@@ -86,7 +86,7 @@ if show_key_scale:
     st.write('## 🎼 Key and Scale')
 
     # get key and scale from user
-    keys = sorted(audio_activations['key'].apply(lambda x: x[0]).unique())
+    keys = sorted(audio_activations['key'].dropna().unique())
     selected_key = st.selectbox("Select key:", keys)
     selected_scale = st.radio("Select scale:", ('major', 'minor'))
 
@@ -134,7 +134,7 @@ if st.button('RUN'):
     if show_vocal_instrumental:
         prev_result = audio_activations.loc[mp3s]
 
-        voice_scores = prev_result['voice_or_instrument'].apply(lambda x: x[1])
+        voice_scores = prev_result['vocal']
         if with_vocals:
             mp3s = list(voice_scores[voice_scores > 0.5].index)
         else:
@@ -143,7 +143,7 @@ if st.button('RUN'):
     # get tracks within given danceability range (using danceable activation)
     if show_danceability:
         prev_result = audio_activations.loc[mp3s]
-        danceability_scores = prev_result['danceability'].apply(lambda x: x[0])
+        danceability_scores = prev_result['danceability']
 
         current_result = danceability_scores[(danceability_scores >= min_dance_selected) & (danceability_scores <= max_dance_selected)]
         mp3s = list(current_result.index) 
@@ -152,8 +152,8 @@ if st.button('RUN'):
     if show_arousal_valence:
         prev_result = audio_activations.loc[mp3s]
 
-        valence = prev_result['arousal_and_valence'].apply(lambda x: x[0])
-        arousal = prev_result['arousal_and_valence'].apply(lambda x: x[1]) 
+        valence = prev_result['valence']
+        arousal = prev_result['arousal']
 
         current_result = prev_result[(valence >= min_valence_selected) & (valence <= max_valence_selected) & 
                  (arousal >= min_arousal_selected) & (arousal <= max_arousal_selected)]  
@@ -162,7 +162,7 @@ if st.button('RUN'):
     # get tracks of a given key and scale
     if show_key_scale:
         prev_result = audio_activations.loc[mp3s]
-        key_scale = prev_result['key'].apply(lambda x: x[0] == selected_key and x[1] == selected_scale)
+        key_scale = (prev_result['key'] == selected_key) & (prev_result['scale'] == selected_scale)
 
         current_result = prev_result[key_scale]
         mp3s = list(current_result.index)
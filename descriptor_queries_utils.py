@@ -1,42 +1,71 @@
+import os
+import numpy as np
 import pandas as pd
-import music_collection_overview as mco
+import collection_io as cio
+import predictions_store as ps
 
 
 ESSENTIA_ANALYSIS_PATH = 'predictions/audio_predictions.json'
+ESSENTIA_ANALYSIS_STORE_DIR = 'predictions/audio_predictions'
 DISCOGS_METADATA_PATH = 'metadata/discogs-effnet-bs64-1.json'
+# use the edma profile because it has the most even distributions
+KEY_PROFILE = 'edma'
 
 
-def load_genres():
+def load_predictions():
+    """
+    Loads the predictions of every track as columns.
+
+    Reads the columnar predictions store when it exists and falls back to the predictions JSON file.
+
+    Returns:
+        predictions_store.PredictionsStore: The predictions.
+    """
+    if os.path.isdir(ESSENTIA_ANALYSIS_STORE_DIR):
+        return ps.PredictionsStore(ESSENTIA_ANALYSIS_STORE_DIR)
+
+    return ps.build_predictions_store(cio.load_audio_predictions(ESSENTIA_ANALYSIS_PATH))
+
+
+def load_genres(predictions=None):
     """
     Loads audio predictions and corresponding music genres.
-    
+
+    Parameters:
+        predictions (predictions_store.PredictionsStore): The predictions, or None to load them.
+
     Returns:
-        pandas.DataFrame: DataFrame containing audio genres.
+        pandas.DataFrame: DataFrame containing the float32 style activations, one row per track and one column
+            per genre.
     """
-    audio_predictions = mco.load_audio_predictions(ESSENTIA_ANALYSIS_PATH)
-    genres = mco.load_discogs_music_genres(DISCOGS_METADATA_PATH)
-    audio_genres = {}
-    
-    for audio in audio_predictions:
-        genre_activations = audio_predictions[audio]['music_styles']
-        audio_genres[audio] = dict(zip(genres, genre_activations))
+    if predictions is None:
+        predictions = load_predictions()
+    genres = cio.load_discogs_music_genres(DISCOGS_METADATA_PATH)
 
-    return pd.DataFrame(audio_genres).T
+    return pd.DataFrame(np.asarray(predictions.styles()), index=predictions.tracks,
+                        columns=genres[:predictions.style_count])
 
 
-def load_activations():
+def load_activations(predictions=None):
     """
     Loads audio predictions and extracts key activations.
-    
+
+    Parameters:
+        predictions (predictions_store.PredictionsStore): The predictions, or None to load them.
+
     Returns:
-        pandas.DataFrame: DataFrame containing key activations.
+        pandas.DataFrame: DataFrame containing one float32 column per scalar prediction (tempo, loudness, vocal,
+            danceability, valence and arousal) and the categorical key and scale of the KEY_PROFILE profile.
     """
-    audio_predictions = mco.load_audio_predictions(ESSENTIA_ANALYSIS_PATH)
-    df = pd.DataFrame(audio_predictions).T
+    if predictions is None:
+        predictions = load_predictions()
+
+    df = pd.DataFrame({column: predictions.column(column) for column in predictions.columns},
+                      index=predictions.tracks)
 
-    # use the edma profile because it has the most even distributions
-    edma = df['key'].apply(lambda x: x.get('edma'))
-    df['key'] = edma
-    df.drop(columns=['music_styles'], inplace=True)
+    key_codes, scale_codes = (predictions.key_codes(KEY_PROFILE) if KEY_PROFILE in predictions.key_profiles
+                              else (np.full(len(df), ps.MISSING_CODE), np.full(len(df), ps.MISSING_CODE)))
+    df['key'] = pd.Categorical.from_codes(key_codes, categories=predictions.key_labels)
+    df['scale'] = pd.Categorical.from_codes(scale_codes, categories=predictions.scale_labels)
 
-    return df
\ No newline at end of file
+    return df
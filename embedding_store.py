@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import collection_io as cio
+
+
+STORE_VERSION = 1
+HEADER_FILENAME = 'header.json'
+
+
+def swap_in_dir(tmp_dir, store_dir):
+    """
+    Atomically replace a store directory with a freshly written one.
+
+    Parameters:
+        tmp_dir (str): The directory holding the new store.
+        store_dir (str): The directory of the store to replace.
+
+    Returns:
+        None
+    """
+    # readers that still have the old files mapped keep them until they close them
+    old_dir = store_dir + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(store_dir):
+        os.rename(store_dir, old_dir)
+    os.rename(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class EmbeddingStoreWriter:
+    """
+    Writer of a binary embedding store, one track at a time.
+
+    The store is a directory holding, for every model, the frame embeddings of all tracks as one contiguous
+    float32 file (`<model>.f32`) and an int64 offsets index (`<model>.offsets.npy`) where the frames of track i
+    are the rows offsets[i]:offsets[i + 1]. A small `header.json` lists the tracks and the shape of every model.
+    The store is written to a temporary directory and swapped in on close.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.tmp_dir = store_dir + '.tmp'
+        self.tracks = []
+        self.models = {}
+
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+
+    def add(self, track, embeddings):
+        """
+        Append the frame embeddings of one track.
+
+        Parameters:
+            track (str): The path to the audio file.
+            embeddings (dict): A dictionary mapping model names to frame embedding matrices (or None if missing).
+
+        Returns:
+            None
+        """
+        for model, frames in embeddings.items():
+            if model not in self.models:
+                self.models[model] = {
+                    'file': open(os.path.join(self.tmp_dir, model + '.f32'), 'wb'),
+                    'offsets': [0] * (len(self.tracks) + 1),
+                    'dim': 0,
+                }
+
+        self.tracks.append(track)
+        for model, entry in self.models.items():
+            frames = embeddings.get(model)
+            rows = 0
+
+            if frames is not None and len(frames) > 0:
+                frames = np.ascontiguousarray(frames, dtype=np.float32)
+                if entry['dim'] == 0:
+                    entry['dim'] = frames.shape[1]
+                entry['file'].write(frames.tobytes())
+                rows = frames.shape[0]
+
+            entry['offsets'].append(entry['offsets'][-1] + rows)
+
+    def close(self):
+        """
+        Write the offsets and the header and atomically replace the store directory.
+
+        Returns:
+            None
+        """
+        header = {'version': STORE_VERSION, 'tracks': self.tracks, 'models': {}}
+
+        for model, entry in self.models.items():
+            entry['file'].close()
+            np.save(os.path.join(self.tmp_dir, model + '.offsets.npy'), np.array(entry['offsets'], dtype=np.int64))
+            header['models'][model] = {'dim': entry['dim'], 'dtype': 'float32', 'rows': entry['offsets'][-1]}
+
+        with open(os.path.join(self.tmp_dir, HEADER_FILENAME), 'w') as f:
+            json.dump(header, f)
+
+        swap_in_dir(self.tmp_dir, self.store_dir)
+
+    def abort(self):
+        """
+        Discard everything written so far and leave the existing store untouched.
+
+        Returns:
+            None
+        """
+        for entry in self.models.values():
+            entry['file'].close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class EmbeddingStore:
+    """
+    Read-only, memory-mapped view of a binary embedding store.
+    """
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, HEADER_FILENAME), 'r') as f:
+            header = json.load(f)
+
+        self.store_dir = store_dir
+        self.tracks = header['tracks']
+        self.track_index = {track: i for i, track in enumerate(self.tracks)}
+        self.models = header['models']
+        self._frames = {}
+        self._offsets = {}
+
+    def frames(self, model):
+        """
+        Get the memory-mapped frame matrix of every track for a model.
+
+        Parameters:
+            model (str): The model name (e.g. 'discogs_embeddings').
+
+        Returns:
+            numpy.ndarray: A (total frames x dim) float32 memory map.
+        """
+        if model not in self._frames:
+            info = self.models[model]
+            shape = (info['rows'], info['dim'])
+            if info['rows'] == 0:
+                self._frames[model] = np.zeros(shape, dtype=np.float32)
+            else:
+                self._frames[model] = np.memmap(os.path.join(self.store_dir, model + '.f32'),
+                                                dtype=np.float32, mode='r', shape=shape)
+
+        return self._frames[model]
+
+    def offsets(self, model):
+        """
+        Get the offsets index of a model, where the frames of track i are rows offsets[i]:offsets[i + 1].
+
+        Parameters:
+            model (str): The model name.
+
+        Returns:
+            numpy.ndarray: An int64 array with one entry per track plus one.
+        """
+        if model not in self._offsets:
+            self._offsets[model] = np.load(os.path.join(self.store_dir, model + '.offsets.npy'))
+
+        return self._offsets[model]
+
+    def get(self, track, model):
+        """
+        Get the frame embeddings of one track without reading the rest of the store.
+
+        Parameters:
+            track (str): The path to the audio file.
+            model (str): The model name.
+
+        Returns:
+            numpy.ndarray: A (frames x dim) float32 view into the memory map (empty if the track has no frames).
+        """
+        i = self.track_index[track]
+        offsets = self.offsets(model)
+
+        return self.frames(model)[offsets[i]:offsets[i + 1]]
+
+    def mean_embeddings(self, model):
+        """
+        Average the frame embeddings of every track for a model.
+
+        Parameters:
+            model (str): The model name.
+
+        Returns:
+            tuple: The list of tracks that have frames, and a (tracks x dim) float32 matrix of their mean embeddings.
+        """
+        offsets = self.offsets(model)
+        frames = self.frames(model)
+        tracks = []
+        means = []
+
+        for i, track in enumerate(self.tracks):
+            if offsets[i + 1] > offsets[i]:
+                tracks.append(track)
+                means.append(np.mean(frames[offsets[i]:offsets[i + 1]], axis=0))
+
+        dim = self.models[model]['dim']
+        return tracks, np.array(means, dtype=np.float32).reshape(len(means), dim)
+
+
+def convert_json_embeddings(json_path, store_dir):
+    """
+    Convert a legacy embeddings JSON file into a binary embedding store.
+
+    Parameters:
+        json_path (str): The path to the embeddings JSON file.
+        store_dir (str): The directory to write the store to.
+
+    Returns:
+        None
+    """
+    with EmbeddingStoreWriter(store_dir) as writer:
+        for track, embeddings in cio.iter_audio_embeddings(json_path):
+            writer.add(track, embeddings)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python embedding_store.py <embeddings.json> <store directory>')
+        sys.exit(1)
+
+    convert_json_embeddings(sys.argv[1], sys.argv[2])
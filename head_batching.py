@@ -0,0 +1,186 @@
+import numpy as np
+import audio_analysis as aa
+import instrumentation as im
+
+
+class HeadBatcher:
+    """
+    Runs the classifier heads over embedding frames accumulated from many tracks.
+
+    Each track's embeddings are padded to whole HEAD_BATCH_ROWS blocks (exactly as run_heads does) and queued per
+    head. A head runs as soon as `batch_size` rows are queued for it, and over whatever is left once flush() is
+    called at the end of the run, and the activations are scattered back to their tracks. At most `batch_size`
+    rows per head are thus held back, whatever the pace of the results. Since every block goes through the graph
+    unchanged, the results are identical to predicting each track on its own.
+    """
+
+    def __init__(self, batch_size=4096):
+        self.batch_size = max(aa.HEAD_BATCH_ROWS, batch_size // aa.HEAD_BATCH_ROWS * aa.HEAD_BATCH_ROWS)
+
+        # track -> [embeddings, predictions, number of heads still running]
+        self.tracks = {}
+        # head -> list of [track, padded block, first row not yet run, number of real frames]
+        self.queues = {head: [] for head in aa.CLASSIFIER_HEADS}
+        self.queued_rows = {head: 0 for head in aa.CLASSIFIER_HEADS}
+        # (track, head) -> list of activation blocks received so far
+        self.activations = {}
+
+    def add(self, track, embeddings, predictions, head_inputs):
+        """
+        Queue the embeddings of one track for all of its pending heads.
+
+        Parameters:
+            track (str): The path to the audio file.
+            embeddings (dict): The embeddings computed for the track.
+            predictions (dict): The predictions computed for the track so far.
+            head_inputs (dict): A dictionary mapping each embedding model to a tuple of its embeddings and the
+                heads still to run on them (as returned by extract_track_features).
+
+        Returns:
+            list: Tuples of track, embeddings and predictions for every track whose heads are now all done.
+        """
+        self.tracks[track] = [embeddings, predictions, 0]
+        completed = []
+
+        for source_embeddings, heads in head_inputs.values():
+            if source_embeddings is None or len(source_embeddings) == 0:
+                print(f"Error in HeadBatcher: no embeddings for {', '.join(heads)}")
+                predictions.update({head: None for head in heads})
+                continue
+
+            block = aa.pad_to_head_batches(source_embeddings)
+            for head in heads:
+                self.tracks[track][2] += 1
+                self.activations[(track, head)] = []
+                self.queues[head].append([track, block, 0, len(source_embeddings)])
+                self.queued_rows[head] += len(block)
+
+        if self.tracks[track][2] == 0:
+            completed.append(self.complete(track))
+
+        for head in self.queues:
+            while self.queued_rows[head] >= self.batch_size:
+                completed += self.run(head, self.batch_size)
+
+        return completed
+
+    def flush(self):
+        """
+        Run every head over everything still queued.
+
+        Returns:
+            list: Tuples of track, embeddings and predictions for every remaining track.
+        """
+        completed = []
+        for head in self.queues:
+            if self.queued_rows[head]:
+                completed += self.run(head, self.queued_rows[head])
+
+        return completed
+
+    def run(self, head, rows):
+        """
+        Run a head over the first `rows` queued rows and scatter the activations back to their tracks.
+
+        Parameters:
+            head (str): The name of the head in CLASSIFIER_HEADS.
+            rows (int): The number of rows to run, a multiple of HEAD_BATCH_ROWS.
+
+        Returns:
+            list: Tuples of track, embeddings and predictions for every track whose heads are now all done.
+        """
+        queue = self.queues[head]
+        parts = []
+        taken = 0
+
+        # take whole blocks from the front of the queue, splitting the last one at a block boundary
+        while taken < rows:
+            entry = queue[0]
+            track, block, start, _ = entry
+            end = min(len(block), start + rows - taken)
+            parts.append((entry, start, end))
+            taken += end - start
+
+            if end == len(block):
+                queue.pop(0)
+            else:
+                entry[2] = end
+
+        self.queued_rows[head] -= taken
+
+        try:
+            batch = np.concatenate([entry[1][start:end] for entry, start, end in parts])
+            with im.stage('batched_' + head):
+                batch_activations = aa.predict_head(head, batch)
+        except Exception as e:
+            print(f"Error in HeadBatcher ({head}): {e}")
+            batch_activations = None
+
+        completed = []
+        offset = 0
+        for entry, start, end in parts:
+            track, block, _, frames = entry
+            received = self.activations[(track, head)]
+            if batch_activations is None or received is None:
+                self.activations[(track, head)] = None
+            else:
+                received.append(batch_activations[offset:offset + end - start])
+            offset += end - start
+
+            if end == len(block):
+                completed += self.finish_head(track, head, frames)
+
+        return completed
+
+    def finish_head(self, track, head, frames):
+        """
+        Average the activations of a head once all of a track's rows have been run.
+
+        Parameters:
+            track (str): The path to the audio file.
+            head (str): The name of the head in CLASSIFIER_HEADS.
+            frames (int): The number of real (unpadded) frames of the track.
+
+        Returns:
+            list: The completed track, if this was its last pending head.
+        """
+        received = self.activations.pop((track, head))
+        predictions = self.tracks[track][1]
+        predictions[head] = None if received is None else np.mean(np.concatenate(received)[:frames], axis=0)
+
+        self.tracks[track][2] -= 1
+        if self.tracks[track][2] == 0:
+            return [self.complete(track)]
+
+        return []
+
+    def complete(self, track):
+        """
+        Release a track whose heads are all done.
+
+        Parameters:
+            track (str): The path to the audio file.
+
+        Returns:
+            tuple: The track, its embeddings and its predictions.
+        """
+        embeddings, predictions, _ = self.tracks.pop(track)
+
+        return track, embeddings, predictions
+
+
+def batch_heads(results, batcher):
+    """
+    Run the deferred classifier heads of a stream of analysis results through a HeadBatcher.
+
+    Parameters:
+        results (iterable): Tuples of a track, its embeddings, its predictions and its head inputs.
+        batcher (HeadBatcher): The batcher to run the heads with.
+
+    Yields:
+        tuple: A tuple containing the track, its embeddings and its complete predictions, as the heads finish.
+    """
+    for track, embeddings, predictions, head_inputs in results:
+        yield from batcher.add(track, embeddings, predictions, head_inputs)
+
+    yield from batcher.flush()
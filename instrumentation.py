@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import contextlib
+import numpy as np
+
+
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+STATUS_PATH = '/proc/self/status'
+# written to clear_refs, resets the peak RSS (VmHWM) of the process to its current RSS (Linux 4.0+)
+RESET_PEAK_RSS = '5'
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# trace file of this process, or None while instrumentation is disabled
+_trace_path = None
+# stage name -> measurements accumulated for the current track (see end_track)
+_stages = {}
+# the highest RSS in MB seen so far by every stage that is running, outermost first
+_open_peaks = []
+# whether the peak RSS of this process can be reset, so that every stage gets its own
+_resettable_peak = False
+_disabled_stage = contextlib.nullcontext()
+
+
+def configure(trace_path):
+    """
+    Enable or disable the instrumentation of this process.
+
+    Parameters:
+        trace_path (str): The JSONL trace file to append to, or None to disable the instrumentation.
+
+    Returns:
+        None
+    """
+    global _trace_path, _resettable_peak
+    _trace_path = trace_path
+    _stages.clear()
+    _open_peaks.clear()
+    _resettable_peak = trace_path is not None and reset_peak_rss()
+
+
+def enabled():
+    """
+    Tell whether the instrumentation of this process is enabled.
+
+    Returns:
+        bool: True if stages are being measured.
+    """
+    return _trace_path is not None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of this process to its current RSS.
+
+    Returns:
+        bool: False where the platform does not allow it.
+    """
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as clear_refs_file:
+            clear_refs_file.write(RESET_PEAK_RSS)
+    except OSError:
+        return False
+
+    return True
+
+
+def status_rss_mb():
+    """
+    Read the current and the peak resident set size of this process since the last reset.
+
+    Returns:
+        tuple: The RSS and the peak RSS in MB.
+    """
+    values = {}
+    with open(STATUS_PATH, 'r') as status_file:
+        for line in status_file:
+            if line.startswith(('VmRSS:', 'VmHWM:')):
+                values[line[:5]] = int(line.split()[1]) / 1024
+
+    return values['VmRSS'], values['VmHWM']
+
+
+def process_rss_mb(pid):
+    """
+    Get the current resident set size of a process, this one or another.
+
+    Parameters:
+        pid (int): The process ID.
+
+    Returns:
+        float: The RSS in MB, or None where the platform does not report it (or the process is gone).
+    """
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as statm_file:
+            return int(statm_file.read().split()[1]) * PAGE_SIZE / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def stage(name):
+    """
+    Measure a stage of the analysis of the current track.
+
+    Repeated stages of the same track add up their times. When the instrumentation is disabled this returns a
+    shared no-op context manager, so instrumented code pays nothing but the call.
+
+    Parameters:
+        name (str): The name of the stage (e.g. 'decode_mono', 'tempo', 'embeddings_discogs').
+
+    Returns:
+        contextlib.AbstractContextManager: A context manager timing the code it wraps.
+    """
+    if _trace_path is None:
+        return _disabled_stage
+
+    return _measure(name)
+
+
+@contextlib.contextmanager
+def _measure(name):
+    # the peak since the last reset belongs to every running stage, whose peaks are kept before resetting it
+    if _resettable_peak:
+        start_rss, peak_rss = status_rss_mb()
+        _open_peaks[:] = [max(peak, peak_rss) for peak in _open_peaks]
+        reset_peak_rss()
+        _open_peaks.append(start_rss)
+    else:
+        start_rss = process_rss_mb(os.getpid())
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        if _resettable_peak:
+            _, peak_rss = status_rss_mb()
+            _open_peaks[:] = [max(peak, peak_rss) for peak in _open_peaks]
+            memory = {'peak_rss_mb': _open_peaks.pop()}
+            growth = memory['peak_rss_mb'] - start_rss
+        else:
+            memory = {'end_rss_mb': process_rss_mb(os.getpid())}
+            growth = None if start_rss is None or memory['end_rss_mb'] is None else memory['end_rss_mb'] - start_rss
+
+        # repeated stages of a track add up their times and keep their largest growth and peak
+        measured = _stages.setdefault(name, {'wall': 0., 'cpu': 0., 'rss_growth_mb': None})
+        measured['wall'] += wall
+        measured['cpu'] += cpu
+        if growth is not None and (measured['rss_growth_mb'] is None or growth > measured['rss_growth_mb']):
+            measured['rss_growth_mb'] = growth
+        if 'peak_rss_mb' in memory:
+            measured['peak_rss_mb'] = max(memory['peak_rss_mb'], measured.get('peak_rss_mb', 0.))
+        else:
+            measured.update(memory)
+
+
+def end_track(track, audio_seconds=None):
+    """
+    Append the stages measured since the previous call to the trace, as one line for the given track.
+
+    Every stage has its wall and CPU seconds and `rss_growth_mb`, the growth of the RSS during the stage in MB:
+    up to its own peak RSS `peak_rss_mb` where the peak RSS of the process can be reset (Linux), or else up to
+    the RSS at its end `end_rss_mb`. Repeated stages keep their largest growth and peak.
+
+    Parameters:
+        track (str): The path to the audio file, or None for stages that belong to the whole run.
+        audio_seconds (float): The duration of the track in seconds.
+
+    Returns:
+        None
+    """
+    if _trace_path is None or not _stages:
+        return
+
+    record = {
+        'track': track,
+        'pid': os.getpid(),
+        'audio_seconds': audio_seconds,
+        'stages': {name: dict(measured) for name, measured in _stages.items()},
+    }
+    _stages.clear()
+
+    # one write per line on an append-only descriptor, so that processes sharing the trace do not interleave
+    fd = os.open(_trace_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + '\n').encode())
+    finally:
+        os.close(fd)
+
+
+def summarize(trace_path, run_wall_seconds):
+    """
+    Summarize a trace into per-stage statistics and overall throughput.
+
+    Parameters:
+        trace_path (str): The JSONL trace file.
+        run_wall_seconds (float): The wall time of the whole run.
+
+    Returns:
+        tuple: A list of per-stage rows (stage, count, p50 wall, p95 wall, total wall, total CPU, largest RSS
+            growth during the stage, largest peak RSS of the stage itself or None where it was not measured),
+            the number of tracks, the tracks per second and the audio seconds per wall second.
+    """
+    stages = {}
+    tracks = set()
+    audio_seconds = 0.
+
+    # a track can have a line from the worker that analyzed it and one from the main process that stored it
+    with open(trace_path, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            if record['track'] is not None:
+                tracks.add(record['track'])
+            audio_seconds += record['audio_seconds'] or 0.
+            for name, measured in record['stages'].items():
+                stages.setdefault(name, []).append(measured)
+
+    rows = []
+    for name, measurements in stages.items():
+        walls = np.array([measured['wall'] for measured in measurements])
+        growths = [measured['rss_growth_mb'] for measured in measurements if measured.get('rss_growth_mb') is not None]
+        peaks = [measured['peak_rss_mb'] for measured in measurements if measured.get('peak_rss_mb') is not None]
+        rows.append((name, len(measurements), np.percentile(walls, 50), np.percentile(walls, 95), walls.sum(),
+                     sum(measured['cpu'] for measured in measurements), max(growths) if growths else None,
+                     max(peaks) if peaks else None))
+
+    rows.sort(key=lambda row: row[4], reverse=True)
+
+    return rows, len(tracks), len(tracks) / run_wall_seconds, audio_seconds / run_wall_seconds
+
+
+def print_summary(trace_path, run_wall_seconds):
+    """
+    Print the end-of-run summary table of a trace.
+
+    Parameters:
+        trace_path (str): The JSONL trace file.
+        run_wall_seconds (float): The wall time of the whole run.
+
+    Returns:
+        None
+    """
+    rows, tracks, tracks_per_second, audio_per_second = summarize(trace_path, run_wall_seconds)
+
+    # the stage peak is only measured where the peak RSS can be reset; elsewhere the growth is from start to end
+    print(f"{'stage':<28}{'count':>7}{'p50 s':>10}{'p95 s':>10}{'total s':>10}{'cpu s':>10}{'+MB':>10}"
+          f"{'stage peak MB':>15}")
+    for name, count, p50, p95, total, cpu, growth, peak in rows:
+        growth = f'{growth:+.0f}' if growth is not None else '-'
+        peak = f'{peak:.0f}' if peak is not None else '-'
+        print(f'{name:<28}{count:>7}{p50:>10.3f}{p95:>10.3f}{total:>10.1f}{cpu:>10.1f}{growth:>10}{peak:>15}')
+
+    print(f'{tracks} tracks in {run_wall_seconds:.1f} s: {tracks_per_second:.2f} tracks/s, '
+          f'{audio_per_second:.1f} audio seconds per wall second')
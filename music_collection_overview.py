@@ -1,42 +1,27 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import json
 import csv
 import os
+import collection_io as cio
 
 
-def load_audio_predictions(filename):
-    """
-    Load audio predictions from a JSON file.
-
-    Parameters:
-        filename (str): The path to the JSON file containing audio predictions.
-
-    Returns:
-        dict: A dictionary containing audio predictions.
-    """
-    with open(filename, "r") as f:
-        audio_predictions = json.load(f)
+# the loaders live in collection_io, which the apps import without the plotting libraries; kept for existing callers
+load_audio_predictions = cio.load_audio_predictions
+load_discogs_music_genres = cio.load_discogs_music_genres
 
-    return audio_predictions
 
-
-def load_discogs_music_genres(filename):
+def import_plotting():
     """
-    Load music genres from a JSON file.
-
-    Parameters:
-        filename (str): The path to the JSON file containing music genres.
+    Import matplotlib's pyplot and seaborn, deferred to the first plot because they take most of the import time.
 
     Returns:
-        list: A list of music genres.
+        tuple: The matplotlib.pyplot and seaborn modules.
     """
-    with open(filename, "r") as f:
-        discogs_metadata = json.load(f)
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-    return discogs_metadata['classes']
+    return plt, sns
 
 
 def get_audio_genres(audio_predictions, genres):
@@ -72,6 +57,8 @@ def plot_genre_distribution(genres, audio_genres, download_dir):
     Returns:
         None
     """
+    plt, sns = import_plotting()
+
     parent_genre_count = {}
     all_genre_count = {}
 
@@ -133,6 +120,8 @@ def plot_tempo_distribution(audio_predictions, download_dir):
     Returns:
         None
     """
+    plt, sns = import_plotting()
+
     tempos = [audio_predictions[audio_file]['tempo'] for audio_file in audio_predictions]
     
     sns.set_style("whitegrid")
@@ -159,6 +148,8 @@ def plot_danceability_distribution(audio_predictions, download_dir):
     Returns:
         None
     """
+    plt, sns = import_plotting()
+
     danceability = [audio_predictions[audio_file]['danceability'][0] for audio_file in audio_predictions]
 
     # calculate percentage of highly danceable tracks
@@ -191,6 +182,8 @@ def plot_key_scale_distribution(audio_predictions, download_dir):
     Returns:
         None
     """
+    plt, sns = import_plotting()
+
     rows = []
     agreement_count = 0  
     total_count = 0  
@@ -241,6 +234,8 @@ def plot_loudness_distribution(audio_predictions, download_dir):
     Returns:
         None
     """
+    plt, sns = import_plotting()
+
     loudness = [audio_predictions[audio_file]['loudness'] for audio_file in audio_predictions]
     
     sns.set_style("whitegrid")
@@ -267,6 +262,8 @@ def plot_valence_vs_arousal(audio_predictions, download_dir):
     Returns:
         None
     """
+    plt, sns = import_plotting()
+
     rows = []
     for audio_file, values in audio_predictions.items():
         arousal_valence = values["arousal_and_valence"]
@@ -297,6 +294,8 @@ def plot_voice_or_instrument_distribution(audio_predictions, download_dir):
     Returns:
         None
     """
+    plt, sns = import_plotting()
+
     danceability = [audio_predictions[audio_file]['voice_or_instrument'][1] for audio_file in audio_predictions]
     
     sns.set_style("whitegrid")
@@ -0,0 +1,325 @@
+import math
+import json
+import time
+import shutil
+import tempfile
+from functools import partial
+import essentia
+import audio_analysis as aa
+import instrumentation as im
+import supervised_pool as sp
+
+
+# workers are replaced after this many tracks, so that memory TensorFlow slowly leaks is given back
+MAX_TASKS_PER_WORKER = 500
+# a track may take this many seconds plus TIMEOUT_PER_AUDIO_SECOND per second of audio before its worker is killed
+TRACK_TIMEOUT = 300
+TIMEOUT_PER_AUDIO_SECOND = 1.
+# resident memory in MB beyond which a worker is killed
+MAX_WORKER_RSS_MB = 8192
+
+
+def init_worker(audio_cache_dir=None, audio_cache_max_bytes=None, trace_path=None, with_models=True):
+    """
+    Prepare a worker process for analysis by silencing essentia warnings and loading every model once.
+
+    Parameters:
+        audio_cache_dir (str): The directory of the decoded audio cache, or None to always decode.
+        audio_cache_max_bytes (int): The size cap of the audio cache.
+        trace_path (str): The JSONL file to trace the analysis stages to, or None to not instrument them.
+        with_models (bool): Whether to load the models, which workers that only decode or run DSP do not need.
+
+    Returns:
+        None
+    """
+    essentia.log.warningActive = False
+    im.configure(trace_path)
+    if audio_cache_dir:
+        aa.configure_audio_cache(audio_cache_dir, audio_cache_max_bytes)
+    if with_models:
+        aa.load_models()
+
+
+def schedule_longest_first(tasks, split_seconds=None):
+    """
+    Order tasks longest track first, so that a long track picked up last does not keep the run going on its own.
+
+    The durations are read from the files' metadata, without decoding them. Tracks longer than `split_seconds`
+    can also be split into segments of at most that length, which are analyzed independently and merged by
+    join_segments.
+
+    Parameters:
+        tasks (iterable): Tuples of an audio file path and the features to compute for it (None for all of them).
+        split_seconds (float): Duration in seconds beyond which tracks are split into segments, or None.
+
+    Returns:
+        list: The tasks, longest first; the task of a segment has a third element, its start and end in seconds
+            (None for the end of the file).
+    """
+    scheduled = []
+    for filename, features in tasks:
+        duration = aa.get_duration(filename)
+        if not split_seconds or duration <= split_seconds:
+            scheduled.append(((filename, features), duration))
+            continue
+
+        count = math.ceil(duration / split_seconds)
+        length = duration / count
+        for i in range(count):
+            segment = (i * length, (i + 1) * length if i < count - 1 else None)
+            scheduled.append(((filename, features, segment), length))
+
+    scheduled.sort(key=lambda item: item[1], reverse=True)
+
+    return [task for task, _ in scheduled]
+
+
+class SegmentJoiner:
+    """
+    Merge the results of the segments of every split track into the result of the whole track.
+
+    The tasks are those returned by schedule_longest_first. A track one of whose segments fails is failed as a
+    whole: the partial results of its other segments are dropped as soon as the failure is reported to fail(),
+    those still to come are discarded, and the task of the whole track is passed on to `on_failure`, once. The
+    decoded audio a merged track's segments shared in `spool_dir` is removed; that of a failed track is left
+    for the caller to remove with the directory, since its other segments may still be reading it.
+    """
+
+    def __init__(self, tasks, defer_heads=False, on_failure=None, spool_dir=None):
+        self.defer_heads = defer_heads
+        self.on_failure = on_failure
+        self.spool_dir = spool_dir
+        # the features and the number of segments of every split track
+        self.split_tracks = {}
+        for task in tasks:
+            if len(task) == 3:
+                features, count = self.split_tracks.get(task[0], (task[1], 0))
+                self.split_tracks[task[0]] = features, count + 1
+        self.arrived = {filename: [] for filename in self.split_tracks}
+        self.failed = set()
+
+    def fail(self, task, reason):
+        """
+        Report a failed task, failing the whole track if it is a segment.
+
+        Parameters:
+            task (tuple): The task of a track or of a segment.
+            reason (str): Why the task failed.
+
+        Returns:
+            None
+        """
+        filename = task[0]
+        if filename not in self.split_tracks:
+            if self.on_failure is not None:
+                self.on_failure(task, reason)
+            return
+
+        if filename in self.failed:
+            return
+        self.failed.add(filename)
+        self.arrived.pop(filename, None)
+        if self.on_failure is not None:
+            self.on_failure((filename, self.split_tracks[filename][0]), reason)
+
+    def join(self, results):
+        """
+        Merge the results of the segments as they arrive.
+
+        Parameters:
+            results (iterable): Results of analyze_file, in any order.
+
+        Yields:
+            tuple: The result of every unsplit track as it arrives, and that of every split track once all its
+                segments have arrived, in the format of analyze_file.
+        """
+        for result in results:
+            filename = result[0]
+            if filename not in self.split_tracks:
+                yield result
+                continue
+            if filename in self.failed:
+                continue
+
+            self.arrived[filename].append(result[1:])
+            features, count = self.split_tracks[filename]
+            if len(self.arrived[filename]) < count:
+                continue
+
+            # the segments are merged in the order they come in the track
+            partials = [partial for _, partial in sorted(self.arrived.pop(filename), key=lambda item: item[0][0])]
+            if self.spool_dir is not None:
+                aa.remove_segment_spool(filename, self.spool_dir)
+            with im.stage('merge_segments'):
+                embeddings, predictions, head_inputs = aa.merge_segment_features(partials, features)
+            if self.defer_heads:
+                yield filename, embeddings, predictions, head_inputs
+            else:
+                predictions.update(aa.predict_heads(head_inputs))
+                yield filename, embeddings, predictions
+
+
+def join_segments(results, tasks, defer_heads=False):
+    """
+    Merge the results of the segments of every split track into the result of the whole track.
+
+    Parameters:
+        results (iterable): Results of analyze_file, in any order.
+        tasks (list): The tasks the results are for, as returned by schedule_longest_first.
+        defer_heads (bool): Whether to leave the classifier heads to the caller, or run them on the merged
+            embeddings.
+
+    Yields:
+        tuple: The result of every unsplit track as it arrives, and that of every split track once all its
+            segments have arrived, in the format of analyze_file.
+    """
+    yield from SegmentJoiner(tasks, defer_heads).join(results)
+
+
+def analyze_segment(task, spool_dir=None):
+    """
+    Analyze one segment of a split track inside a worker process.
+
+    Parameters:
+        task (tuple): The path to the audio file, the features to compute (None for all of them) and the start
+            and end of the segment in seconds (None for the end of the file).
+        spool_dir (str): The directory the segments share the decoded audio of their track in, or None.
+
+    Returns:
+        tuple: A tuple containing the filename, the segment and the partial results of extract_segment_features.
+    """
+    filename, features, segment = task
+    partial_results = aa.extract_segment_features(filename, segment, features, spool_dir)
+
+    if im.enabled():
+        start, end = segment
+        im.end_track(filename, (aa.get_duration(filename) if end is None else end) - start)
+
+    return filename, segment, partial_results
+
+
+def analyze_file(task, streaming_dsp=False, defer_heads=False, chunked_min_duration=None, spool_dir=None):
+    """
+    Analyze a single audio file inside a worker process.
+
+    Parameters:
+        task (tuple): The path to the audio file and the features to compute (None for all of them), or the
+            task of a segment (see schedule_longest_first), which is left to analyze_segment.
+        streaming_dsp (bool): Whether to compute the signal processing features in one streaming pass.
+        defer_heads (bool): Whether to leave the classifier heads to the caller (see head_batching.HeadBatcher).
+        chunked_min_duration (float): Duration in seconds from which tracks are analyzed in chunks, or None.
+        spool_dir (str): The directory the segments of split tracks share their decoded audio in, or None.
+
+    Returns:
+        tuple: A tuple containing the filename, its embeddings dictionary, its predictions dictionary and,
+            if the heads are deferred, the head inputs returned by extract_track_features.
+    """
+    if len(task) == 3:
+        return analyze_segment(task, spool_dir)
+
+    filename, features = task
+    if defer_heads:
+        embeddings, predictions, head_inputs = aa.extract_track_features(filename, features, streaming_dsp=streaming_dsp,
+                                                                         chunked_min_duration=chunked_min_duration)
+        result = filename, embeddings, predictions, head_inputs
+    else:
+        embeddings, predictions = aa.analyze_track(filename, features, streaming_dsp=streaming_dsp,
+                                                   chunked_min_duration=chunked_min_duration)
+        result = filename, embeddings, predictions
+
+    if im.enabled():
+        im.end_track(filename, aa.get_duration(filename))
+
+    return result
+
+
+def task_timeout(task, timeout=TRACK_TIMEOUT, per_audio_second=TIMEOUT_PER_AUDIO_SECOND):
+    """
+    Get the wall time a task may take before its worker is killed, which grows with the length of its audio.
+
+    Parameters:
+        task (tuple): The task of a track or of a segment (see schedule_longest_first).
+        timeout (float): The seconds any task may take.
+        per_audio_second (float): The seconds added per second of audio.
+
+    Returns:
+        float: The timeout in seconds.
+    """
+    duration = aa.get_duration(task[0])
+    if len(task) == 3:
+        start, end = task[2]
+        duration = (duration if end is None else end) - start
+
+    return timeout + per_audio_second * duration
+
+
+def record_failure(failures_path, task, reason):
+    """
+    Append a task whose worker was killed or raised to the failures file.
+
+    Parameters:
+        failures_path (str): The JSONL file of failed tracks, or None to only print the failure.
+        task (tuple): The task of a track or of a segment.
+        reason (str): Why the task failed.
+
+    Returns:
+        None
+    """
+    print(f"Error in analyze_in_parallel: {task[0]} failed: {reason}")
+    if failures_path is None:
+        return
+
+    record = {'track': task[0], 'segment': task[2] if len(task) == 3 else None, 'reason': reason,
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(failures_path, 'a') as failures_file:
+        failures_file.write(json.dumps(record) + '\n')
+
+
+def analyze_in_parallel(tasks, workers, streaming_dsp=False, defer_heads=False, chunked_min_duration=None,
+                        audio_cache_dir=None, audio_cache_max_bytes=None, trace_path=None,
+                        max_tasks_per_worker=MAX_TASKS_PER_WORKER, track_timeout=TRACK_TIMEOUT,
+                        max_worker_rss_mb=MAX_WORKER_RSS_MB, failures_path=None):
+    """
+    Analyze audio files on a pool of worker processes, yielding each result as soon as it is ready.
+
+    The workers are supervised (see supervised_pool.SupervisedPool): a track that takes too long or makes its
+    worker use too much memory has its worker killed and replaced, and is recorded in the failures file
+    instead of stalling the run; a split track one of whose segments fails is recorded as a whole. Every worker
+    is also replaced after `max_tasks_per_worker` tracks. The segments of a split track share one decode of it,
+    spooled to a temporary directory (see audio_analysis.load_segment) that is removed at the end of the run.
+
+    Parameters:
+        tasks (iterable): Tuples of an audio file path and the features to compute for it (None for all of them),
+            dispatched in this order, and possibly segments of split tracks (see schedule_longest_first).
+        workers (int): The number of worker processes.
+        streaming_dsp (bool): Whether to compute the signal processing features in one streaming pass.
+        defer_heads (bool): Whether to leave the classifier heads to the caller (see head_batching.HeadBatcher).
+        chunked_min_duration (float): Duration in seconds from which tracks are analyzed in chunks, or None.
+        audio_cache_dir (str): The directory of the decoded audio cache, or None to always decode.
+        audio_cache_max_bytes (int): The size cap of the audio cache.
+        trace_path (str): The JSONL file to trace the analysis stages to, or None to not instrument them.
+        max_tasks_per_worker (int): The number of tracks after which a worker is replaced, or None.
+        track_timeout (float): The seconds a track may take on top of TIMEOUT_PER_AUDIO_SECOND per second of
+            its audio (see task_timeout), or None for no limit.
+        max_worker_rss_mb (float): The resident memory in MB beyond which a worker is killed, or None.
+        failures_path (str): The JSONL file to append the failed tracks to, or None.
+
+    Yields:
+        tuple: The result of analyze_file for every track, in completion order.
+    """
+    tasks = list(tasks)
+    spool_dir = tempfile.mkdtemp(prefix='segment-spool-') if any(len(task) == 3 for task in tasks) else None
+    analyze = partial(analyze_file, streaming_dsp=streaming_dsp, defer_heads=defer_heads,
+                      chunked_min_duration=chunked_min_duration, spool_dir=spool_dir)
+    pool = sp.SupervisedPool(analyze, workers, initializer=init_worker,
+                             initargs=(audio_cache_dir, audio_cache_max_bytes, trace_path),
+                             max_tasks=max_tasks_per_worker,
+                             timeout=None if track_timeout is None else partial(task_timeout, timeout=track_timeout),
+                             max_rss_mb=max_worker_rss_mb)
+
+    joiner = SegmentJoiner(tasks, defer_heads, on_failure=partial(record_failure, failures_path), spool_dir=spool_dir)
+    try:
+        yield from joiner.join(pool.imap_unordered(tasks, on_failure=joiner.fail))
+    finally:
+        if spool_dir is not None:
+            shutil.rmtree(spool_dir, ignore_errors=True)
@@ -0,0 +1,335 @@
+import queue
+import multiprocessing as mp
+import audio_analysis as aa
+import parallel_analysis as pa
+import instrumentation as im
+import shared_slabs as ss
+
+
+DECODE_WORKERS = 1
+DSP_WORKERS = 1
+# number of decoded tracks that may wait for the inference stage, which bounds the memory of the pipeline
+PREFETCH_TRACKS = 4
+# seconds between checks that every stage is still alive while waiting for results
+STAGE_POLL_SECONDS = 1.0
+
+# the features the inference stage computes from the 16 kHz mono audio; the DSP stage computes the rest
+MODEL_FEATURES = frozenset(aa.EMBEDDING_MODELS) | frozenset(aa.CLASSIFIER_HEADS)
+# descriptor the decode stage sends instead of a slab when a track cannot be decoded
+DECODE_FAILED = 'decode_failed'
+
+
+def decode_stage(tasks, decoded, audio_pool, audio_cache_dir, audio_cache_max_bytes, trace_path):
+    """
+    Decode the 16 kHz mono audio of upcoming tracks for the inference stage.
+
+    Parameters:
+        tasks (multiprocessing.Queue): Tuples of an audio file path and its model features, then None.
+        decoded (multiprocessing.Queue): The bounded queue of the inference stage, which blocks this stage while
+            it is full.
+        audio_pool (shared_slabs.SlabPool): The slabs to hand the decoded audio to the inference stage through.
+        audio_cache_dir (str): The directory of the decoded audio cache, or None to always decode.
+        audio_cache_max_bytes (int): The size cap of the audio cache.
+        trace_path (str): The JSONL file to trace the analysis stages to, or None to not instrument them.
+
+    Returns:
+        None
+    """
+    pa.init_worker(audio_cache_dir, audio_cache_max_bytes, trace_path, with_models=False)
+
+    for filename, features in iter(tasks.get, None):
+        # only the descriptor of the slab holding the audio goes through the queue
+        mono_16k = aa.TrackAudio(filename).mono_16k
+        if mono_16k is None:
+            descriptor = DECODE_FAILED
+        else:
+            with im.stage('share_mono_16k'):
+                descriptor = audio_pool.put(mono_16k)
+        del mono_16k
+        im.end_track(filename)
+        decoded.put((filename, features, descriptor))
+
+    decoded.put(None)
+    audio_pool.close()
+
+
+def inference_stage(decoded, results, audio_pool, embeddings_pool, decode_workers, defer_heads, trace_path):
+    """
+    Compute the embeddings (and, unless they are deferred, the classifier heads) of the decoded tracks.
+
+    Parameters:
+        decoded (multiprocessing.Queue): Tuples of an audio file path, its model features and the descriptor of
+            its 16 kHz mono audio (DECODE_FAILED if it could not be decoded), then one None per decode worker.
+        results (multiprocessing.Queue): The queue to put each track's partial results on (see pack_results).
+        audio_pool (shared_slabs.SlabPool): The slabs holding the decoded audio.
+        embeddings_pool (shared_slabs.SlabPool): The slabs to hand the embeddings back through.
+        decode_workers (int): The number of decode workers feeding this stage.
+        defer_heads (bool): Whether to leave the classifier heads to the caller.
+        trace_path (str): The JSONL file to trace the analysis stages to, or None to not instrument them.
+
+    Returns:
+        None
+    """
+    pa.init_worker(trace_path=trace_path)
+
+    finished = 0
+    while finished < decode_workers:
+        item = decoded.get()
+        if item is None:
+            finished += 1
+            continue
+
+        filename, features, descriptor = item
+        if descriptor == DECODE_FAILED:
+            # a TrackAudio would decode the broken file again in this process
+            embeddings, predictions = failed_model_features(features)
+            results.put(pack_results(embeddings_pool, filename, embeddings, predictions, {}))
+            im.end_track(filename)
+            continue
+
+        # the models read the audio straight from its slab, which is reused once they are done with it
+        audio = aa.TrackAudio(filename, mono_16k=audio_pool.get(descriptor))
+        embeddings, predictions, head_inputs = aa.extract_track_features(filename, features, audio=audio)
+        del audio
+        audio_pool.release(descriptor)
+
+        if not defer_heads:
+            predictions.update(aa.predict_heads(head_inputs))
+            head_inputs = {}
+        results.put(pack_results(embeddings_pool, filename, embeddings, predictions, head_inputs))
+        im.end_track(filename)
+
+    results.put(None)
+    audio_pool.close()
+    embeddings_pool.close()
+
+
+def failed_model_features(features):
+    """
+    Get the model features of a track that could not be decoded, without running the models.
+
+    Parameters:
+        features (set): The model features requested for the track.
+
+    Returns:
+        tuple: The embeddings and the predictions dictionaries, with None for every requested feature, as
+            extract_track_features and predict_heads give for a file they cannot decode.
+    """
+    embeddings = {feature: None for feature in features if feature in aa.EMBEDDING_MODELS}
+    predictions = {feature: None for feature in features if feature in aa.CLASSIFIER_HEADS}
+
+    return embeddings, predictions
+
+
+def dsp_stage(tasks, results, embeddings_pool, streaming_dsp, defer_heads, chunked_min_duration, audio_cache_dir,
+              audio_cache_max_bytes, trace_path):
+    """
+    Compute the signal processing features of tracks, and every feature of the long tracks analyzed in chunks.
+
+    Parameters:
+        tasks (multiprocessing.Queue): Tuples of an audio file path and the features to compute, then None.
+        results (multiprocessing.Queue): The queue to put each track's partial results on (see pack_results).
+        embeddings_pool (shared_slabs.SlabPool): The slabs to hand the embeddings of long tracks back through.
+        streaming_dsp (bool): Whether to compute the signal processing features in one streaming pass.
+        defer_heads (bool): Whether to leave the classifier heads to the caller.
+        chunked_min_duration (float): Duration in seconds from which tracks are analyzed in chunks, or None.
+        audio_cache_dir (str): The directory of the decoded audio cache, or None to always decode.
+        audio_cache_max_bytes (int): The size cap of the audio cache.
+        trace_path (str): The JSONL file to trace the analysis stages to, or None to not instrument them.
+
+    Returns:
+        None
+    """
+    pa.init_worker(audio_cache_dir, audio_cache_max_bytes, trace_path, with_models=False)
+
+    for filename, features in iter(tasks.get, None):
+        embeddings, predictions, head_inputs = aa.extract_track_features(filename, features, streaming_dsp,
+                                                                         chunked_min_duration)
+        if not defer_heads:
+            predictions.update(aa.predict_heads(head_inputs))
+            head_inputs = {}
+        results.put(pack_results(embeddings_pool, filename, embeddings, predictions, head_inputs))
+        if im.enabled():
+            im.end_track(filename, aa.get_duration(filename))
+
+    results.put(None)
+    embeddings_pool.close()
+
+
+def pack_results(embeddings_pool, filename, embeddings, predictions, head_inputs):
+    """
+    Copy the embedding matrices of a track's partial results into slabs, leaving only small values to pickle.
+
+    Parameters:
+        embeddings_pool (shared_slabs.SlabPool): The slabs to hand the embeddings through.
+        filename (str): The path to the audio file.
+        embeddings (dict): The embeddings computed for the track.
+        predictions (dict): The predictions computed for the track.
+        head_inputs (dict): The head inputs returned by extract_track_features.
+
+    Returns:
+        tuple: The filename, the descriptors of every embedding matrix, the names of the requested embeddings,
+            the predictions and a dictionary mapping each embedding model to the heads still to run on it.
+    """
+    arrays = dict(embeddings)
+    arrays.update({source: source_embeddings for source, (source_embeddings, _) in head_inputs.items()})
+    heads = {source: source_heads for source, (_, source_heads) in head_inputs.items()}
+
+    with im.stage('share_embeddings'):
+        descriptors = ss.share_arrays(embeddings_pool, arrays)
+
+    return filename, descriptors, list(embeddings), predictions, heads
+
+
+def unpack_results(embeddings_pool, packed):
+    """
+    Rebuild the partial results of a track packed by pack_results, releasing their slabs.
+
+    Parameters:
+        embeddings_pool (shared_slabs.SlabPool): The slabs the embeddings were handed through.
+        packed (tuple): The packed results.
+
+    Returns:
+        tuple: The filename, the embeddings, the predictions and the head inputs of the track.
+    """
+    filename, descriptors, embedding_names, predictions, heads = packed
+    arrays = ss.receive_arrays(embeddings_pool, descriptors)
+    embeddings = {name: arrays[name] for name in embedding_names}
+    head_inputs = {source: (arrays[source], source_heads) for source, source_heads in heads.items()}
+
+    return filename, embeddings, predictions, head_inputs
+
+
+def route_tasks(tasks, chunked_min_duration):
+    """
+    Split every track's features between the DSP stage and the decode and inference stages.
+
+    Parameters:
+        tasks (iterable): Tuples of an audio file path and the features to compute for it (None for all of them).
+        chunked_min_duration (float): Duration in seconds from which tracks are analyzed in chunks, or None.
+
+    Returns:
+        tuple: The DSP tasks, the decode tasks (both lists of tuples of a path and features) and a dictionary
+            mapping every track to the number of partial results it will get.
+    """
+    dsp_tasks = []
+    decode_tasks = []
+    parts = {}
+
+    for filename, features in tasks:
+        features = set(aa.FEATURE_MODELS) if features is None else set(features)
+
+        # a long track is decoded in a single streaming pass that feeds every extractor at once
+        if chunked_min_duration is not None and aa.get_duration(filename) >= chunked_min_duration:
+            dsp_tasks.append((filename, features))
+            parts[filename] = 1
+            continue
+
+        model_features = features & MODEL_FEATURES
+        dsp_features = features - MODEL_FEATURES
+        if dsp_features or not model_features:
+            dsp_tasks.append((filename, dsp_features))
+        if model_features:
+            decode_tasks.append((filename, model_features))
+        parts[filename] = bool(dsp_features or not model_features) + bool(model_features)
+
+    return dsp_tasks, decode_tasks, parts
+
+
+def analyze_pipelined(tasks, decode_workers=DECODE_WORKERS, dsp_workers=DSP_WORKERS, prefetch=PREFETCH_TRACKS,
+                      streaming_dsp=False, defer_heads=False, chunked_min_duration=None, audio_cache_dir=None,
+                      audio_cache_max_bytes=None, trace_path=None, slab_bytes=ss.SLAB_BYTES):
+    """
+    Analyze audio files in a pipeline of decode, DSP and inference processes, yielding each result when complete.
+
+    Decode workers prefetch the 16 kHz audio of upcoming tracks into a queue of at most `prefetch` tracks that a
+    single inference process, which holds the models, consumes; DSP workers compute the signal processing
+    features of the same tracks meanwhile. While the inference stage keeps up, decoding and DSP overlap with it,
+    so the throughput approaches that of the slowest stage, and when it falls behind the full queue stalls the
+    decoders instead of piling up decoded audio. The decoded audio and the embeddings are handed between the
+    processes through rings of shared memory slabs (see shared_slabs.SlabPool), so that only small descriptors
+    are pickled through the queues.
+
+    Parameters:
+        tasks (iterable): Tuples of an audio file path and the features to compute for it (None for all of them).
+        decode_workers (int): The number of decode processes.
+        dsp_workers (int): The number of DSP processes.
+        prefetch (int): The number of decoded tracks that may wait for the inference stage.
+        streaming_dsp (bool): Whether to compute the signal processing features in one streaming pass.
+        defer_heads (bool): Whether to leave the classifier heads to the caller (see head_batching.HeadBatcher).
+        chunked_min_duration (float): Duration in seconds from which tracks are analyzed in chunks, or None.
+        audio_cache_dir (str): The directory of the decoded audio cache, or None to always decode.
+        audio_cache_max_bytes (int): The size cap of the audio cache.
+        trace_path (str): The JSONL file to trace the analysis stages to, or None to not instrument them.
+        slab_bytes (int): The size of the slabs holding the decoded audio; longer tracks are pickled.
+
+    Yields:
+        tuple: The same tuples as parallel_analysis.analyze_file, in completion order.
+
+    Raises:
+        RuntimeError: If a stage process dies.
+    """
+    # spawn instead of fork so that no TensorFlow state is inherited from the parent process
+    context = mp.get_context('spawn')
+    dsp_tasks, decode_tasks, parts = route_tasks(tasks, chunked_min_duration)
+
+    dsp_queue = context.Queue()
+    decode_queue = context.Queue()
+    decoded = context.Queue(maxsize=max(1, prefetch))
+    results = context.Queue()
+
+    # one slab per decoded track that may wait for the models, plus the one they are reading
+    audio_pool = ss.SlabPool(context, max(1, prefetch) + 1, slab_bytes)
+    embeddings_pool = ss.SlabPool(context, (dsp_workers + 2) * len(aa.EMBEDDING_MODELS), ss.EMBEDDING_SLAB_BYTES)
+    for task in dsp_tasks + [None] * dsp_workers:
+        dsp_queue.put(task)
+    for task in decode_tasks + [None] * decode_workers:
+        decode_queue.put(task)
+
+    stages = [context.Process(target=decode_stage, daemon=True,
+                              args=(decode_queue, decoded, audio_pool, audio_cache_dir, audio_cache_max_bytes,
+                                    trace_path))
+              for _ in range(decode_workers)]
+    stages.append(context.Process(target=inference_stage, daemon=True,
+                                  args=(decoded, results, audio_pool, embeddings_pool, decode_workers, defer_heads,
+                                        trace_path)))
+    stages += [context.Process(target=dsp_stage, daemon=True,
+                               args=(dsp_queue, results, embeddings_pool, streaming_dsp, defer_heads,
+                                     chunked_min_duration, audio_cache_dir, audio_cache_max_bytes, trace_path))
+               for _ in range(dsp_workers)]
+    for stage in stages:
+        stage.start()
+
+    # join the partial results of every track, which arrive from the DSP and inference stages in any order
+    partial = {}
+    finished = 0
+    try:
+        while finished < dsp_workers + 1:
+            try:
+                item = results.get(timeout=STAGE_POLL_SECONDS)
+            except queue.Empty:
+                if any(stage.exitcode not in (None, 0) for stage in stages):
+                    raise RuntimeError('A stage of the analysis pipeline died')
+                continue
+
+            if item is None:
+                finished += 1
+                continue
+
+            filename, embeddings, predictions, head_inputs = unpack_results(embeddings_pool, item)
+            merged = partial.setdefault(filename, ({}, {}, {}))
+            merged[0].update(embeddings)
+            merged[1].update(predictions)
+            merged[2].update(head_inputs)
+            parts[filename] -= 1
+            if parts[filename] == 0:
+                del partial[filename]
+                yield (filename, *merged) if defer_heads else (filename, *merged[:2])
+
+    finally:
+        for stage in stages:
+            if stage.is_alive():
+                stage.terminate()
+            stage.join()
+        audio_pool.close()
+        embeddings_pool.close()
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import embedding_store as ems
+
+
+STORE_VERSION = 1
+HEADER_FILENAME = 'header.json'
+
+# scalar float32 columns: column -> (prediction, index in the prediction's list or None for a plain number)
+SCALAR_COLUMNS = {
+    'tempo': ('tempo', None),
+    'loudness': ('loudness', None),
+    'vocal': ('voice_or_instrument', 1),
+    'danceability': ('danceability', 0),
+    'valence': ('arousal_and_valence', 0),
+    'arousal': ('arousal_and_valence', 1),
+}
+KEY_PREDICTION = 'key'
+STYLES_PREDICTION = 'music_styles'
+STYLES_FILENAME = 'music_styles.npy'
+# code of a missing key or scale
+MISSING_CODE = -1
+
+
+def scalar_value(predictions, prediction, index):
+    """
+    Get one scalar of a track's predictions.
+
+    Parameters:
+        predictions (dict): The predictions of the track.
+        prediction (str): The name of the prediction.
+        index (int): The index of the scalar in the prediction's list, or None if the prediction is a number.
+
+    Returns:
+        float: The scalar, or NaN if the track does not have it.
+    """
+    value = predictions.get(prediction)
+    if value is None:
+        return np.nan
+    if index is not None:
+        value = value[index] if len(value) > index else None
+
+    return np.nan if value is None else value
+
+
+def build_columns(audio_predictions):
+    """
+    Lay the predictions of every track out as the columns of a predictions store (see write_predictions_store).
+
+    Parameters:
+        audio_predictions (dict): A dictionary mapping every track to its predictions dictionary.
+
+    Returns:
+        tuple: The header of the store and a dictionary mapping the file name of every column to its array.
+    """
+    tracks = list(audio_predictions)
+    records = [audio_predictions[track] for track in tracks]
+    header = {'version': STORE_VERSION, 'tracks': tracks, 'columns': list(SCALAR_COLUMNS)}
+    arrays = {}
+
+    for column, (prediction, index) in SCALAR_COLUMNS.items():
+        arrays[column + '.npy'] = np.array([scalar_value(predictions, prediction, index) for predictions in records],
+                                           dtype=np.float32)
+
+    # every profile shares the same labels, so that the codes of two profiles can be compared
+    keys = [predictions.get(KEY_PREDICTION) or {} for predictions in records]
+    header['key_profiles'] = sorted({profile for track_keys in keys for profile in track_keys})
+    header['key_labels'] = sorted({key_scale[0] for track_keys in keys for key_scale in track_keys.values()})
+    header['scale_labels'] = sorted({key_scale[1] for track_keys in keys for key_scale in track_keys.values()})
+    key_codes = {label: code for code, label in enumerate(header['key_labels'])}
+    scale_codes = {label: code for code, label in enumerate(header['scale_labels'])}
+    for profile in header['key_profiles']:
+        key_scales = [track_keys.get(profile) for track_keys in keys]
+        arrays[f'key_{profile}.npy'] = np.array([MISSING_CODE if key_scale is None else key_codes[key_scale[0]]
+                                                 for key_scale in key_scales], dtype=np.int8)
+        arrays[f'scale_{profile}.npy'] = np.array([MISSING_CODE if key_scale is None else scale_codes[key_scale[1]]
+                                                   for key_scale in key_scales], dtype=np.int8)
+
+    header['styles'] = max((len(predictions.get(STYLES_PREDICTION) or ()) for predictions in records), default=0)
+    styles = np.full((len(tracks), header['styles']), np.nan, dtype=np.float32)
+    for i, predictions in enumerate(records):
+        activations = predictions.get(STYLES_PREDICTION)
+        if activations is not None and len(activations) == header['styles']:
+            styles[i] = activations
+    arrays[STYLES_FILENAME] = styles
+
+    return header, arrays
+
+
+def write_predictions_store(audio_predictions, store_dir):
+    """
+    Write the predictions of every track as a columnar store.
+
+    The store is a directory holding one float32 `<column>.npy` per entry of SCALAR_COLUMNS (NaN where a track
+    lacks the prediction), int8 `key_<profile>.npy` and `scale_<profile>.npy` codes into the key and scale
+    labels of the header (MISSING_CODE where missing), and the tracks x styles float32 `music_styles.npy`
+    matrix (NaN rows where missing). A small `header.json` lists the tracks, the columns and the labels. The
+    store is written to a temporary directory and swapped in.
+
+    Parameters:
+        audio_predictions (dict): A dictionary mapping every track to its predictions dictionary.
+        store_dir (str): The directory to write the store to.
+
+    Returns:
+        None
+    """
+    tmp_dir = store_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    header, arrays = build_columns(audio_predictions)
+    for filename, array in arrays.items():
+        np.save(os.path.join(tmp_dir, filename), array)
+
+    with open(os.path.join(tmp_dir, HEADER_FILENAME), 'w') as f:
+        json.dump(header, f)
+
+    ems.swap_in_dir(tmp_dir, store_dir)
+
+
+class PredictionsStore:
+    """
+    Read-only view of a columnar predictions store (see write_predictions_store).
+
+    Columns are loaded on first use; the style matrix is memory-mapped. A store can also be built in memory
+    from predictions loaded from JSON (see build_predictions_store), with the same columns.
+    """
+
+    def __init__(self, store_dir, header=None, arrays=None):
+        if header is None:
+            with open(os.path.join(store_dir, HEADER_FILENAME), 'r') as f:
+                header = json.load(f)
+
+        self.store_dir = store_dir
+        self.tracks = header['tracks']
+        self.track_index = {track: i for i, track in enumerate(self.tracks)}
+        self.columns = header['columns']
+        self.key_profiles = header['key_profiles']
+        self.key_labels = header['key_labels']
+        self.scale_labels = header['scale_labels']
+        self.style_count = header['styles']
+        self._arrays = arrays or {}
+
+    def load(self, filename, mmap_mode=None):
+        """
+        Load an array of the store, once; stores built in memory already hold all of theirs.
+
+        Parameters:
+            filename (str): The name of the .npy file in the store directory (e.g. 'danceability.npy').
+            mmap_mode (str): The numpy.load memory-map mode (e.g. 'r'), or None to read the whole array.
+
+        Returns:
+            numpy.ndarray: The array, shared by every later call.
+        """
+        if filename not in self._arrays:
+            self._arrays[filename] = np.load(os.path.join(self.store_dir, filename), mmap_mode=mmap_mode)
+
+        return self._arrays[filename]
+
+    def column(self, name):
+        """
+        Get a scalar column of every track.
+
+        Parameters:
+            name (str): The column name, one of SCALAR_COLUMNS (e.g. 'danceability').
+
+        Returns:
+            numpy.ndarray: A float32 array with one value per track (NaN where missing).
+        """
+        return self.load(name + '.npy')
+
+    def key_codes(self, profile):
+        """
+        Get the key and scale codes of every track for a key profile.
+
+        Parameters:
+            profile (str): The key profile (e.g. 'edma').
+
+        Returns:
+            tuple: Two int8 arrays with one code per track, indices into key_labels and scale_labels
+                (MISSING_CODE where missing).
+        """
+        return self.load(f'key_{profile}.npy'), self.load(f'scale_{profile}.npy')
+
+    def keys(self, profile):
+        """
+        Decode the keys of every track for a key profile.
+
+        Parameters:
+            profile (str): The key profile.
+
+        Returns:
+            list: The [key, scale] of every track, as in the predictions JSON (None where missing).
+        """
+        key_codes, scale_codes = self.key_codes(profile)
+
+        return [None if key_code == MISSING_CODE else [self.key_labels[key_code], self.scale_labels[scale_code]]
+                for key_code, scale_code in zip(key_codes.tolist(), scale_codes.tolist())]
+
+    def styles(self):
+        """
+        Get the style activations of every track.
+
+        Returns:
+            numpy.ndarray: A (tracks x styles) float32 memory map (NaN rows where missing).
+        """
+        # an empty array cannot be memory-mapped
+        return self.load(STYLES_FILENAME, mmap_mode='r' if self.tracks and self.style_count else None)
+
+
+def build_predictions_store(audio_predictions):
+    """
+    Build an in-memory predictions store, e.g. from predictions loaded from JSON.
+
+    Parameters:
+        audio_predictions (dict): A dictionary mapping every track to its predictions dictionary.
+
+    Returns:
+        PredictionsStore: The store, with the same columns as one written by write_predictions_store.
+    """
+    return PredictionsStore(None, *build_columns(audio_predictions))
+
+
+def convert_json_predictions(json_path, store_dir):
+    """
+    Convert a predictions JSON file into a columnar predictions store.
+
+    Parameters:
+        json_path (str): The path to the predictions JSON file.
+        store_dir (str): The directory to write the store to.
+
+    Returns:
+        None
+    """
+    with open(json_path, 'r') as f:
+        audio_predictions = json.load(f)
+
+    write_predictions_store(audio_predictions, store_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python predictions_store.py <audio_predictions.json> <store directory>')
+        sys.exit(1)
+
+    convert_json_predictions(sys.argv[1], sys.argv[2])
@@ -0,0 +1,273 @@
+import os
+import json
+import glob
+import numpy as np
+import audio_analysis as aa
+import embedding_store as ems
+import predictions_store as ps
+
+
+SHARD_PATTERN = 'shard-*.jsonl'
+# bytes read at a time from the end of a shard when looking for a torn last line
+TAIL_BLOCK_BYTES = 1 << 16
+
+
+class ShardWriter:
+    """
+    Append-only writer of per-track analysis results.
+
+    Every track becomes one JSON line holding its predictions, while its frame embeddings are appended as raw
+    float32 rows to one sidecar file per model (`<shard>.<model>.f32`) that the line points into. The line is
+    written after the embeddings and flushed immediately, and everything is fsynced every `fsync_every` tracks,
+    so a crash loses at most the tracks written since the last fsync. A torn line is ignored by the readers.
+    """
+
+    def __init__(self, filename, fsync_every=16):
+        self.filename = filename
+        self.fsync_every = fsync_every
+        self.pending = 0
+        self.embedding_files = {}
+
+        truncate_torn_line(filename)
+        self.file = open(filename, 'a')
+
+    def append(self, track, embeddings, predictions, fingerprints):
+        """
+        Append the results of one track to the shard.
+
+        Parameters:
+            track (str): The path to the audio file.
+            embeddings (dict): The embeddings computed for the track.
+            predictions (dict): The predictions computed for the track.
+            fingerprints (dict): The model fingerprint of every successfully computed feature.
+
+        Returns:
+            None
+        """
+        embedding_refs = {}
+        for model, frames in embeddings.items():
+            if frames is None:
+                embedding_refs[model] = None
+                continue
+
+            if model not in self.embedding_files:
+                self.embedding_files[model] = open(f'{self.filename}.{model}.f32', 'ab')
+            embedding_file = self.embedding_files[model]
+
+            frames = np.ascontiguousarray(frames, dtype=np.float32)
+            embedding_refs[model] = {'offset': embedding_file.tell(), 'shape': list(frames.shape)}
+            embedding_file.write(frames.tobytes())
+            embedding_file.flush()
+
+        record = {
+            'track': track,
+            'embeddings': embedding_refs,
+            'predictions': aa.convert_numpy_to_list(predictions),
+            'fingerprints': fingerprints,
+        }
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """
+        Force every appended track to disk.
+
+        Returns:
+            None
+        """
+        for embedding_file in self.embedding_files.values():
+            embedding_file.flush()
+            os.fsync(embedding_file.fileno())
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        """
+        Sync and close the shard.
+
+        Returns:
+            None
+        """
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+            for embedding_file in self.embedding_files.values():
+                embedding_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def truncate_torn_line(filename):
+    """
+    Cut a partially written last line (left by a crash mid-write) off the end of a shard.
+
+    Parameters:
+        filename (str): The path to the shard file.
+
+    Returns:
+        None
+    """
+    if not os.path.isfile(filename):
+        return
+
+    with open(filename, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            return
+
+        # read backwards block by block, so that a large shard is not loaded just to find its last newline
+        position = end
+        while position > 0:
+            start = max(0, position - TAIL_BLOCK_BYTES)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            position = start
+
+        f.truncate(0)
+
+
+def list_shards(shards_dir):
+    """
+    List the shard files in a directory.
+
+    Parameters:
+        shards_dir (str): The directory holding the shards.
+
+    Returns:
+        list: The sorted paths of the shard files.
+    """
+    return sorted(glob.glob(os.path.join(shards_dir, SHARD_PATTERN)))
+
+
+def read_shards(shard_paths):
+    """
+    Read the committed track records from shard files, skipping a torn last line.
+
+    Parameters:
+        shard_paths (list): The paths of the shard files.
+
+    Yields:
+        dict: A record with 'track', 'embeddings', 'predictions', 'fingerprints' and 'shard' entries.
+    """
+    for shard_path in shard_paths:
+        with open(shard_path, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                record = json.loads(line)
+                record['shard'] = shard_path
+                yield record
+
+
+def load_record_embeddings(record, model):
+    """
+    Read the frame embeddings of one model that a shard record points to.
+
+    Parameters:
+        record (dict): A record yielded by read_shards.
+        model (str): The model name (e.g. 'discogs_embeddings').
+
+    Returns:
+        numpy.ndarray: A float32 frame matrix, or None if the model failed for the track.
+    """
+    ref = record['embeddings'][model]
+    if ref is None:
+        return None
+
+    rows, dim = ref['shape']
+    frames = np.fromfile(f"{record['shard']}.{model}.f32", dtype=np.float32, count=rows * dim, offset=ref['offset'])
+
+    return frames.reshape(rows, dim)
+
+
+def remove_shard(shard_path):
+    """
+    Delete a shard file together with its embedding sidecar files.
+
+    Parameters:
+        shard_path (str): The path to the shard file.
+
+    Returns:
+        None
+    """
+    for sidecar_path in glob.glob(glob.escape(shard_path) + '.*.f32'):
+        os.remove(sidecar_path)
+    os.remove(shard_path)
+
+
+def compact_shards(shard_paths, embeddings_store_dir, predictions_path, tracks=None, merge_previous=True,
+                   predictions_store_dir=None):
+    """
+    Merge shard records into the final embedding store and predictions JSON file, then delete the shards.
+
+    Later records for the same track update the features of earlier ones. Embeddings are copied one track at a
+    time from the previous store and the shards, so memory stays proportional to a single track. Both outputs
+    are replaced atomically, so an interrupted compaction leaves the shards in place to be compacted again.
+
+    Parameters:
+        shard_paths (list): The paths of the shard files, oldest first.
+        embeddings_store_dir (str): The directory of the binary embedding store.
+        predictions_path (str): The path to the predictions JSON file.
+        tracks (set): The tracks to keep in the final outputs, or None to keep every track.
+        merge_previous (bool): Whether to start from the existing outputs instead of from the shards alone.
+        predictions_store_dir (str): The directory of the columnar predictions store to write as well
+            (see predictions_store), or None.
+
+    Returns:
+        None
+    """
+    audio_predictions = {}
+    previous_store = None
+    if merge_previous and os.path.isfile(predictions_path):
+        with open(predictions_path, 'r') as json_file:
+            audio_predictions = json.load(json_file)
+    if merge_previous and os.path.isdir(embeddings_store_dir):
+        previous_store = ems.EmbeddingStore(embeddings_store_dir)
+
+    # remember only where each track's latest embeddings live, not the embeddings themselves
+    latest_records = {}
+    for record in read_shards(shard_paths):
+        audio_predictions.setdefault(record['track'], {}).update(record['predictions'])
+        for model in record['embeddings']:
+            latest_records.setdefault(record['track'], {})[model] = record
+
+    if tracks is not None:
+        audio_predictions = {track: value for track, value in audio_predictions.items() if track in tracks}
+
+    with ems.EmbeddingStoreWriter(embeddings_store_dir) as writer:
+        for track in audio_predictions:
+            embeddings = {}
+            if previous_store is not None and track in previous_store.track_index:
+                embeddings = {model: previous_store.get(track, model) for model in previous_store.models}
+            for model, record in latest_records.get(track, {}).items():
+                embeddings[model] = load_record_embeddings(record, model)
+            writer.add(track, embeddings)
+
+    tmp_path = predictions_path + '.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(audio_predictions, json_file)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(tmp_path, predictions_path)
+
+    if predictions_store_dir is not None:
+        ps.write_predictions_store(audio_predictions, predictions_store_dir)
+
+    for shard_path in shard_paths:
+        remove_shard(shard_path)
@@ -0,0 +1,168 @@
+import os
+import shutil
+import numpy as np
+from multiprocessing import shared_memory
+
+
+# a slab holds up to this many seconds of 16 kHz float32 mono audio; longer arrays are pickled through the queue
+SLAB_SECONDS = 600
+SLAB_BYTES = SLAB_SECONDS * 16000 * 4
+EMBEDDING_SLAB_BYTES = 16 << 20
+SHARED_MEMORY_DIR = '/dev/shm'
+
+
+class SlabPool:
+    """
+    Ring of preallocated shared memory slabs for handing arrays from one process to another without pickling them.
+
+    The process that creates the pool owns the slabs; the pool itself can be passed to the stage processes it
+    spawns, which attach to the slabs by name. A producer copies an array into a free slab with put() and sends
+    only the small descriptor it returns through a queue; the consumer maps the slab with get() and gives it
+    back with release() once nothing reads the array any more. The free slabs are listed in a multiprocessing
+    queue, so a producer blocks while every slab is in use, which bounds the memory of the hand-off. Arrays
+    larger than a slab are carried in the descriptor itself and pickled as usual, and so is everything when
+    there is not enough shared memory for any slab.
+    """
+
+    def __init__(self, context, slabs, slab_bytes):
+        self.slab_bytes = slab_bytes
+        self.free = context.Queue()
+        self.segments = {}
+
+        # writing past the end of a full /dev/shm kills the process, so only allocate the slabs that fit
+        if os.path.isdir(SHARED_MEMORY_DIR):
+            available = shutil.disk_usage(SHARED_MEMORY_DIR).free
+            if available < slabs * slab_bytes:
+                print(f"Error in SlabPool: {available >> 20} MB of shared memory for {slabs} slabs of "
+                      f"{slab_bytes >> 20} MB; pickling the arrays that do not fit")
+                slabs = available // slab_bytes
+
+        self.slabs = slabs
+        for _ in range(slabs):
+            segment = shared_memory.SharedMemory(create=True, size=slab_bytes)
+            self.segments[segment.name] = segment
+            self.free.put(segment.name)
+        self.owner = True
+
+    def __getstate__(self):
+        # the processes the pool is passed to attach to the slabs again, lazily
+        return {'slab_bytes': self.slab_bytes, 'free': self.free, 'segments': {}, 'slabs': self.slabs,
+                'owner': False}
+
+    def segment(self, name):
+        """
+        Get a slab, attaching this process to it on first use.
+
+        Parameters:
+            name (str): The name of the shared memory segment.
+
+        Returns:
+            multiprocessing.shared_memory.SharedMemory: The slab.
+        """
+        segment = self.segments.get(name)
+        if segment is None:
+            segment = shared_memory.SharedMemory(name=name)
+            self.segments[name] = segment
+
+        return segment
+
+    def put(self, array):
+        """
+        Copy an array into a free slab, waiting for one if they are all in use.
+
+        Parameters:
+            array (numpy.ndarray): The array to hand off, or None.
+
+        Returns:
+            tuple: The descriptor to send to the consuming process.
+        """
+        if array is None:
+            return None
+
+        array = np.ascontiguousarray(array)
+        if array.nbytes > self.slab_bytes or self.slabs == 0:
+            return ('inline', array)
+
+        name = self.free.get()
+        np.ndarray(array.shape, array.dtype, buffer=self.segment(name).buf)[...] = array
+
+        return ('slab', name, array.dtype.str, array.shape)
+
+    def get(self, descriptor):
+        """
+        Map the array of a descriptor.
+
+        Parameters:
+            descriptor (tuple): A descriptor returned by put().
+
+        Returns:
+            numpy.ndarray: A view of the slab holding the array (valid until the descriptor is released), the
+                array itself if it was too large for a slab, or None.
+        """
+        if descriptor is None:
+            return None
+        if descriptor[0] == 'inline':
+            return descriptor[1]
+
+        _, name, dtype, shape = descriptor
+        return np.ndarray(shape, np.dtype(dtype), buffer=self.segment(name).buf)
+
+    def release(self, descriptor):
+        """
+        Give the slab of a descriptor back to the pool. Views returned by get() must not be used afterwards.
+
+        Parameters:
+            descriptor (tuple): A descriptor returned by put().
+
+        Returns:
+            None
+        """
+        if descriptor is not None and descriptor[0] == 'slab':
+            self.free.put(descriptor[1])
+
+    def close(self):
+        """
+        Detach this process from the slabs, and free them if it owns the pool.
+
+        Returns:
+            None
+        """
+        for segment in self.segments.values():
+            segment.close()
+            if self.owner:
+                segment.unlink()
+        self.segments = {}
+
+
+def share_arrays(pool, arrays):
+    """
+    Hand off a dictionary of arrays through a slab pool.
+
+    Parameters:
+        pool (SlabPool): The pool to copy the arrays into.
+        arrays (dict): A dictionary mapping names to arrays (or None).
+
+    Returns:
+        dict: A dictionary mapping the same names to descriptors.
+    """
+    return {name: pool.put(array) for name, array in arrays.items()}
+
+
+def receive_arrays(pool, descriptors):
+    """
+    Copy a dictionary of arrays out of a slab pool and release their slabs.
+
+    Parameters:
+        pool (SlabPool): The pool the arrays were handed off through.
+        descriptors (dict): A dictionary mapping names to descriptors, as returned by share_arrays.
+
+    Returns:
+        dict: A dictionary mapping the same names to arrays (or None) owned by this process.
+    """
+    arrays = {}
+    for name, descriptor in descriptors.items():
+        array = pool.get(descriptor)
+        arrays[name] = None if array is None else np.array(array)
+        pool.release(descriptor)
+
+    return arrays
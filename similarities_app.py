@@ -2,11 +2,12 @@ import os
 import uuid
 import streamlit as st
 import similarities_utils as su
+import collection_cache as cc
 
 
 # set up gloabl file paths
 m3u_filepaths_dir = 'playlists/similarities_playlists/'
-ESSENTIA_EMBEDDINGS_PATH = 'embeddings/audio_embeddings.json'
+ESSENTIA_EMBEDDINGS_PATH = 'embeddings/audio_embeddings'
 
 # make sure playlist directory exists
 os.makedirs(m3u_filepaths_dir, exist_ok=True)
@@ -14,17 +15,16 @@ os.makedirs(m3u_filepaths_dir, exist_ok=True)
 st.write('# 💿 Similarity Playlist Generator 💿')
 st.write(f'Using analysis data from `{ESSENTIA_EMBEDDINGS_PATH}`.')
 
-# load embeddings and get track names
-audio_embeddings = su.load_embeddings()
+# load embeddings and the dot products of all tracks (once per server process and again when the embeddings change)
+audio_embeddings, dot_products = cc.get_similarity_collection()
 all_tracks = list(audio_embeddings.index)
 
 st.write('## 🎤 From which track do you want similar tracks?')
 
 track_name = st.selectbox("Select track:", all_tracks)
 
-# compute dot products of embeddings for all tracks
-discogs_dot_products = su.compute_dot_products(audio_embeddings, 'discogs_embeddings')
-musiCNN_dot_products = su.compute_dot_products(audio_embeddings, 'musiCNN_embeddings')
+discogs_dot_products = dot_products['discogs_embeddings']
+musiCNN_dot_products = dot_products['musiCNN_embeddings']
 
 st.write('## 🔀 Post-process')
 playlist_name = st.text_input("✍🏻 Enter playlist name:")
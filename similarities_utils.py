@@ -1,26 +1,43 @@
 import pandas as pd
-import music_collection_overview as mco
+import collection_io as cio
+import embedding_store as ems
 import numpy as np
 import os
 
 ESSENTIA_EMBEDDINGS_PATH = 'embeddings/audio_embeddings.json'
+ESSENTIA_EMBEDDINGS_STORE_DIR = 'embeddings/audio_embeddings'
 
 def load_embeddings():
     """
-    Loads audio predictions and corresponding music genres.
+    Loads the mean embedding of every track for each embedding model.
+
+    Reads the binary embedding store when it exists and falls back to streaming the legacy embeddings JSON file.
     
     Returns:
-        pandas.DataFrame: DataFrame containing audio genres.
+        pandas.DataFrame: DataFrame with one row per track and one column of mean embeddings per model.
     """
-    audio_embeddings = mco.load_audio_predictions(ESSENTIA_EMBEDDINGS_PATH)
-
-    for audio_file, embeddings in audio_embeddings.items():
-        for key, value in embeddings.items():
-            audio_embeddings[audio_file][key] = np.mean(value, axis=0)
-
-    df = pd.DataFrame.from_dict(audio_embeddings, orient='index')
-
-    return df
+    if os.path.isdir(ESSENTIA_EMBEDDINGS_STORE_DIR):
+        store = ems.EmbeddingStore(ESSENTIA_EMBEDDINGS_STORE_DIR)
+        columns = {}
+        for model in store.models:
+            tracks, means = store.mean_embeddings(model)
+            columns[model] = pd.Series(list(means), index=tracks)
+
+        # tracks without frames for some model cannot be compared, so keep only complete rows
+        return pd.DataFrame(columns).dropna()
+
+    # the JSON file is read one track at a time, so that only the means of the other tracks are kept
+    tracks = {}
+    means = {}
+    for track, embeddings in cio.iter_audio_embeddings(ESSENTIA_EMBEDDINGS_PATH):
+        for model, frames in embeddings.items():
+            if frames is not None and len(frames) > 0:
+                tracks.setdefault(model, []).append(track)
+                means.setdefault(model, []).append(np.mean(frames, axis=0))
+
+    columns = {model: pd.Series(means[model], index=tracks[model]) for model in tracks}
+
+    return pd.DataFrame(columns).dropna()
 
 
 def compute_dot_products(audio_embeddings, embeddings_column):
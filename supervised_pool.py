@@ -0,0 +1,256 @@
+import time
+import multiprocessing as mp
+from multiprocessing import connection
+import instrumentation as im
+
+
+# seconds between two checks of the busy workers' clocks and memory
+SUPERVISE_SECONDS = 1.
+# seconds a worker is given to exit on its own when the pool closes, before it is killed
+SHUTDOWN_SECONDS = 10.
+# seconds a worker may take to pick up a task, which includes running the initializer (e.g. loading models)
+STARTUP_TIMEOUT = 600.
+
+
+def worker_loop(worker_connection, function, initializer, initargs, max_tasks):
+    """
+    Run the tasks a supervisor sends through a pipe, one at a time, until it sends None or `max_tasks` are done.
+
+    Parameters:
+        worker_connection (multiprocessing.connection.Connection): The worker's end of its pipe.
+        function (callable): The function to run on every task.
+        initializer (callable): A function to call once before the first task, or None.
+        initargs (tuple): The arguments of the initializer.
+        max_tasks (int): The number of tasks after which the worker exits, or None to never retire it.
+
+    Returns:
+        None
+    """
+    if initializer is not None:
+        initializer(*initargs)
+
+    done = 0
+    while max_tasks is None or done < max_tasks:
+        item = worker_connection.recv()
+        if item is None:
+            break
+
+        task_index, task = item
+        worker_connection.send(('started', task_index, None))
+        try:
+            message = ('done', task_index, function(task))
+        except Exception as e:
+            message = ('error', task_index, f'{type(e).__name__}: {e}')
+        worker_connection.send(message)
+        done += 1
+
+
+class Worker:
+    """
+    A worker process of a SupervisedPool, with its pipe and the task it is running.
+    """
+
+    def __init__(self, context, function, initializer, initargs, max_tasks):
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=worker_loop, daemon=True,
+                                       args=(worker_connection, function, initializer, initargs, max_tasks))
+        self.process.start()
+        worker_connection.close()
+        self.task_index = None
+        self.dispatched = None
+        self.started = None
+        self.timeout = None
+        self.done = 0
+        self.closed = False
+
+    def kill(self):
+        """
+        Kill the worker process and close its pipe.
+
+        Returns:
+            None
+        """
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class SupervisedPool:
+    """
+    Pool of worker processes that survives the tasks that hang, blow up in memory or crash their worker.
+
+    Every worker runs one task at a time, sent through its own pipe, so that killing a worker never leaves a
+    queue shared with the others in a broken state. While a task runs, the pool checks its wall time against
+    `timeout` and the worker's resident memory against `max_rss_mb`; a worker over either limit is killed and
+    replaced, and so is one that dies, and its task is reported to `on_failure` instead of yielding a result.
+    Workers are also replaced after `max_tasks` tasks, so that memory a library slowly leaks is given back.
+    The timeout may be a number of seconds or a function of the task returning them (None for no limit), and
+    the clock of a task only starts once its worker is initialized and picks it up. A worker that does not pick
+    up its task within `startup_timeout` seconds, e.g. because its initializer hangs, is killed and replaced
+    too, so that it cannot hold its slot for the rest of the run.
+    """
+
+    def __init__(self, function, workers, initializer=None, initargs=(), max_tasks=None, timeout=None,
+                 max_rss_mb=None, context=None, startup_timeout=STARTUP_TIMEOUT):
+        self.function = function
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_tasks = max_tasks
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self.startup_timeout = startup_timeout
+        # spawn by default, so that no state of the parent process (e.g. TensorFlow's) is inherited
+        self.context = context or mp.get_context('spawn')
+        self.pool = []
+
+    def start_worker(self):
+        """
+        Start a new worker process.
+
+        Returns:
+            Worker: The worker, which runs the initializer before waiting for its first task.
+        """
+        return Worker(self.context, self.function, self.initializer, self.initargs, self.max_tasks)
+
+    def check(self, worker):
+        """
+        Tell whether a busy worker has to be killed.
+
+        Parameters:
+            worker (Worker): The worker.
+
+        Returns:
+            str: Why the worker failed its task, or None if it is still fine.
+        """
+        if not worker.process.is_alive():
+            # a retiring worker exits right after sending its last result, which is read before calling it dead
+            if not worker.closed and worker.connection.poll():
+                return None
+            return f'worker died with exit code {worker.process.exitcode}'
+
+        if worker.started is None:
+            waited = time.monotonic() - worker.dispatched
+            if self.startup_timeout is not None and waited > self.startup_timeout:
+                return f'worker did not start the task within {waited:.0f} s'
+            return None
+
+        elapsed = time.monotonic() - worker.started
+        if worker.timeout is not None and elapsed > worker.timeout:
+            return f'timed out after {elapsed:.0f} s'
+
+        if self.max_rss_mb is not None:
+            rss_mb = im.process_rss_mb(worker.process.pid)
+            if rss_mb is not None and rss_mb > self.max_rss_mb:
+                return f'used {rss_mb:.0f} MB of memory (limit {self.max_rss_mb:.0f} MB)'
+
+        return None
+
+    def imap_unordered(self, tasks, on_failure=None):
+        """
+        Run a function on every task, yielding each result as soon as it is ready.
+
+        Parameters:
+            tasks (iterable): The tasks, dispatched in this order.
+            on_failure (callable): A function called with every task that failed and the reason, or None.
+
+        Yields:
+            The result of the function for every task that did not fail, in completion order.
+        """
+        tasks = list(tasks)
+        next_task = 0
+        self.pool = [self.start_worker() for _ in range(min(self.workers, len(tasks)))]
+
+        try:
+            while True:
+                for i, worker in enumerate(self.pool):
+                    # a retired worker is replaced before it is given another task
+                    if worker.task_index is None and self.max_tasks is not None and worker.done >= self.max_tasks:
+                        worker.process.join()
+                        worker.connection.close()
+                        worker = self.pool[i] = self.start_worker()
+                    if worker.task_index is None and next_task < len(tasks):
+                        worker.connection.send((next_task, tasks[next_task]))
+                        worker.task_index, worker.dispatched, worker.started = next_task, time.monotonic(), None
+                        next_task += 1
+
+                busy = [worker for worker in self.pool if worker.task_index is not None]
+                if not busy:
+                    return
+
+                ready = connection.wait([worker.connection for worker in busy], timeout=SUPERVISE_SECONDS)
+                for worker in busy:
+                    if worker.connection not in ready:
+                        continue
+                    try:
+                        kind, _, value = worker.connection.recv()
+                    except EOFError:
+                        # the worker died; check() below reports it
+                        worker.closed = True
+                        continue
+
+                    if kind == 'started':
+                        worker.started = time.monotonic()
+                        task = tasks[worker.task_index]
+                        worker.timeout = self.timeout(task) if callable(self.timeout) else self.timeout
+                        continue
+
+                    worker.done += 1
+                    task, worker.task_index = tasks[worker.task_index], None
+                    if kind == 'done':
+                        yield value
+                    elif on_failure is not None:
+                        on_failure(task, value)
+
+                for i, worker in enumerate(self.pool):
+                    if worker.task_index is None:
+                        continue
+                    reason = self.check(worker)
+                    if reason is not None:
+                        worker.kill()
+                        if on_failure is not None:
+                            on_failure(tasks[worker.task_index], reason)
+                        self.pool[i] = self.start_worker()
+
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop every worker, killing the ones that do not exit in time.
+
+        Returns:
+            None
+        """
+        for worker in self.pool:
+            try:
+                worker.connection.send(None)
+            except (OSError, ValueError):
+                pass
+
+        deadline = time.monotonic() + SHUTDOWN_SECONDS
+        for worker in self.pool:
+            worker.process.join(max(0., deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.kill()
+            else:
+                worker.connection.close()
+        self.pool = []
+
+    def __enter__(self):
+        """
+        Use the pool as a context manager that closes it on exit.
+
+        Returns:
+            SupervisedPool: The pool itself.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Close the pool.
+
+        Returns:
+            None
+        """
+        self.close()
@@ -0,0 +1,147 @@
+import numpy as np
+import essentia.standard as es
+
+
+SAMPLE_RATE = 44100
+
+# semitones above C of every pitch class, as named by essentia's Key algorithm
+PITCH_CLASSES = ('C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B')
+# intervals of the triads built on the tonic, subdominant and dominant of each scale
+SCALE_TRIADS = {
+    'major': ((0, 4, 7), (5, 9, 12), (7, 11, 14)),
+    'minor': ((0, 3, 7), (5, 8, 12), (7, 11, 14)),
+}
+
+
+def clicks(bpm, duration, sample_rate=SAMPLE_RATE):
+    """
+    Generate a click track at a known tempo.
+
+    Parameters:
+        bpm (float): The tempo in beats per minute.
+        duration (float): The duration in seconds.
+        sample_rate (int): The sample rate in Hz.
+
+    Returns:
+        numpy.ndarray: Mono float32 audio with a short decaying 1 kHz click on every beat.
+    """
+    audio = np.zeros(int(duration * sample_rate), dtype=np.float32)
+    t = np.arange(int(0.03 * sample_rate)) / sample_rate
+    click = (np.sin(2 * np.pi * 1000 * t) * np.exp(-t * 150)).astype(np.float32)
+
+    for start in np.arange(0, duration, 60. / bpm):
+        start = int(start * sample_rate)
+        end = min(len(audio), start + len(click))
+        audio[start:end] = 0.8 * click[:end - start]
+
+    return audio
+
+
+def chords(key, scale, duration, chord_seconds=2., sample_rate=SAMPLE_RATE):
+    """
+    Generate a I-IV-V-I chord progression in a known key.
+
+    Parameters:
+        key (str): The tonic, one of PITCH_CLASSES.
+        scale (str): 'major' or 'minor'.
+        duration (float): The duration in seconds.
+        chord_seconds (float): The duration of each chord in seconds.
+        sample_rate (int): The sample rate in Hz.
+
+    Returns:
+        numpy.ndarray: Mono float32 audio of harmonic tones, each chord fading in and out.
+    """
+    tonic = 48 + PITCH_CLASSES.index(key)
+    tonic_triad, subdominant_triad, dominant_triad = SCALE_TRIADS[scale]
+    progression = (tonic_triad, subdominant_triad, dominant_triad, tonic_triad)
+
+    t = np.arange(int(chord_seconds * sample_rate)) / sample_rate
+    envelope = np.minimum(1., np.minimum(t, chord_seconds - t) / 0.05)
+    rendered = []
+    for triad in progression:
+        chord = np.zeros(len(t))
+        for interval in triad:
+            frequency = 440. * 2 ** ((tonic + interval - 69) / 12)
+            for harmonic in range(1, 5):
+                chord += np.sin(2 * np.pi * frequency * harmonic * t) / harmonic
+        rendered.append(chord * envelope)
+
+    progression = np.concatenate(rendered)
+    repeats = int(np.ceil(duration * sample_rate / len(progression)))
+    audio = np.tile(progression, repeats)[:int(duration * sample_rate)]
+
+    return (0.8 * audio / np.abs(audio).max()).astype(np.float32)
+
+
+def noise(duration, seed=0, sample_rate=SAMPLE_RATE):
+    """
+    Generate white noise.
+
+    Parameters:
+        duration (float): The duration in seconds.
+        seed (int): The seed of the random generator, so that every run gets the same signal.
+        sample_rate (int): The sample rate in Hz.
+
+    Returns:
+        numpy.ndarray: Mono float32 audio.
+    """
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, int(duration * sample_rate)).astype(np.float32)
+
+
+def silence(duration, sample_rate=SAMPLE_RATE):
+    """
+    Generate digital silence.
+
+    Parameters:
+        duration (float): The duration in seconds.
+        sample_rate (int): The sample rate in Hz.
+
+    Returns:
+        numpy.ndarray: Mono float32 audio.
+    """
+    return np.zeros(int(duration * sample_rate), dtype=np.float32)
+
+
+def to_stereo(mono_audio):
+    """
+    Duplicate a mono signal on two channels.
+
+    Parameters:
+        mono_audio (numpy.ndarray): Mono audio data.
+
+    Returns:
+        numpy.ndarray: Stereo float32 audio, one row per sample.
+    """
+    return np.ascontiguousarray(np.stack([mono_audio, mono_audio], axis=1), dtype=np.float32)
+
+
+def resample(mono_audio, sample_rate=16000):
+    """
+    Resample a synthetic signal the way the analysis resamples decoded audio for the models.
+
+    Parameters:
+        mono_audio (numpy.ndarray): Mono audio data at SAMPLE_RATE.
+        sample_rate (int): The target sample rate in Hz.
+
+    Returns:
+        numpy.ndarray: The resampled mono audio.
+    """
+    return es.Resample(inputSampleRate=float(SAMPLE_RATE), outputSampleRate=float(sample_rate),
+                       quality=1)(mono_audio)
+
+
+def write_wav(filename, mono_audio, sample_rate=SAMPLE_RATE):
+    """
+    Write a synthetic signal to a 16-bit stereo WAV file, to benchmark the analysis of whole files.
+
+    Parameters:
+        filename (str): The path of the file to write.
+        mono_audio (numpy.ndarray): Mono audio data.
+        sample_rate (int): The sample rate in Hz.
+
+    Returns:
+        str: The path of the written file.
+    """
+    es.AudioWriter(filename=filename, format='wav', sampleRate=sample_rate)(to_stereo(mono_audio))
+
+    return filename
@@ -0,0 +1,45 @@
+import pytest
+import numpy as np
+import audio_analysis as aa
+import pipelined_analysis as pl
+
+
+def test_route_tasks():
+    dsp_tasks, decode_tasks, parts = pl.route_tasks([('a.mp3', {'tempo', 'danceability'}), ('b.mp3', {'key'}),
+                                                     ('c.mp3', {'musiCNN_embeddings'})], None)
+
+    # assertions
+    assert dsp_tasks == [('a.mp3', {'tempo'}), ('b.mp3', {'key'})]
+    assert decode_tasks == [('a.mp3', {'danceability'}), ('c.mp3', {'musiCNN_embeddings'})]
+    assert parts == {'a.mp3': 2, 'b.mp3': 1, 'c.mp3': 1}
+
+
+def test_analyze_pipelined(example_audio_file):
+    features = {'tempo', 'loudness', 'arousal_and_valence'}
+    results = list(pl.analyze_pipelined([(example_audio_file, features)], prefetch=1))
+    embeddings, predictions = aa.analyze_track(example_audio_file, features)
+
+    # assertions
+    assert len(results) == 1
+    filename, pipelined_embeddings, pipelined_predictions = results[0]
+    assert filename == example_audio_file
+    assert pipelined_embeddings == embeddings == {}
+    assert set(pipelined_predictions) == features
+    for feature in features:
+        assert np.array_equal(pipelined_predictions[feature], predictions[feature])
+
+
+def test_analyze_pipelined_decode_failure(tmp_path):
+    broken_file = tmp_path / 'broken.mp3'
+    broken_file.write_bytes(b'not audio')
+    features = {'tempo', 'musiCNN_embeddings', 'arousal_and_valence', 'danceability'}
+    results = list(pl.analyze_pipelined([(str(broken_file), features)], prefetch=1))
+
+    # assertions
+    assert pl.failed_model_features({'musiCNN_embeddings', 'danceability'}) == ({'musiCNN_embeddings': None},
+                                                                               {'danceability': None})
+    assert len(results) == 1
+    filename, embeddings, predictions = results[0]
+    assert filename == str(broken_file)
+    assert embeddings == {'musiCNN_embeddings': None}
+    assert predictions == {'tempo': None, 'arousal_and_valence': None, 'danceability': None}
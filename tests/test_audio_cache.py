@@ -0,0 +1,36 @@
+import os
+import pytest
+import numpy as np
+import analysis_manifest as am
+from audio_cache import AudioCache
+
+
+def test_audio_cache(tmp_path):
+    sources = []
+    for i in range(3):
+        source = tmp_path / f'track_{i}.mp3'
+        source.write_bytes(os.urandom(1000))
+        sources.append(str(source))
+
+    # room for two of the three arrays
+    cache = AudioCache(str(tmp_path / 'cache'), max_bytes=2 * 4000 + 500)
+    audio = np.random.rand(1000).astype(np.float32)
+    hashes = [am.fast_hash(source) for source in sources]
+    cache.put(hashes[0], sources[0], 'mono_16k', audio)
+    cache.put(hashes[1], sources[1], 'mono_16k', audio)
+    os.utime(cache.path(hashes[0], 'mono_16k'), (0, 0))
+    os.utime(cache.path(hashes[1], 'mono_16k'), (1, 1))
+    cache.get(hashes[0], 'mono_16k')
+    cache.put(hashes[2], sources[2], 'mono_16k', audio)
+
+    # assertions
+    assert np.array_equal(cache.get(hashes[0], 'mono_16k'), audio)
+    assert cache.get(hashes[1], 'mono_16k') is None
+    assert not os.path.exists(str(tmp_path / 'cache' / (hashes[1] + '.source')))
+    assert os.path.exists(str(tmp_path / 'cache' / (hashes[0] + '.source')))
+    assert np.array_equal(cache.get(hashes[2], 'mono_16k'), audio)
+
+    os.remove(sources[2])
+    assert cache.prune() == 1
+    assert cache.get(hashes[2], 'mono_16k') is None
+    assert np.array_equal(cache.get(hashes[0], 'mono_16k'), audio)
@@ -0,0 +1,20 @@
+from benchmark_imports import parse_importtime, run_benchmark
+
+
+def test_parse_importtime():
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 |   _io',
+        'import time:      1395 |       9112 | collection_io',
+    ])
+
+    # assertions
+    assert parse_importtime(output) == {'_io': 120, 'collection_io': 9112}
+
+
+def test_startup_modules_do_not_import_plotting():
+    results = run_benchmark(('collection_io', 'descriptor_queries_utils', 'similarities_utils'), repeat=1)
+
+    # assertions
+    assert all(result['plotting_modules'] == [] for result in results.values())
+    assert all(result['import_ms'] > 0 for result in results.values())
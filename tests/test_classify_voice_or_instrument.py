@@ -5,7 +5,7 @@ from audio_analysis import classify_voice_or_instrument, get_embeddings, load_au
 
 def test_classify_voice_or_instrument(example_audio_file):
 
-    _, audio = load_audio(example_audio_file)
+    _, _, audio, _ = load_audio(example_audio_file)
     discogs_embeddings, _ = get_embeddings(audio)
 
     predictions = classify_voice_or_instrument(discogs_embeddings)
@@ -0,0 +1,27 @@
+import os
+import itertools
+from collection_cache import get_collection, clear_collections, file_signature
+
+
+def test_get_collection(tmp_path):
+    clear_collections()
+    predictions = tmp_path / 'audio_predictions.json'
+    store_dir = tmp_path / 'audio_predictions'
+    predictions.write_text('{}')
+    paths = [str(store_dir), str(predictions)]
+    loads = itertools.count()
+    first = get_collection('test', paths, loads.__next__)
+    second = get_collection('test', paths, loads.__next__)
+    stat = os.stat(predictions)
+    os.utime(predictions, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    third = get_collection('test', paths, loads.__next__)
+    store_dir.mkdir()
+    (store_dir / 'header.json').write_text('{}')
+    fourth = get_collection('test', paths, loads.__next__)
+
+    # assertions
+    assert (first, second, third, fourth) == (0, 0, 1, 2)
+    assert get_collection('other', paths, loads.__next__) == 3
+    assert get_collection('test', paths, loads.__next__) == 2
+    assert [entry[0] for entry in file_signature(paths)] == [str(predictions), str(store_dir / 'header.json')]
+    clear_collections()
@@ -0,0 +1,47 @@
+import json
+import numpy as np
+import pytest
+import similarities_utils as su
+from collection_io import iter_audio_predictions, iter_audio_embeddings
+from embedding_store import convert_json_embeddings
+
+
+AUDIO_EMBEDDINGS = {
+    'a.mp3': {'discogs_embeddings': [[0.5, 1.0, -2.0], [1.5, 3.0, 1e-7]], 'musiCNN_embeddings': [[1.0, 2.0]]},
+    'b.mp3': {'discogs_embeddings': [[2.0, 2.0, 2.0]], 'musiCNN_embeddings': []},
+    'c.mp3': {'discogs_embeddings': None, 'musiCNN_embeddings': [[3.0, 4.0], [5.0, 6.0]]},
+}
+
+
+def test_iter_audio_predictions(tmp_path):
+    json_path = tmp_path / 'audio_predictions.json'
+    audio_predictions = {'a.mp3': {'tempo': 1e300, 'key': {'edma': ['C#', 'minor']}}, 'b "é".mp3': {'tempo': -0.5}}
+    json_path.write_text(json.dumps(audio_predictions, indent=4))
+
+    # assertions
+    for chunk_size in (1, 2, 5, 1 << 20):
+        assert list(iter_audio_predictions(str(json_path), chunk_size)) == list(audio_predictions.items())
+    json_path.write_text('{"a.mp3": {"tempo": 1')
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_audio_predictions(str(json_path), 4))
+
+
+def test_load_embeddings_from_json(tmp_path, monkeypatch):
+    json_path = tmp_path / 'audio_embeddings.json'
+    json_path.write_text(json.dumps(AUDIO_EMBEDDINGS))
+    store_dir = str(tmp_path / 'audio_embeddings')
+    convert_json_embeddings(str(json_path), store_dir)
+    embeddings = dict(iter_audio_embeddings(str(json_path), chunk_size=8))
+    monkeypatch.setattr(su, 'ESSENTIA_EMBEDDINGS_PATH', str(json_path))
+    monkeypatch.setattr(su, 'ESSENTIA_EMBEDDINGS_STORE_DIR', str(tmp_path / 'missing'))
+    from_json = su.load_embeddings()
+    monkeypatch.setattr(su, 'ESSENTIA_EMBEDDINGS_STORE_DIR', store_dir)
+    from_store = su.load_embeddings()
+
+    # assertions
+    assert embeddings['a.mp3']['discogs_embeddings'].dtype == np.float32
+    assert embeddings['a.mp3']['discogs_embeddings'].shape == (2, 3)
+    assert embeddings['c.mp3']['discogs_embeddings'] is None
+    assert list(from_json.index) == list(from_store.index) == ['a.mp3']
+    for model in ('discogs_embeddings', 'musiCNN_embeddings'):
+        assert np.array_equal(from_json.loc['a.mp3', model], from_store.loc['a.mp3', model])
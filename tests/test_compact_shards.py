@@ -0,0 +1,47 @@
+import json
+import pytest
+import numpy as np
+from embedding_store import EmbeddingStore
+import result_shards as rs
+from result_shards import ShardWriter, compact_shards, list_shards, read_shards, truncate_torn_line
+
+
+def test_compact_shards(tmp_path):
+
+    shards_dir = tmp_path / "shards"
+    shards_dir.mkdir()
+    frames = np.random.rand(2, 3).astype(np.float32)
+
+    with ShardWriter(str(shards_dir / "shard-1.jsonl"), fsync_every=1) as writer:
+        writer.append('a.mp3', {'musiCNN_embeddings': frames}, {'tempo': 120.0}, {'tempo': ''})
+        writer.append('b.mp3', {'musiCNN_embeddings': None}, {'tempo': 90.0}, {'tempo': ''})
+
+    # simulate a crash in the middle of writing a third track
+    with open(shards_dir / "shard-1.jsonl", 'a') as f:
+        f.write('{"track": "c.mp3", "embe')
+
+    # assertions
+    assert [record['track'] for record in read_shards(list_shards(str(shards_dir)))] == ['a.mp3', 'b.mp3']
+
+    store_dir = str(tmp_path / "audio_embeddings")
+    predictions_path = tmp_path / "predictions.json"
+    compact_shards(list_shards(str(shards_dir)), store_dir, str(predictions_path), tracks={'a.mp3'})
+
+    assert json.loads(predictions_path.read_text()) == {'a.mp3': {'tempo': 120.0}}
+    assert np.array_equal(EmbeddingStore(store_dir).get('a.mp3', 'musiCNN_embeddings'), frames)
+    assert list(shards_dir.iterdir()) == []
+
+
+def test_truncate_torn_line(tmp_path, monkeypatch):
+    # blocks much shorter than the torn line, so that the newline is found several blocks back
+    monkeypatch.setattr(rs, 'TAIL_BLOCK_BYTES', 4)
+    shard = tmp_path / 'shard-1.jsonl'
+    shard.write_bytes(b'{"track": "a.mp3"}\n{"track": "b.mp3"}\n{"track": "c.m')
+    truncate_torn_line(str(shard))
+    torn_only = tmp_path / 'shard-2.jsonl'
+    torn_only.write_bytes(b'{"track": "a.m')
+    truncate_torn_line(str(torn_only))
+
+    # assertions
+    assert shard.read_bytes() == b'{"track": "a.mp3"}\n{"track": "b.mp3"}\n'
+    assert torn_only.read_bytes() == b''
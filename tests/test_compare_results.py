@@ -0,0 +1,17 @@
+import pytest
+from benchmark_analysis import compare_results
+
+
+def test_compare_results():
+    baseline = {'results': {'get_tempo/clicks/10s': {'median': 1.0}, 'get_key/clicks/10s': {'median': 1.0},
+                            'load_audio/clicks/10s': {'median': 1.0}}}
+    results = {'results': {'get_tempo/clicks/10s': {'median': 1.1}, 'get_key/clicks/10s': {'median': 1.5},
+                           'analyze_track/clicks/10s': {'median': 3.0}}}
+
+    rows, regressions = compare_results(results, baseline, threshold=0.2)
+
+    # assertions
+    assert [row[0] for row in rows] == ['get_tempo/clicks/10s', 'get_key/clicks/10s']
+    assert rows[1][3] == pytest.approx(1.5)
+    assert regressions == ['get_key/clicks/10s']
+    assert compare_results(results, baseline, threshold=0.6)[1] == []
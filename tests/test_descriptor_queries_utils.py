@@ -0,0 +1,35 @@
+import json
+import numpy as np
+import predictions_store as ps
+from descriptor_queries_utils import load_genres, load_activations, DISCOGS_METADATA_PATH
+from benchmark_loaders import synthetic_predictions, legacy_load_genres, legacy_load_activations, check_equivalent
+from collection_io import load_discogs_music_genres
+
+
+def test_loaders_match_legacy_loaders(tmp_path):
+    genres = load_discogs_music_genres(DISCOGS_METADATA_PATH)
+    audio_predictions = synthetic_predictions(50, len(genres))
+    json_path = str(tmp_path / 'audio_predictions.json')
+    store_dir = str(tmp_path / 'audio_predictions')
+    with open(json_path, 'w') as f:
+        json.dump(audio_predictions, f)
+    ps.write_predictions_store(audio_predictions, store_dir)
+    legacy_dfs = legacy_load_genres(json_path, genres), legacy_load_activations(json_path)
+    predictions = ps.PredictionsStore(store_dir)
+    activations = load_activations(predictions)
+
+    # assertions
+    assert check_equivalent(load_genres(predictions), activations, *legacy_dfs)
+    predictions = ps.build_predictions_store(audio_predictions)
+    assert check_equivalent(load_genres(predictions), load_activations(predictions), *legacy_dfs)
+    assert activations['danceability'].dtype == np.float32
+    assert activations['key'].dtype == 'category'
+
+
+def test_load_activations_without_key_profile():
+    predictions = ps.build_predictions_store({'a.mp3': {'tempo': 100.0}})
+    activations = load_activations(predictions)
+
+    # assertions
+    assert activations['tempo'].iloc[0] == 100.0
+    assert activations['key'].isna().all() and activations['scale'].isna().all()
@@ -0,0 +1,25 @@
+import pytest
+import numpy as np
+from embedding_store import EmbeddingStore, EmbeddingStoreWriter
+
+
+def test_embedding_store(tmp_path):
+
+    store_dir = str(tmp_path / "audio_embeddings")
+    a = np.random.rand(3, 4).astype(np.float32)
+    b = np.random.rand(5, 4).astype(np.float32)
+
+    with EmbeddingStoreWriter(store_dir) as writer:
+        writer.add('a.mp3', {'musiCNN_embeddings': a})
+        writer.add('b.mp3', {'musiCNN_embeddings': None})
+        writer.add('c.mp3', {'musiCNN_embeddings': b})
+
+    store = EmbeddingStore(store_dir)
+    tracks, means = store.mean_embeddings('musiCNN_embeddings')
+
+    # assertions
+    assert store.tracks == ['a.mp3', 'b.mp3', 'c.mp3']
+    assert np.array_equal(store.get('c.mp3', 'musiCNN_embeddings'), b)
+    assert len(store.get('b.mp3', 'musiCNN_embeddings')) == 0
+    assert tracks == ['a.mp3', 'c.mp3']
+    assert np.allclose(means, [a.mean(axis=0), b.mean(axis=0)])
@@ -0,0 +1,21 @@
+import pytest
+import numpy as np
+import audio_analysis as aa
+
+
+def test_extract_track_features_chunked(example_audio_file, monkeypatch):
+    features = ['tempo', 'key', 'loudness', 'musiCNN_embeddings', 'arousal_and_valence']
+    embeddings, predictions, head_inputs = aa.extract_track_features(example_audio_file, features)
+
+    # windows much shorter than the track, so that its tempo is tracked over several of them
+    monkeypatch.setattr(aa, 'CHUNK_SECONDS', 8)
+    monkeypatch.setattr(aa, 'TEMPO_CHUNK_OVERLAP_SECONDS', 4)
+    chunked_embeddings, chunked_predictions, chunked_head_inputs = aa.extract_track_features(
+        example_audio_file, features, chunked_min_duration=0)
+
+    # assertions
+    assert np.array_equal(chunked_embeddings['musiCNN_embeddings'], embeddings['musiCNN_embeddings'])
+    assert np.array_equal(chunked_head_inputs['musiCNN_embeddings'][0], head_inputs['musiCNN_embeddings'][0])
+    assert chunked_predictions['loudness'] == predictions['loudness']
+    assert chunked_predictions['key'] == predictions['key']
+    assert abs(chunked_predictions['tempo'] - predictions['tempo']) < 2
@@ -5,7 +5,7 @@ from audio_analysis import get_arousal_and_valence, get_embeddings, load_audio
 
 def test_get_arousal_and_valence(example_audio_file):
 
-    _, mono_audio = load_audio(example_audio_file)
+    _, _, mono_audio, _ = load_audio(example_audio_file)
     _, musiCNN_embeddings = get_embeddings(mono_audio)
 
     predictions = get_arousal_and_valence(musiCNN_embeddings)
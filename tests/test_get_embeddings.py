@@ -5,7 +5,7 @@ from audio_analysis import get_embeddings, load_audio
 
 def test_get_loudness(example_audio_file):
 
-    _, audio = load_audio(example_audio_file)
+    _, _, audio, _ = load_audio(example_audio_file)
     discogs_embeddings, musicnn_embeddings = get_embeddings(audio)
 
     # assertions
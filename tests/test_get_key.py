@@ -4,7 +4,7 @@ from audio_analysis import get_key, load_audio
 
 def test_get_key(example_audio_file):
 
-    _, audio = load_audio(example_audio_file)
+    _, audio, _, _ = load_audio(example_audio_file)
     keys_and_scales = get_key(audio)
 
     # assertions
@@ -0,0 +1,16 @@
+import pytest
+import essentia.standard as es
+from audio_analysis import get_hpcp, get_key_from_hpcp, load_audio, KEY_PROFILES
+
+
+def test_get_key_from_hpcp(example_audio_file):
+
+    _, mono_audio, _, _ = load_audio(example_audio_file)
+    hpcp = get_hpcp(mono_audio)
+    keys_and_scales = get_key_from_hpcp(hpcp)
+
+    # assertions: one shared chromagram gives the same keys as a full KeyExtractor per profile
+    assert hpcp.shape[1] == 12
+    for profile in KEY_PROFILES:
+        key, scale, _ = es.KeyExtractor(profileType=profile)(mono_audio)
+        assert keys_and_scales[profile] == [key, scale]
@@ -0,0 +1,10 @@
+import pytest
+from audio_analysis import get_model, EMOMUSIC_GRAPH
+
+
+def test_get_model():
+
+    model = get_model("TensorflowPredict2D", EMOMUSIC_GRAPH, output="model/Identity")
+
+    # assertions
+    assert model is get_model("TensorflowPredict2D", EMOMUSIC_GRAPH, output="model/Identity")
@@ -0,0 +1,14 @@
+import pytest
+from audio_analysis import get_signal_features, get_tempo, get_key, get_loudness, load_audio
+
+
+def test_get_signal_features(example_audio_file):
+
+    tempo, keys_and_scales, loudness = get_signal_features(example_audio_file)
+    stereo_audio, mono_audio, _, _ = load_audio(example_audio_file)
+
+    # assertions: the single pass matches the separate standard-mode extractors (the tempo is tracked on the
+    # 16-bit spool of the mono signal)
+    assert abs(tempo - get_tempo(mono_audio)) < 1
+    assert keys_and_scales == get_key(mono_audio)
+    assert loudness == pytest.approx(get_loudness(stereo_audio))
@@ -0,0 +1,21 @@
+import pytest
+import numpy as np
+from audio_analysis import run_heads
+from head_batching import HeadBatcher, batch_heads
+
+
+def test_head_batcher():
+
+    heads = ['music_styles', 'danceability']
+    tracks = {f'track_{i}.mp3': np.random.rand(rows, 1280).astype(np.float32) for i, rows in enumerate([8, 70, 130, 1])}
+    results = [(track, {}, {}, {'discogs_embeddings': (embeddings, heads)}) for track, embeddings in tracks.items()]
+    results.append(('broken.mp3', {}, {}, {'discogs_embeddings': (None, heads)}))
+
+    batched = {track: predictions for track, _, predictions in batch_heads(results, HeadBatcher(batch_size=128))}
+
+    # assertions
+    assert set(batched) == set(tracks) | {'broken.mp3'}
+    assert batched['broken.mp3'] == {'music_styles': None, 'danceability': None}
+    for track, embeddings in tracks.items():
+        for head, (_, mean_activations) in run_heads(embeddings, heads).items():
+            assert np.array_equal(batched[track][head], mean_activations)
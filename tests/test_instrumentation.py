@@ -0,0 +1,77 @@
+import json
+import numpy as np
+import instrumentation as im
+
+
+def test_instrumentation(tmp_path):
+    trace_path = str(tmp_path / 'trace.jsonl')
+    im.configure(trace_path)
+    try:
+        for track in ('a.mp3', 'b.mp3'):
+            with im.stage('decode_mono'):
+                sum(range(10000))
+            with im.stage('tempo'):
+                pass
+            with im.stage('tempo'):
+                pass
+            im.end_track(track, audio_seconds=30.)
+        with im.stage('write_results'):
+            pass
+        im.end_track('a.mp3')
+        im.end_track('b.mp3')
+        rows, tracks, tracks_per_second, audio_per_second = im.summarize(trace_path, 2.)
+    finally:
+        im.configure(None)
+
+    # assertions
+    counts = {row[0]: row[1] for row in rows}
+    assert counts == {'decode_mono': 2, 'tempo': 2, 'write_results': 1}
+    assert tracks == 2
+    assert tracks_per_second == 1.
+    assert audio_per_second == 30.
+    assert im.stage('tempo') is im.stage('decode_mono')
+    assert not im.enabled()
+
+
+def allocate(mb):
+    ballast = np.ones(mb << 17)
+    return ballast.sum()
+
+
+def test_instrumentation_memory(tmp_path, monkeypatch):
+    trace_path = str(tmp_path / 'trace.jsonl')
+    allocate(300)
+    im.configure(trace_path)
+    try:
+        with im.stage('small'):
+            allocate(1)
+        with im.stage('outer'):
+            with im.stage('large'):
+                allocate(200)
+            with im.stage('small'):
+                allocate(1)
+        im.end_track('a.mp3')
+
+        # without a resettable peak, the growth is measured from the start to the end of the stage
+        monkeypatch.setattr(im, 'reset_peak_rss', lambda: False)
+        im.configure(trace_path)
+        with im.stage('kept'):
+            ballast = np.ones(100 << 17)
+        im.end_track('b.mp3')
+        del ballast
+        rows, _, _, _ = im.summarize(trace_path, 1.)
+    finally:
+        im.configure(None)
+
+    with open(trace_path, 'r') as f:
+        stages, fallback_stages = [json.loads(line)['stages'] for line in f]
+
+    # assertions
+    assert stages['small']['rss_growth_mb'] < 50
+    assert stages['large']['rss_growth_mb'] > 150
+    assert stages['outer']['peak_rss_mb'] >= stages['large']['peak_rss_mb'] > stages['small']['peak_rss_mb'] + 150
+    assert 'end_rss_mb' not in stages['large']
+    assert 'peak_rss_mb' not in fallback_stages['kept'] and fallback_stages['kept']['rss_growth_mb'] > 50
+    summary = {row[0]: row[6:] for row in rows}
+    assert summary['large'][0] > 150 and summary['large'][1] is not None
+    assert summary['kept'][0] > 50 and summary['kept'][1] is None
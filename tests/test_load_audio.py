@@ -2,7 +2,7 @@ import pytest
 from audio_analysis import load_audio
 
 def test_load_audio(example_audio_file):
-    stereo_audio, mono_audio = load_audio(example_audio_file)
+    stereo_audio, mono_audio, resampled_mono_audio, sr = load_audio(example_audio_file)
 
     # Assert that stereo_audio is not None
     assert stereo_audio is not None
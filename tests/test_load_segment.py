@@ -0,0 +1,27 @@
+import os
+import numpy as np
+import essentia.standard as es
+import synthetic_audio as sa
+from audio_analysis import load_segment, segment_spool_path, remove_segment_spool
+
+
+def test_load_segment(tmp_path):
+    filename = sa.write_wav(str(tmp_path / 'chords.wav'), sa.chords('A', 'minor', 10) * 0.3)
+    spool_dir = str(tmp_path / 'spool')
+    os.makedirs(spool_dir)
+    stereo_audio, _, sr, _, _, _ = es.AudioLoader(filename=filename)()
+
+    # the first segment decodes the file into the spool, the second only reads its window
+    first, channels, first_sr = load_segment(filename, (0., 4.), spool_dir)
+    mtime = os.stat(segment_spool_path(filename, spool_dir) + '.wav').st_mtime_ns
+    second, _, _ = load_segment(filename, (4., None), spool_dir)
+
+    # assertions
+    assert first_sr == sr
+    assert channels == 2
+    assert len(first) == 4 * sr
+    assert os.stat(segment_spool_path(filename, spool_dir) + '.wav').st_mtime_ns == mtime
+    assert np.allclose(np.concatenate([first, second]), stereo_audio, atol=1e-4)
+
+    remove_segment_spool(filename, spool_dir)
+    assert os.listdir(spool_dir) == []
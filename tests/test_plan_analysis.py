@@ -0,0 +1,26 @@
+import pytest
+from analysis_manifest import new_manifest, plan_analysis, record_track
+
+
+def test_plan_analysis(tmp_path):
+
+    audio_file = tmp_path / "track.mp3"
+    audio_file.write_bytes(b"audio")
+    fingerprints = {'tempo': '', 'music_styles': 'abc'}
+
+    manifest = new_manifest()
+    todo, removed = plan_analysis([str(audio_file)], manifest, fingerprints)
+
+    # assertions
+    assert todo == {str(audio_file): {'tempo', 'music_styles'}}
+    assert removed == []
+
+    record_track(manifest, str(audio_file), fingerprints, ['tempo', 'music_styles'])
+    todo, removed = plan_analysis([str(audio_file)], manifest, {'tempo': '', 'music_styles': 'def'})
+
+    assert todo == {str(audio_file): {'music_styles'}}
+
+    todo, removed = plan_analysis([], manifest, fingerprints)
+
+    assert todo == {}
+    assert removed == [str(audio_file)]
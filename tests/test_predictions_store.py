@@ -0,0 +1,57 @@
+import json
+import numpy as np
+from predictions_store import PredictionsStore, convert_json_predictions, write_predictions_store, MISSING_CODE
+
+
+AUDIO_PREDICTIONS = {
+    'a.mp3': {
+        'tempo': 120.0,
+        'loudness': -9.5,
+        'key': {'edma': ['A', 'minor'], 'temperley': ['C', 'major']},
+        'music_styles': [0.1, 0.7, 0.2],
+        'voice_or_instrument': [0.3, 0.7],
+        'danceability': [0.9, 0.1],
+        'arousal_and_valence': [5.5, 4.5],
+    },
+    'b.mp3': {
+        'tempo': None,
+        'key': {'edma': ['F#', 'major'], 'temperley': ['F#', 'major']},
+        'danceability': [0.2, 0.8],
+    },
+}
+
+
+def test_write_predictions_store(tmp_path):
+    store_dir = str(tmp_path / 'audio_predictions')
+    write_predictions_store(AUDIO_PREDICTIONS, store_dir)
+    store = PredictionsStore(store_dir)
+    key_codes, scale_codes = store.key_codes('edma')
+
+    # assertions
+    assert store.tracks == ['a.mp3', 'b.mp3']
+    assert store.column('tempo').dtype == np.float32
+    assert store.column('tempo')[0] == 120.0 and np.isnan(store.column('tempo')[1])
+    assert np.isnan(store.column('loudness')[1])
+    assert np.allclose(store.column('danceability'), [0.9, 0.2])
+    assert store.column('vocal')[0] == np.float32(0.7)
+    assert store.column('valence')[0] == 5.5 and store.column('arousal')[0] == 4.5
+    assert store.keys('edma') == [['A', 'minor'], ['F#', 'major']]
+    assert store.keys('temperley') == [['C', 'major'], ['F#', 'major']]
+    assert key_codes.dtype == np.int8 and MISSING_CODE not in key_codes
+    assert [store.scale_labels[code] for code in scale_codes] == ['minor', 'major']
+    assert store.styles().shape == (2, 3)
+    assert np.allclose(store.styles()[0], [0.1, 0.7, 0.2]) and np.isnan(store.styles()[1]).all()
+
+
+def test_convert_json_predictions(tmp_path):
+    json_path = tmp_path / 'audio_predictions.json'
+    json_path.write_text(json.dumps({'c.mp3': {'tempo': 90.0}}))
+    store_dir = str(tmp_path / 'audio_predictions')
+    convert_json_predictions(str(json_path), store_dir)
+    store = PredictionsStore(store_dir)
+
+    # assertions
+    assert store.tracks == ['c.mp3']
+    assert store.column('tempo')[0] == 90.0
+    assert store.key_profiles == []
+    assert store.styles().shape == (1, 0)
@@ -0,0 +1,17 @@
+import pytest
+from audio_analysis import resolve_features, extract_track_features
+
+
+def test_resolve_features(example_audio_file):
+    plan = resolve_features(['tempo', 'arousal_and_valence'])
+    embeddings, predictions, head_inputs = extract_track_features(example_audio_file, ['tempo', 'arousal_and_valence'])
+
+    # assertions
+    assert plan == ['tempo', 'musiCNN_embeddings', 'arousal_and_valence']
+    assert embeddings == {}
+    assert set(predictions) == {'tempo'}
+    assert list(head_inputs) == ['musiCNN_embeddings']
+    assert head_inputs['musiCNN_embeddings'][1] == ['arousal_and_valence']
+
+    with pytest.raises(ValueError):
+        resolve_features(['tempo', 'brightness'])
@@ -0,0 +1,14 @@
+import pytest
+import numpy as np
+from audio_analysis import run_heads, get_danceability, get_music_styles
+
+
+def test_run_heads():
+
+    discogs_embeddings = np.random.rand(8, 1280).astype(np.float32)
+    results = run_heads(discogs_embeddings, ['music_styles', 'danceability'])
+
+    # assertions
+    assert results['music_styles'][0].shape == (8, 400)
+    assert np.allclose(results['music_styles'][1], get_music_styles(discogs_embeddings))
+    assert np.allclose(results['danceability'][1], get_danceability(discogs_embeddings))
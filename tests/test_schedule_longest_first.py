@@ -0,0 +1,76 @@
+import numpy as np
+import essentia.standard as es
+import synthetic_audio as sa
+import audio_analysis as aa
+from parallel_analysis import schedule_longest_first, join_segments, analyze_file, SegmentJoiner
+
+
+SIGNAL_FEATURES = {'tempo', 'key', 'loudness'}
+
+
+def test_longest_first(tmp_path):
+    tasks = [(sa.write_wav(str(tmp_path / f'{duration}s.wav'), sa.silence(duration)), None) for duration in (2, 6, 4)]
+    scheduled = schedule_longest_first(tasks)
+
+    # assertions
+    assert [filename for filename, _ in scheduled] == [tasks[1][0], tasks[2][0], tasks[0][0]]
+
+
+def test_split_long_tracks(tmp_path):
+    short = sa.write_wav(str(tmp_path / 'short.wav'), sa.silence(4))
+    long = sa.write_wav(str(tmp_path / 'long.wav'), sa.silence(10))
+    scheduled = schedule_longest_first([(short, None), (long, {'tempo'})], split_seconds=5)
+
+    # assertions
+    assert scheduled[-1] == (short, None)
+    assert [task[2] for task in scheduled[:-1]] == [(0., 5.), (5., None)]
+    assert all(task[:2] == (long, {'tempo'}) for task in scheduled[:-1])
+
+
+def test_integrated_loudness():
+    audio = sa.to_stereo(np.concatenate([sa.chords('A', 'minor', 20) * 0.3, sa.noise(10), sa.silence(5)]))
+    momentary_loudness, _, integrated_loudness, _ = es.LoudnessEBUR128()(audio)
+
+    # assertions
+    assert abs(aa.integrated_loudness(momentary_loudness) - integrated_loudness) < 1e-3
+    assert aa.integrated_loudness(es.LoudnessEBUR128()(sa.to_stereo(sa.silence(5)))[0]) == aa.LOUDNESS_ABSOLUTE_GATE
+
+
+def test_join_segments(tmp_path):
+    filename = sa.write_wav(str(tmp_path / 'clicks.wav'), sa.clicks(120, 60))
+    tasks = schedule_longest_first([(filename, SIGNAL_FEATURES)], split_seconds=25)
+    # the segments may finish in any order
+    results = [analyze_file(task) for task in reversed(tasks)]
+    (joined_filename, embeddings, predictions), = join_segments(results, tasks)
+    _, whole_predictions = aa.analyze_track(filename, SIGNAL_FEATURES)
+
+    # assertions
+    assert len(tasks) == 3
+    assert joined_filename == filename
+    assert embeddings == {}
+    assert abs(predictions['tempo'] - 120) <= 1
+    assert abs(predictions['loudness'] - whole_predictions['loudness']) < 0.5
+
+
+def test_failed_segment_fails_track(tmp_path):
+    long = sa.write_wav(str(tmp_path / 'long.wav'), sa.silence(15))
+    short = sa.write_wav(str(tmp_path / 'short.wav'), sa.silence(2))
+    tasks = schedule_longest_first([(long, SIGNAL_FEATURES), (short, SIGNAL_FEATURES)], split_seconds=5)
+    failures = []
+    joiner = SegmentJoiner(tasks, on_failure=lambda task, reason: failures.append((task, reason)))
+
+    def results():
+        # the first segment arrives, the second raises, then the last segment and the short track arrive
+        yield tasks[0][0], tasks[0][2], 'partial'
+        joiner.fail(tasks[1], 'bad file')
+        assert long not in joiner.arrived
+        yield tasks[2][0], tasks[2][2], 'partial'
+        yield short, {}, {'tempo': 120.}
+        joiner.fail(tasks[0], 'timed out')
+
+    joined = list(joiner.join(results()))
+
+    # assertions
+    assert joined == [(short, {}, {'tempo': 120.})]
+    assert joiner.arrived == {}
+    assert failures == [((long, SIGNAL_FEATURES), 'bad file')]
@@ -0,0 +1,32 @@
+import pytest
+import numpy as np
+import multiprocessing as mp
+import shared_slabs as ss
+
+
+def test_slab_pool():
+    pool = ss.SlabPool(mp.get_context('spawn'), 2, 4096)
+    try:
+        small = np.arange(100, dtype=np.float32)
+        large = np.arange(2000, dtype=np.float32)
+
+        first = pool.put(small)
+        second = pool.put(small * 2)
+        inline = pool.put(large)
+
+        # assertions
+        assert first[0] == 'slab' and second[0] == 'slab' and first[1] != second[1]
+        assert inline[0] == 'inline'
+        assert np.array_equal(pool.get(first), small)
+        assert np.array_equal(pool.get(inline), large)
+        assert pool.put(None) is None
+
+        # a released slab is handed out again
+        received = ss.receive_arrays(pool, {'first': first, 'missing': None})
+        assert np.array_equal(received['first'], small) and received['missing'] is None
+        third = pool.put(small * 3)
+        assert third[1] == first[1]
+        assert np.array_equal(pool.get(second), small * 2)
+        assert np.array_equal(pool.get(third), small * 3)
+    finally:
+        pool.close()
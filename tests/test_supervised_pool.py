@@ -0,0 +1,62 @@
+import os
+import time
+from supervised_pool import SupervisedPool
+
+
+def misbehave(task):
+    if task == 'hang':
+        time.sleep(60)
+    elif task == 'crash':
+        os._exit(1)
+    elif task == 'balloon':
+        ballast = bytearray(400 << 20)
+        time.sleep(60)
+        return len(ballast)
+    elif task == 'raise':
+        raise ValueError('bad file')
+
+    return task, os.getpid()
+
+
+def test_recycled_workers():
+    failures = {}
+    pool = SupervisedPool(misbehave, 2, max_tasks=1)
+    results = list(pool.imap_unordered(range(20), on_failure=failures.__setitem__))
+
+    # assertions
+    assert failures == {}
+    assert sorted(task for task, _ in results) == list(range(20))
+    assert len({pid for _, pid in results}) == 20
+
+
+def test_failed_tasks_are_reported():
+    failures = {}
+    pool = SupervisedPool(misbehave, 2, timeout=2, max_rss_mb=200)
+    start = time.monotonic()
+    results = list(pool.imap_unordered(['hang', 1, 'crash', 2, 'balloon', 3, 'raise', 4],
+                                       on_failure=failures.__setitem__))
+
+    # assertions
+    assert sorted(task for task, _ in results) == [1, 2, 3, 4]
+    assert set(failures) == {'hang', 'crash', 'balloon', 'raise'}
+    assert 'timed out' in failures['hang']
+    assert 'exit code 1' in failures['crash']
+    assert 'MB of memory' in failures['balloon']
+    assert 'bad file' in failures['raise']
+    assert time.monotonic() - start < 30
+
+
+def hang():
+    time.sleep(60)
+
+
+def test_hung_initializer_is_killed():
+    failures = {}
+    pool = SupervisedPool(misbehave, 1, initializer=hang, startup_timeout=2)
+    start = time.monotonic()
+    results = list(pool.imap_unordered([1], on_failure=failures.__setitem__))
+
+    # assertions
+    assert results == []
+    assert 'did not start' in failures[1]
+    assert time.monotonic() - start < 30
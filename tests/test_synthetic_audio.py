@@ -0,0 +1,28 @@
+import pytest
+import synthetic_audio as sa
+from audio_analysis import get_tempo, get_key, get_loudness
+
+
+@pytest.mark.parametrize('bpm', [90, 120, 140])
+def test_clicks(bpm):
+    tempo = get_tempo(sa.clicks(bpm, 20))
+
+    # assertions
+    assert abs(tempo - bpm) <= 1
+
+
+@pytest.mark.parametrize('key, scale', [('C', 'major'), ('A', 'minor'), ('F#', 'major'), ('Eb', 'minor')])
+def test_chords(key, scale):
+    keys_and_scales = get_key(sa.chords(key, scale, 16))
+
+    # assertions
+    assert all(key_and_scale == [key, scale] for key_and_scale in keys_and_scales.values())
+
+
+def test_noise_and_silence():
+    noise = sa.noise(5)
+
+    # assertions
+    assert len(noise) == 5 * sa.SAMPLE_RATE
+    assert (noise == sa.noise(5)).all()
+    assert get_loudness(sa.to_stereo(noise)) > get_loudness(sa.to_stereo(sa.silence(5)))
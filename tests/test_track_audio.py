@@ -0,0 +1,28 @@
+import pytest
+import numpy as np
+from audio_analysis import TrackAudio, load_audio, get_sample_rate
+
+
+def test_track_audio(example_audio_file):
+    stereo_audio, mono_audio, resampled_mono_audio, sr = load_audio(example_audio_file)
+
+    # mono decoded on its own, without the stereo signal
+    audio = TrackAudio(example_audio_file)
+    decoded_mono_audio = audio.mono
+
+    # assertions
+    assert audio._stereo is None
+    assert audio.sr == sr
+    assert np.array_equal(decoded_mono_audio, mono_audio)
+    assert np.array_equal(audio.mono_16k, resampled_mono_audio)
+    assert np.array_equal(audio.stereo, stereo_audio)
+
+    audio.release('stereo', 'mono', 'mono_16k')
+    assert audio._stereo is None and audio._mono is None and audio._mono_16k is None
+
+
+def test_get_sample_rate(example_audio_file):
+    _, _, _, sr = load_audio(example_audio_file)
+
+    # assertions
+    assert get_sample_rate(example_audio_file) == sr
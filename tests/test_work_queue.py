@@ -0,0 +1,65 @@
+import time
+import pytest
+import work_queue as wq
+
+
+def test_work_queue(tmp_path):
+    queue = wq.WorkQueue(str(tmp_path / 'queue.db'))
+    queue.reset([('a.mp3', {'tempo', 'key'}), ('b.mp3', None)])
+
+    first = queue.claim('host-1')
+    second = queue.claim('host-2')
+
+    # assertions
+    assert {first[0], second[0]} == {'a.mp3', 'b.mp3'}
+    assert dict([first, second]) == {'a.mp3': {'tempo', 'key'}, 'b.mp3': None}
+    assert queue.claim('host-3') is None
+    assert queue.leased_by_others('host-1') == 1
+    assert queue.heartbeat('host-1') == 1
+
+    queue.complete([first[0]])
+    assert queue.counts() == {wq.PENDING: 0, wq.LEASED: 1, wq.DONE: 1, wq.FAILED: 0}
+    assert list(wq.claimed_tasks(queue, 'host-2')) == []
+
+
+def test_work_queue_expired_leases(tmp_path):
+    queue = wq.WorkQueue(str(tmp_path / 'queue.db'), lease_seconds=0)
+    queue.reset([('a.mp3', None)])
+
+    # a worker that never heartbeats loses its track to the next claim, until the track is given up
+    claims = []
+    for attempt in range(wq.MAX_ATTEMPTS + 1):
+        time.sleep(0.01)
+        claims.append(queue.claim(f'host-{attempt}'))
+
+    # assertions
+    assert claims[:wq.MAX_ATTEMPTS] == [('a.mp3', None)] * wq.MAX_ATTEMPTS
+    assert claims[-1] is None
+    assert queue.failed() == ['a.mp3']
+
+
+def test_work_queue_stranded_lease(tmp_path, monkeypatch, capsys):
+    from audio_analysis_main import wait_for_queue
+    monkeypatch.setattr(wq, 'POLL_SECONDS', 0.05)
+    queue = wq.WorkQueue(str(tmp_path / 'queue.db'), lease_seconds=0.2)
+    queue.reset([('a.mp3', None), ('b.mp3', None)])
+
+    # the only worker claims a track, then stops heartbeating while it holds the lease
+    claimed = queue.claim('host-1')
+    live_worker_stranded = queue.stranded()
+    time.sleep(0.3)
+    expired = queue.expire()
+    counts = queue.counts()
+    start = time.monotonic()
+    stranded = wait_for_queue(queue, 2)
+
+    # assertions
+    assert claimed == ('a.mp3', None)
+    assert live_worker_stranded == []
+    assert expired == 1
+    assert counts == {wq.PENDING: 2, wq.LEASED: 0, wq.DONE: 0, wq.FAILED: 0}
+    assert stranded == ['a.mp3', 'b.mp3']
+    assert time.monotonic() - start < 5
+    assert 'a.mp3' in capsys.readouterr().out
+    assert queue.claim('host-2') == ('b.mp3', None)
+    assert queue.stranded() == []
@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+
+# seconds a claimed track stays leased to a worker without a heartbeat
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 30
+# seconds an idle worker waits before looking for expired leases again
+POLL_SECONDS = 10
+# number of claims after which a track that keeps losing its lease (e.g. it crashes its workers) is given up
+MAX_ATTEMPTS = 3
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    """
+    Queue of tracks to analyze, shared by workers on several hosts through an SQLite database on a shared mount.
+
+    A worker claims a track by leasing it for `lease_seconds`, renews the leases of the tracks it holds while
+    it works on them (see Heartbeat) and marks them done once their results are on disk. A track whose lease
+    expired, because its worker died or lost the mount, is put back in the queue by the next sweep of expired
+    leases (see expire), which every claim and the coordinator run, up to MAX_ATTEMPTS times. Every change is
+    a short transaction, so the database must live on a filesystem with working POSIX locks, and the hosts'
+    clocks must agree to well within the lease duration.
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+
+        # autocommit mode, with explicit transactions wherever a read decides a write
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tasks (track TEXT PRIMARY KEY, features TEXT, '
+                                'state TEXT, worker TEXT, lease_expires REAL, attempts INTEGER)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, last_seen REAL)')
+
+    def reset(self, tasks):
+        """
+        Replace the content of the queue with new pending tracks, which are claimed in this order.
+
+        Parameters:
+            tasks (iterable): Tuples of an audio file path and the features to compute for it (None for all of them).
+
+        Returns:
+            None
+        """
+        rows = [(track, json.dumps(None if features is None else sorted(features)), PENDING, None, None, 0)
+                for track, features in tasks]
+
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('DELETE FROM tasks')
+            self.connection.executemany('INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def expire(self):
+        """
+        Put the tracks whose lease expired back in the queue, or give them up after MAX_ATTEMPTS claims.
+
+        Returns:
+            int: The number of expired leases.
+        """
+        now = time.time()
+
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            failed = self.connection.execute('UPDATE tasks SET state = ?, worker = NULL WHERE state = ? AND '
+                                             'lease_expires < ? AND attempts >= ?',
+                                             (FAILED, LEASED, now, MAX_ATTEMPTS)).rowcount
+            requeued = self.connection.execute('UPDATE tasks SET state = ?, worker = NULL WHERE state = ? AND '
+                                               'lease_expires < ?', (PENDING, LEASED, now)).rowcount
+
+        return failed + requeued
+
+    def claim(self, worker):
+        """
+        Lease the next pending track to a worker, after putting the tracks whose lease expired back in the queue.
+
+        Parameters:
+            worker (str): The identifier of the worker (see worker_id).
+
+        Returns:
+            tuple: The path to the audio file and the features to compute for it, or None if nothing is claimable.
+        """
+        self.expire()
+        now = time.time()
+
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('INSERT OR REPLACE INTO workers VALUES (?, ?)', (worker, now))
+            row = self.connection.execute('SELECT track, features FROM tasks WHERE state = ? ORDER BY attempts, rowid '
+                                          'LIMIT 1', (PENDING,)).fetchone()
+            if row is None:
+                return None
+
+            track, features = row
+            self.connection.execute('UPDATE tasks SET state = ?, worker = ?, lease_expires = ?, '
+                                    'attempts = attempts + 1 WHERE track = ?',
+                                    (LEASED, worker, now + self.lease_seconds, track))
+
+        features = json.loads(features)
+        return track, None if features is None else set(features)
+
+    def heartbeat(self, worker):
+        """
+        Renew the leases of every track a worker holds, and record that the worker is alive.
+
+        Parameters:
+            worker (str): The identifier of the worker.
+
+        Returns:
+            int: The number of leases renewed.
+        """
+        now = time.time()
+
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('INSERT OR REPLACE INTO workers VALUES (?, ?)', (worker, now))
+            cursor = self.connection.execute('UPDATE tasks SET lease_expires = ? WHERE state = ? AND worker = ?',
+                                             (now + self.lease_seconds, LEASED, worker))
+
+        return cursor.rowcount
+
+    def complete(self, tracks):
+        """
+        Mark tracks as done, once their results are safely stored.
+
+        A track completed by a worker whose lease had expired in the meantime is done all the same; the other
+        worker's results for it simply update the same features again.
+
+        Parameters:
+            tracks (iterable): The paths to the audio files.
+
+        Returns:
+            None
+        """
+        tracks = list(tracks)
+        if not tracks:
+            return
+
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany('UPDATE tasks SET state = ?, worker = NULL WHERE track = ?',
+                                        [(DONE, track) for track in tracks])
+
+    def counts(self):
+        """
+        Count the tracks in every state.
+
+        Returns:
+            dict: A dictionary mapping PENDING, LEASED, DONE and FAILED to their number of tracks.
+        """
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        counts.update(self.connection.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+
+        return counts
+
+    def leased_by_others(self, worker):
+        """
+        Count the tracks other workers hold, which this worker may have to reclaim if their leases expire.
+
+        Parameters:
+            worker (str): The identifier of the worker.
+
+        Returns:
+            int: The number of tracks leased to other workers.
+        """
+        return self.connection.execute('SELECT COUNT(*) FROM tasks WHERE state = ? AND worker != ?',
+                                       (LEASED, worker)).fetchone()[0]
+
+    def stranded(self):
+        """
+        List the tracks left pending after every worker stopped: some lease expired, no track is leased and no
+        worker has claimed or heartbeated for a lease period.
+
+        Returns:
+            list: The paths to the pending audio files, or an empty list while a worker may still claim them.
+        """
+        counts = self.counts()
+        expired = self.connection.execute('SELECT COUNT(*) FROM tasks WHERE state = ? AND attempts > 0',
+                                          (PENDING,)).fetchone()[0]
+        last_seen = self.connection.execute('SELECT MAX(last_seen) FROM workers').fetchone()[0]
+        if counts[LEASED] or not expired or (last_seen is not None and last_seen > time.time() - self.lease_seconds):
+            return []
+
+        return [track for track, in self.connection.execute('SELECT track FROM tasks WHERE state = ? ORDER BY rowid',
+                                                            (PENDING,))]
+
+    def failed(self):
+        """
+        List the tracks that were given up after MAX_ATTEMPTS expired leases.
+
+        Returns:
+            list: The paths to the audio files.
+        """
+        return [track for track, in self.connection.execute('SELECT track FROM tasks WHERE state = ?', (FAILED,))]
+
+    def close(self):
+        """
+        Close the connection to the queue database.
+
+        Returns:
+            None
+        """
+        self.connection.close()
+
+
+class Heartbeat:
+    """
+    Background thread renewing the leases of a worker every `interval` seconds, for as long as it is entered.
+    """
+
+    def __init__(self, queue_path, worker, lease_seconds=LEASE_SECONDS, interval=HEARTBEAT_SECONDS):
+        self.queue_path = queue_path
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        # SQLite connections cannot be shared between threads, so the heartbeat has its own
+        queue = WorkQueue(self.queue_path, self.lease_seconds)
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    queue.heartbeat(self.worker)
+                except sqlite3.Error as e:
+                    print(f"Error in Heartbeat: {e}")
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def worker_id():
+    """
+    Get an identifier of this worker process that is unique across hosts.
+
+    Returns:
+        str: The host name and process ID.
+    """
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def claimed_tasks(queue, worker):
+    """
+    Claim tracks from the queue one at a time until none is left to claim.
+
+    Parameters:
+        queue (WorkQueue): The shared queue.
+        worker (str): The identifier of the worker.
+
+    Yields:
+        tuple: The path to an audio file and the features to compute for it.
+    """
+    while True:
+        task = queue.claim(worker)
+        if task is None:
+            return
+        yield task